@@ -1,105 +1,386 @@
+import functools
+import mimetypes
 import os
-from flask import Flask, render_template, abort, url_for, send_file
+import time
+from urllib.parse import quote as url_quote
+
+from flask import Flask, Response, render_template, abort, jsonify, redirect, request, url_for, send_file, send_from_directory
+from markupsafe import Markup, escape
+from werkzeug.security import safe_join
+
+import asset_manifest
+from asset_manifest import AssetManifest
+from catalog import Catalog
+from responsive_images import ImageVariants
+from czi_utils import CHANNEL_COLORS, CHANNEL_THRESHOLDS
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 
+# Content-hashed asset URLs (/assets/<digest>/<path>) from static/.asset_manifest.json,
+# built by asset_manifest.py / batch_preprocess.py; cached by browsers for a year
+ASSETS = AssetManifest(os.path.join(app.static_folder, '.asset_manifest.json'))
+ASSET_MAX_AGE = 365 * 24 * 3600
+# Deep Zoom tiles keep their (unfingerprinted) URLs, so they are cached for a day and revalidated
+TILES_MAX_AGE = 24 * 3600
+
+# Width-stepped copies of the card images (static/.image_variants.json, built by
+# responsive_images.py / batch_preprocess.py), offered through responsive_img()
+VARIANTS = ImageVariants(os.path.join(app.static_folder, '.image_variants.json'))
+
+# Origin of the images and videos the pages show (media_url(), Media.url() in JS): unset,
+# this app serves them from static/ (fingerprinted under /assets/); else a base URL that
+# mirrors static/, e.g. a CDN origin or
+# https://media.githubusercontent.com/media/michaeff/Bleo-website/refs/heads/main/static/
+app.config['MEDIA_URL'] = os.environ.get('MEDIA_URL', '')
+
+# Weeks, sections (Z range, channels, missing slices, size) and downloads on disk, scanned
+# once and rescanned when a dataset folder changes; routes and viewers look things up here
+CATALOG = Catalog(app.static_folder)
+CATALOG_MAX_AGE = 60
+
+# Format of the rendered Z-slices (see czi_utils.ENCODERS / batch_preprocess.py --format)
+app.config['SLICE_FORMAT'] = os.environ.get('SLICE_FORMAT', 'png')
+
+# How the flat channels were built (see czi_utils.SLICE_MODE / batch_preprocess.py --gray):
+# 'gray' channels are tinted and thresholded in the browser (tile_viewer.js)
+app.config['SLICE_MODE'] = os.environ.get('SLICE_MODE', 'tinted')
+
+# Render detailed slices on demand from the raw CZIs (/slice/...) instead of the
+# pre-rendered files; every CZI's subblock index is built once at startup
+app.config['LIVE_SLICES'] = os.environ.get('LIVE_SLICES') == '1'
+app.config['SLICE_CACHE_MB'] = int(os.environ.get('SLICE_CACHE_MB', '256'))
+
+SLICES = None
+if app.config['LIVE_SLICES']:
+    from slice_server import SliceServer
+    SLICES = SliceServer(os.path.join(app.static_folder, 'czi_images_detailed'),
+                         app.config['SLICE_CACHE_MB'] << 20,
+                         fmt=app.config['SLICE_FORMAT'], preset='fast',
+                         ranges_root=os.path.join(app.static_folder, 'processed_detailed'))
+    for error in SLICES.errors.values():
+        app.logger.warning("Live slices unavailable for %s", error)
+
+# One server-side composite per slider step instead of an <img> per channel;
+# composites come from the live CZIs when LIVE_SLICES is on, else from processed_detailed
+app.config['COMPOSITE_SLICES'] = os.environ.get('COMPOSITE_SLICES') == '1'
+COMPOSITES = None
+if app.config['COMPOSITE_SLICES']:
+    from slice_server import Compositor, SliceFiles
+    COMPOSITES = Compositor(SLICES or SliceFiles(os.path.join(app.static_folder, 'processed_detailed'),
+                                                 app.config['SLICE_CACHE_MB'] << 20,
+                                                 os.path.join(app.static_folder, 'vessel_processed_detailed')),
+                            app.config['SLICE_CACHE_MB'] << 20,
+                            fmt=app.config['SLICE_FORMAT'], preset='fast')
+
+# Tint and default threshold per channel, applied in the browser to the grayscale slices
+CHANNELS = {ch: {'color': CHANNEL_COLORS[ch], 'threshold': CHANNEL_THRESHOLDS.get(ch, 0.0)}
+            for ch in CHANNEL_COLORS}
+
+@app.context_processor
+def inject_slice_ext():
+    # Exposed to the viewers as window.SLICE_EXT so they never hardcode ".png"
+    return {'slice_ext': '.' + app.config['SLICE_FORMAT'],
+            'live_slices': app.config['LIVE_SLICES'],
+            'composite_slices': app.config['COMPOSITE_SLICES'],
+            'media_base': app.config['MEDIA_URL'],
+            'slice_mode': app.config['SLICE_MODE'],
+            'channels': CHANNELS}
+
+# Large CZI/TIF downloads: 'x-accel' hands the transfer to nginx (X-Accel-Redirect to
+# DOWNLOAD_ACCEL_PREFIX, an `internal` location aliased to static/), 'x-sendfile' to
+# Apache/lighttpd (X-Sendfile); unset, Flask streams the file itself with Range support
+app.config['DOWNLOAD_OFFLOAD'] = os.environ.get('DOWNLOAD_OFFLOAD', '')
+app.config['DOWNLOAD_ACCEL_PREFIX'] = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/protected-static/')
+DOWNLOAD_MAX_AGE = 3600
+
+def send_download(download_name):
+    # Conditional GET plus Range/If-Range so interrupted downloads resume where they stopped
+    rel = CATALOG.download_path(download_name)
+    if rel is None:
+        abort(404)
+    path = os.path.join(app.static_folder, rel)
+    offload = app.config['DOWNLOAD_OFFLOAD']
+    if not offload:
+        return send_file(path, as_attachment=True, download_name=download_name,
+                         conditional=True, etag=True, max_age=DOWNLOAD_MAX_AGE)
+
+    resp = Response(mimetype='application/octet-stream')
+    if offload == 'x-accel':
+        resp.headers['X-Accel-Redirect'] = url_quote(app.config['DOWNLOAD_ACCEL_PREFIX'] + rel)
+    elif offload == 'x-sendfile':
+        resp.headers['X-Sendfile'] = os.path.abspath(path)
+    else:
+        raise ValueError(f"Unknown DOWNLOAD_OFFLOAD {offload!r}")
+    resp.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    resp.cache_control.max_age = DOWNLOAD_MAX_AGE
+    return resp
+
+# Dynamic responses (rendered pages, JSON) compressed per Accept-Encoding; results
+# are cached by body, so an unchanged page is compressed once per encoding
+COMPRESS_MIMETYPES = ('text/html', 'application/json')
+
+def negotiated_encoding():
+    return next((enc for enc in asset_manifest.available_encodings() if request.accept_encodings[enc]), None)
+
+def send_static(directory, filename, etag=True, **kwargs):
+    # send_from_directory() that prefers the precompressed .br/.gz sibling (asset_manifest.precompress)
+    path = safe_join(directory, filename)
+    encoding = negotiated_encoding() if path and filename.lower().endswith(asset_manifest.COMPRESS_EXTS) else None
+    sibling = encoding and asset_manifest.compressed_sibling(path, encoding)
+    if not sibling:
+        resp = send_from_directory(directory, filename, etag=etag, **kwargs)
+    else:
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        if isinstance(etag, str):
+            etag = f'{etag}-{encoding}'
+        resp = send_from_directory(directory, filename + asset_manifest.ENCODINGS[encoding],
+                                   mimetype=mimetype, etag=etag, **kwargs)
+        resp.headers['Content-Encoding'] = encoding
+    if path and filename.lower().endswith(asset_manifest.COMPRESS_EXTS):
+        resp.vary.add('Accept-Encoding')
+    return resp
+
+def static_file(filename):
+    return send_static(app.static_folder, filename, max_age=app.get_send_file_max_age(filename))
+
+app.view_functions['static'] = static_file
+
+@functools.lru_cache(maxsize=128)
+def compressed_body(body: bytes, encoding: str) -> bytes:
+    return asset_manifest.compress(body, encoding, level=6 if encoding == 'gzip' else 9)
+
+@app.after_request
+def compress_response(resp):
+    if (resp.mimetype not in COMPRESS_MIMETYPES or resp.status_code != 200
+            or resp.direct_passthrough or resp.is_streamed or 'Content-Encoding' in resp.headers):
+        return resp
+    resp.vary.add('Accept-Encoding')
+    encoding = negotiated_encoding()
+    if encoding is None or resp.content_length < asset_manifest.COMPRESS_MIN_SIZE:
+        return resp
+    resp.set_data(compressed_body(resp.get_data(), encoding))
+    resp.headers['Content-Encoding'] = encoding
+    # Same content, different bytes: only a weak validator still holds
+    tag, _ = resp.get_etag()
+    if tag:
+        resp.set_etag(tag, weak=True)
+    return resp
+
+@app.template_global()
+def asset_url(endpoint, **values):
+    # url_for() that points static files at their fingerprinted /assets/ URL when the manifest has them
+    if endpoint == 'static':
+        ASSETS.refresh()
+        digest = ASSETS.digest(values.get('filename', ''))
+        if digest:
+            values['digest'] = digest
+            return url_for('asset', **values)
+    return url_for(endpoint, **values)
+
+@app.template_global()
+def media_url(filename):
+    # URL of static/<filename> at the MEDIA_URL origin, or served here when it is unset
+    base = app.config['MEDIA_URL']
+    if base:
+        return base + url_quote(filename)
+    return asset_url('static', filename=filename)
+
+@app.template_global()
+def responsive_img(filename, sizes='100vw', lazy=False):
+    # src, srcset and sizes attributes for static/<filename>: its width variants and the
+    # original, so the browser fetches the narrowest one that fills the displayed width.
+    # Without variants (not built, or the image is a git-lfs pointer here) it is just the
+    # src. lazy=True writes data-src/data-srcset/data-sizes for images loaded on demand.
+    VARIANTS.refresh()
+    prefix = 'data-' if lazy else ''
+    candidates = VARIANTS.srcset(filename)
+    attrs = {prefix + 'src': media_url(filename)}
+    if candidates:
+        attrs[prefix + 'srcset'] = ', '.join(f"{media_url(rel)} {width}w" for rel, width in candidates)
+        attrs[prefix + 'sizes'] = sizes
+    return Markup(' '.join(f'{name}="{escape(value)}"' for name, value in attrs.items()))
+
+@app.route('/assets/<digest>/<path:filename>')
+def asset(digest, filename):
+    ASSETS.refresh()
+    current = ASSETS.digest(filename)
+    if current is None:
+        abort(404)
+    if digest != current:
+        # Stale fingerprint: point at the current content instead of caching it under the old URL
+        return redirect(url_for('asset', digest=current, filename=filename))
+    fresh = ASSETS.matches(filename, os.path.join(app.static_folder, filename))
+    resp = send_static(app.static_folder, filename, etag=current if fresh else True,
+                       max_age=ASSET_MAX_AGE if fresh else 0)
+    if fresh:
+        resp.cache_control.public = True
+        resp.cache_control.immutable = True
+    return resp
+
+@app.route('/assets/manifest.json')
+def asset_digests():
+    # Path -> digest for the viewers that build asset URLs in JS (?prefix=processed_detailed/week1/)
+    ASSETS.refresh()
+    resp = jsonify(ASSETS.digests(request.args.get('prefix', '')))
+    resp.cache_control.no_cache = True
+    resp.add_etag()
+    return resp.make_conditional(request)
+
+@app.route('/api/catalog')
+def api_catalog():
+    # The catalog as JSON; its version is the ETag, so revalidating costs a 304
+    CATALOG.refresh()
+    resp = jsonify(version=CATALOG.version, **CATALOG.data)
+    resp.cache_control.public = True
+    resp.cache_control.max_age = CATALOG_MAX_AGE
+    resp.set_etag(CATALOG.version)
+    return resp.make_conditional(request)
+
+# Rendered pages depend only on their URL arguments, the render config, the templates
+# and the dataset on disk, so each is rendered once until one of those changes
+PAGE_CACHE = {}
+
+# Template and manifest mtimes are checked on every request in debug, else at most every
+# PAGE_CHECK_INTERVAL seconds; the config switches the templates read are part of the key
+PAGE_CHECK_INTERVAL = 2.0
+PAGE_CONFIG = ('SLICE_FORMAT', 'SLICE_MODE', 'LIVE_SLICES', 'COMPOSITE_SLICES', 'MEDIA_URL')
+_page_stamps = [float('-inf'), ()]   # when checked, mtimes
+
+def page_version():
+    # mtimes of the templates, the asset and variant manifests, and the catalog version (a week added or removed)
+    now = time.monotonic()
+    if app.debug or now - _page_stamps[0] >= PAGE_CHECK_INTERVAL:
+        template_dir = os.path.join(app.root_path, app.template_folder)
+        paths = [entry.path for entry in os.scandir(template_dir)] + [ASSETS.path, VARIANTS.path]
+        version = []
+        for path in sorted(paths):
+            try:
+                version.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                version.append(None)
+        _page_stamps[:] = [now, tuple(version)]
+    CATALOG.refresh()
+    return (*_page_stamps[1], CATALOG.version)
+
+def cached_page(view):
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+        config = tuple(app.config[k] for k in PAGE_CONFIG)
+        key = (view.__name__, tuple(sorted(kwargs.items())), config)
+        version = page_version()
+        hit = PAGE_CACHE.get(key)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+        body = view(**kwargs)
+        PAGE_CACHE[key] = (version, body)
+        return body
+    return wrapper
+
 @app.route('/')
+@cached_page
 def index():
     return render_template('index.html')
 
 @app.route('/overview')
+@cached_page
 def overview():
     return render_template('overview.html')
 
 @app.route('/tilescans')
+@cached_page
 def tilescans():
     return render_template('tilescans.html')
 
+@app.route('/tiles/<path:filename>')
+def tiles(filename):
+    # Deep Zoom pyramids (<name>.dzi + <name>_files/) written by batch_preprocess.py --tiles,
+    # served like static/processed/tiles/: precompressed .dzi, and the asset digest as ETag
+    # so a tile revalidates to a 304 until its content changes
+    rel = f'processed/tiles/{filename}'
+    ASSETS.refresh()
+    digest = ASSETS.digest(rel)
+    fresh = digest is not None and ASSETS.matches(rel, os.path.join(app.static_folder, rel))
+    resp = send_static(os.path.join(app.static_folder, 'processed', 'tiles'), filename,
+                       etag=digest if fresh else True, max_age=TILES_MAX_AGE)
+    resp.cache_control.public = True
+    return resp
+
+@app.route('/stack/week<int:week>/<section>/ch<int:chan>.<any(bundle, json):kind>')
+def slice_bundle(week, section, chan, kind):
+    # Packed Z-stack of one section/channel and its offset index (batch_preprocess.py --bundle).
+    # send_from_directory answers Range requests, so viewers fetch one or a run of slices per request.
+    if section == f'week{week}':
+        path = f'week{week}/week{week}_ch{chan}.{kind}'
+    else:
+        path = f'week{week}/{section}/week{week}_{section}_ch{chan}.{kind}'
+    return send_from_directory(os.path.join(app.static_folder, 'processed_detailed'), path, max_age=3600)
+
+@app.route('/slice/week<int:week>/<section>/z<int:z>/ch<int:chan>')
+def live_slice(week, section, z, chan):
+    # One slice rendered from the source CZI (LIVE_SLICES=1), cached in memory
+    data = SLICES.render(week, section, z, chan) if SLICES else None
+    if data is None:
+        abort(404)
+    resp = Response(data, mimetype=f"image/{app.config['SLICE_FORMAT']}")
+    resp.cache_control.public = True
+    resp.cache_control.max_age = 3600
+    resp.add_etag()
+    return resp.make_conditional(request)
+
+@app.route('/composite/week<int:week>/<section>/z<int:z>')
+def composite_slice(week, section, z):
+    # Checked channels (?ch=1,2,4) thresholded, tinted and screen-blended into one image, cached
+    # per channel set; ?t=0.02,0.1,0.05 overrides their thresholds [0-1] (default CHANNEL_THRESHOLDS)
+    try:
+        chans = [int(c) for c in request.args.get('ch', '1,2,3,4').split(',') if c]
+        levels = [float(t) for t in request.args.get('t', '').split(',') if t]
+    except ValueError:
+        abort(400)
+    if not chans or not set(chans) <= {1, 2, 3, 4}:
+        abort(400)
+    if levels and (len(levels) != len(chans) or not all(0.0 <= t < 1.0 for t in levels)):
+        abort(400)
+    thresholds = dict(zip(chans, levels))
+    data = COMPOSITES.render(week, section, z, chans, thresholds) if COMPOSITES else None
+    if data is None:
+        abort(404)
+    resp = Response(data, mimetype=f"image/{app.config['SLICE_FORMAT']}")
+    resp.cache_control.public = True
+    resp.cache_control.max_age = 3600
+    resp.add_etag()
+    return resp.make_conditional(request)
+
 @app.route('/week/<int:week>')
+@cached_page
 def week_detail(week):
-    # Check if the week exists by looking for the 3d_images folder
-    base = os.path.join(app.static_folder, '3d_images', f'week{week}')
-    if not os.path.isdir(base):
+    # Weeks with a 3d_images folder have a page
+    entry = CATALOG.week(week)
+    if not entry or not entry['page']:
         abort(404)
     
     return render_template('week_detail.html', week=week)
 
 @app.route('/download/week<int:week>')
 def download_week(week):
-    # Path to the CZI file
-    czi_path = os.path.join(app.static_folder, 'czi_images', f'week{week}.czi')
-    
-    # Check if file exists
-    if not os.path.isfile(czi_path):
-        abort(404)
-    
-    # Send the file as download
-    return send_file(czi_path, as_attachment=True, download_name=f'week{week}.czi')
+    return send_download(f'week{week}.czi')
 
 @app.route('/download/weektif<int:week>')
 def download_weektif(week):
-    # Path to the CZI file
-    czi_path = os.path.join(app.static_folder, 'czi_images', f'week{week}.tif')
-    
-    # Check if file exists
-    if not os.path.isfile(czi_path):
-        abort(404)
-    
-    # Send the file as download
-    return send_file(czi_path, as_attachment=True, download_name=f'week{week}.tif')
+    return send_download(f'week{week}.tif')
+
+def detail_download_name(week, ext):
+    # <week><section code>, e.g. 1kmc2 or 3HV; week 0 has a single detailed file.
+    # The /download/main/ aliases pass an int week
+    week = str(week)
+    return f'detailweek0.{ext}' if week.startswith('0') else f'detailweek{week}.{ext}'
 
 @app.route('/download/detailweek<string:week>')
 def download_detailweek(week):
-    # Path to the CZI file
-    week0= week[0]
-    if week0 == '0':
-        czi_path = os.path.join(app.static_folder, 'czi_images_detailed',f'week{week0}', f'week{week0}.czi')
-        # Check if file exists
-        print(czi_path)
-        if not os.path.isfile(czi_path):
-            abort(404)
-        
-        # Send the file as download
-        return send_file(czi_path, as_attachment=True, download_name=f'detailweek{week0}.czi')
-    else:
-        weekrest= week[1:]
-
-        czi_path = os.path.join(app.static_folder, 'czi_images_detailed',f'week{week0}',weekrest, f'week{week0}_{weekrest}.czi')
-        # Check if file exists
-        print(czi_path)
-        if not os.path.isfile(czi_path):
-            abort(404)
-        
-        # Send the file as download
-        return send_file(czi_path, as_attachment=True, download_name=f'detailweek{week}.czi')
+    return send_download(detail_download_name(week, 'czi'))
 
 @app.route('/download/detailweektif<string:week>')
 def download_detailweektif(week):
-    # Path to the CZI file
-    week0= week[0]
-    print(week)
-    if week0 == 0:
-        czi_path = os.path.join(app.static_folder, 'czi_images_detailed',f'week{week0}' f'week{week0}.tif')
-        # Check if file exists
-        print(czi_path)
-        if not os.path.isfile(czi_path):
-            abort(404)
-        
-        # Send the file as download
-        return send_file(czi_path, as_attachment=True, download_name=f'detailweek{week0}.tif')
-    else:
-        weekrest= week[1:]
-
-        czi_path = os.path.join(app.static_folder, 'czi_images_detailed',f'week{week0}',weekrest, f'week{week0}_{weekrest}.tif')
-        print(czi_path)
-        # Check if file exists
-        if not os.path.isfile(czi_path):
-            abort(404)
-        
-        # Send the file as download
-        return send_file(czi_path, as_attachment=True, download_name=f'detailweek{week}.tif')
-        
-    
+    return send_download(detail_download_name(week, 'tif'))
 
 @app.route('/download/main/week<int:week>')
 def download_main_detailweek(week):
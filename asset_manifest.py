@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Content fingerprints for everything under static/, used by app.py to serve
+assets at /assets/<digest>/<path> with immutable, year-long cache headers.
+
+The manifest (static/.asset_manifest.json) maps each path relative to
+static/ to the SHA-256 of its content; files whose size and mtime are
+unchanged keep their recorded hash, so rebuilding after a batch run only
+hashes what changed. batch_preprocess.py rebuilds it after every run.
+
+Text assets (CSS, JS, ...) also get precompressed .gz and, with the brotli
+package installed, .br siblings, which app.py serves by Accept-Encoding. A
+sibling carries its source's mtime and is rewritten when that changes.
+
+    python asset_manifest.py
+"""
+
+import gzip
+import json
+import os
+import sys
+import time
+
+try:
+    import brotli
+except ImportError:   # gzip only
+    brotli = None
+
+from build_manifest import file_sha256
+
+STATIC          = 'static'
+ASSET_MANIFEST  = os.path.join(STATIC, '.asset_manifest.json')
+ASSET_VERSION   = 1
+
+# Characters of the SHA-256 used in URLs
+DIGEST_LENGTH = 16
+
+# Raw microscopy files are only served as downloads, never fingerprinted;
+# .gz/.br are the precompressed siblings
+EXCLUDE_EXTS = ('.czi', '.tif', '.tiff', '.gz', '.br')
+
+# Assets worth precompressing (images and video are compressed already),
+# and the Content-Encoding -> sibling suffix, in order of preference
+COMPRESS_EXTS = ('.css', '.js', '.json', '.svg', '.html', '.dzi', '.txt')
+COMPRESS_MIN_SIZE = 1024
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+# Seconds between checks of the manifest's mtime by refresh()
+CHECK_INTERVAL = 2.0
+
+def available_encodings() -> list[str]:
+    return [enc for enc in ENCODINGS if enc != 'br' or brotli is not None]
+
+def compress(data: bytes, encoding: str, level: int = None) -> bytes:
+    """``data`` encoded as ``encoding`` ('br' or 'gzip'); highest ratio unless ``level`` is given."""
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=level or 9, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(data, quality=level or 11)
+    raise ValueError(f"Unsupported encoding {encoding!r}")
+
+def compressed_sibling(path: str, encoding: str):
+    """Path of the up-to-date precompressed ``encoding`` variant of ``path``, or None."""
+    sibling = path + ENCODINGS[encoding]
+    try:
+        return sibling if os.stat(sibling).st_mtime_ns == os.stat(path).st_mtime_ns else None
+    except OSError:
+        return None
+
+def walk_assets(static_dir: str):
+    """Yield paths relative to ``static_dir`` ('/'-separated), skipping hidden files and directories."""
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if name.startswith('.') or name.lower().endswith(EXCLUDE_EXTS):
+                continue
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, static_dir).replace(os.sep, '/'), path
+
+def build(static_dir: str = STATIC, manifest_path: str = ASSET_MANIFEST, reuse: str = None) -> dict:
+    """Rebuild the manifest for ``static_dir``; returns counts of hashed, reused and removed entries.
+
+    Unchanged files keep their hash from ``reuse`` (default: ``manifest_path`` itself).
+    """
+    old = AssetManifest(reuse or manifest_path).entries
+    entries, stats = {}, {'hashed': 0, 'reused': 0, 'removed': 0}
+    for rel, path in walk_assets(static_dir):
+        st = os.stat(path)
+        entry = old.get(rel)
+        if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+            stats['reused'] += 1
+        else:
+            entry = {'sha256': file_sha256(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+            stats['hashed'] += 1
+        entries[rel] = entry
+    stats['removed'] = len(set(old) - set(entries))
+
+    tmp = manifest_path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump({'version': ASSET_VERSION, 'assets': entries}, fh, indent=1, sort_keys=True)
+    os.replace(tmp, manifest_path)
+    return stats
+
+def precompress(static_dir: str = STATIC) -> dict:
+    """Write missing or outdated .gz/.br siblings of the text assets; returns counts."""
+    stats = {'written': 0, 'current': 0}
+    for _, path in walk_assets(static_dir):
+        if not path.lower().endswith(COMPRESS_EXTS) or os.path.getsize(path) < COMPRESS_MIN_SIZE:
+            continue
+        st = os.stat(path)
+        data = None
+        for encoding in available_encodings():
+            if compressed_sibling(path, encoding):
+                stats['current'] += 1
+                continue
+            if data is None:
+                with open(path, 'rb') as fh:
+                    data = fh.read()
+            sibling = path + ENCODINGS[encoding]
+            tmp = sibling + '.tmp'
+            with open(tmp, 'wb') as fh:
+                fh.write(compress(data, encoding))
+            os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+            os.replace(tmp, sibling)
+            stats['written'] += 1
+    return stats
+
+class AssetManifest:
+    """Read side of the asset manifest, reloaded when the file changes on disk."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        self._stamp = None   # (path, mtime_ns) of what entries were read from
+        self._checked = 0.0
+        self.reload()
+
+    def refresh(self):
+        """reload(), checked at most every CHECK_INTERVAL seconds; for callers on every request or URL."""
+        if time.monotonic() - self._checked >= CHECK_INTERVAL:
+            self.reload()
+
+    def reload(self):
+        self._checked = time.monotonic()
+        try:
+            stamp = (self.path, os.stat(self.path).st_mtime_ns)
+        except OSError:
+            self.entries, self._stamp = {}, None
+            return
+        if stamp == self._stamp:
+            return
+        with open(self.path, encoding='utf-8') as fh:
+            data = json.load(fh)
+        self.entries = data.get('assets', {}) if data.get('version') == ASSET_VERSION else {}
+        self._stamp = stamp
+
+    def digest(self, filename: str):
+        """URL digest of ``filename`` (relative to static/), or None if it is not in the manifest."""
+        entry = self.entries.get(filename)
+        return entry['sha256'][:DIGEST_LENGTH] if entry else None
+
+    def matches(self, filename: str, path: str) -> bool:
+        """True if ``path`` on disk still has the size and mtime recorded for ``filename``."""
+        entry = self.entries.get(filename)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return bool(entry) and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns
+
+    def digests(self, prefix: str = '') -> dict:
+        """Path -> URL digest for every asset under ``prefix``."""
+        return {rel: entry['sha256'][:DIGEST_LENGTH]
+                for rel, entry in self.entries.items() if rel.startswith(prefix)}
+
+def main():
+    stats = build()
+    print(f"{ASSET_MANIFEST}: {stats['hashed']} hashed, {stats['reused']} unchanged, "
+          f"{stats['removed']} removed")
+    stats = precompress()
+    print(f"Precompressed ({', '.join(available_encodings())}): {stats['written']} written, "
+          f"{stats['current']} up to date")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
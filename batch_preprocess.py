@@ -1,6 +1,12 @@
 #!/usr/bin/env python3
+import argparse
+import math
 import os
 import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
 
 # 1) Import your utils module
 try:
@@ -9,6 +15,10 @@ except ImportError:
     print("ERROR: Could not import czi_utils.py")
     sys.exit(1)
 
+import asset_manifest
+import responsive_images
+from build_manifest import BuildManifest, processing_params
+
 # 2) Grab the two functions we need
 flat_fn = getattr(czi_utils, 'process_czi_file', None) or getattr(czi_utils, 'process_czi', None)
 detailed_fn = getattr(czi_utils, 'process_detailed_czi', None)
@@ -25,28 +35,24 @@ MAIN_IN   = os.path.join('static','czi_images')
 MAIN_OUT  = os.path.join('static','processed')
 DET_IN    = os.path.join('static','czi_images_detailed')
 DET_OUT   = os.path.join('static','processed_detailed')
+MANIFEST  = os.path.join('static','.build_manifest.json')
+
+# Plane chunks handed to each worker per file and job; more chunks balance
+# uneven stacks better, fewer re-read the subblock directory less often.
+CHUNKS_PER_JOB = 4
 
 def ensure(path):
     os.makedirs(path, exist_ok=True)
     return path
 
-def batch_flat():
-    """Process all single-slice CZIs under static/czi_images/"""
-    ensure(MAIN_OUT)
+def flat_inputs():
+    """Yield (fn, src) for every single-slice CZI under static/czi_images/"""
     for fn in sorted(os.listdir(MAIN_IN)):
         if fn.lower().endswith('.czi'):
-            src = os.path.join(MAIN_IN, fn)
-            print(f"[Flat] → {src}")
-            try:
-                flat_fn(src, MAIN_OUT)
-            except Exception as e:
-                print(f"  [ERROR] {fn}: {e}")
-
-def batch_detailed():
-    """Process all multi-Z CZIs under static/czi_images_detailed/week*/kmc*/"""
-    if not detailed_fn:
-        return
+            yield fn, os.path.join(MAIN_IN, fn)
 
+def detailed_inputs():
+    """Yield (fn, src, out_dir) for every multi-Z CZI under static/czi_images_detailed/week*/kmc*/"""
     for week in sorted(os.listdir(DET_IN)):
         week_in = os.path.join(DET_IN, week)
         if not os.path.isdir(week_in):
@@ -57,18 +63,279 @@ def batch_detailed():
             if not os.path.isdir(kmc_in):
                 continue
 
-            out_dir = ensure(os.path.join(DET_OUT, week, kmc))
+            out_dir = os.path.join(DET_OUT, week, kmc)
             for fn in sorted(os.listdir(kmc_in)):
                 if fn.lower().endswith('.czi'):
-                    src = os.path.join(kmc_in, fn)
-                    print(f"[Detail] → {src}")
+                    yield fn, os.path.join(kmc_in, fn), out_dir
+
+def stale_digest(build, kind, src):
+    """Return the hash of ``src`` if it needs rebuilding, else None (and count it skipped)."""
+    manifest, params, force, summary = build['manifest'], build['params'], build['force'], build['summary']
+    digest = manifest.digest(src)
+    if not force and manifest.is_fresh(src, kind, digest, params):
+        print(f"[{kind.capitalize()}] up to date: {src}")
+        summary['skipped'] += 1
+        return None
+    return digest
+
+def stack_ranges(src):
+    """Stack-wide value ranges of ``src`` (one decoding pass), or None without stack normalization."""
+    if getattr(czi_utils, 'STACK_NORMALIZATION', 'plane') != 'stack':
+        return None
+    with czi_utils.CziPlaneReader(src) as reader:
+        return czi_utils.stack_value_ranges(reader, channel_axis=1)
+
+def pack_stack(out_dir, slices, src=None, value_ranges=None):
+    """Record the crops of a rendered stack, then replace its slices by per-channel bundles
+    (--bundle) or deduplicated objects. ``slices`` is what process_detailed_czi returned.
+
+    With ``value_ranges`` the stack's ranges are kept as ``<stem>.ranges.json``
+    next to the slices, so LIVE_SLICES can load them instead of scanning ``src``.
+    """
+    sidecars, frame = [], None
+    if value_ranges is not None:
+        stem = os.path.splitext(os.path.basename(src))[0]
+        sidecars.append(czi_utils.write_value_ranges(out_dir, stem, value_ranges))
+    if czi_utils.CROP_SLICES and isinstance(slices, dict) and slices:
+        sidecars += czi_utils.write_crops(out_dir, slices)
+        frame = next(iter(slices.values()))['frame']
+    if czi_utils.BUNDLE_SLICES:
+        return czi_utils.bundle_slices(out_dir, slices) + sidecars
+    if czi_utils.DEDUPE_SLICES:
+        return czi_utils.dedupe_slices(out_dir, slices, frame) + sidecars
+    return list(slices) + sidecars
+
+def record_build(build, kind, src, digest, out_dir, names):
+    build['manifest'].record(src, kind, digest, build['params'],
+                             [os.path.join(out_dir, name) for name in names])
+
+def batch_flat(build):
+    """Process all single-slice CZIs under static/czi_images/"""
+    summary = build['summary']
+    ensure(MAIN_OUT)
+    for fn, src in flat_inputs():
+        try:
+            digest = stale_digest(build, 'flat', src)
+            if digest is None:
+                continue
+            print(f"[Flat] → {src}")
+            names = flat_fn(src, MAIN_OUT)
+            record_build(build, 'flat', src, digest, MAIN_OUT, names or ())
+            summary['ok'] += 1
+        except Exception as e:
+            print(f"  [ERROR] {fn}: {e}")
+            summary['failed'].append(fn)
+
+def batch_detailed(build):
+    """Process all multi-Z CZIs under static/czi_images_detailed/week*/kmc*/"""
+    if not detailed_fn:
+        return
+
+    summary = build['summary']
+    for fn, src, out_dir in detailed_inputs():
+        try:
+            digest = stale_digest(build, 'detail', src)
+            if digest is None:
+                continue
+            ensure(out_dir)
+            print(f"[Detail] → {src}")
+            ranges = stack_ranges(src)
+            names = detailed_fn(src, out_dir, value_ranges=ranges) or ()
+            summary['planes'] += len(names)
+            record_build(build, 'detail', src, digest, out_dir, pack_stack(out_dir, names, src, ranges))
+            summary['ok'] += 1
+        except Exception as e:
+            print(f"  [ERROR] {fn}: {e}")
+            summary['failed'].append(fn)
+
+def _init_worker(fmt, preset, tile_size=0, bundle=False, mode='tinted', dedupe=True, crop=True):
+    """Worker initializer: apply the output options chosen on the command line."""
+    czi_utils.OUTPUT_FORMAT, czi_utils.OUTPUT_PRESET = fmt, preset
+    czi_utils.TILE_SIZE, czi_utils.BUNDLE_SLICES = tile_size, bundle
+    czi_utils.SLICE_MODE, czi_utils.DEDUPE_SLICES = mode, dedupe
+    czi_utils.CROP_SLICES = crop
+
+def _detail_chunk(src, out_dir, planes, value_ranges=None):
+    """Worker: render one chunk of (z, c) planes of a detailed CZI."""
+    return detailed_fn(src, out_dir, planes=planes, value_ranges=value_ranges)
+
+def _detail_histograms(src, planes):
+    """Worker: per-channel histograms of one chunk of (z, c) planes."""
+    with czi_utils.CziPlaneReader(src) as reader:
+        return czi_utils.stack_histograms(((index, reader.read(*index)) for index in planes),
+                                          channel_axis=1)
+
+def _plane_chunks(src, jobs):
+    """Split the planes of ``src`` into about CHUNKS_PER_JOB * jobs chunks."""
+    with czi_utils.CziPlaneReader(src) as reader:
+        planes = list(np.ndindex(*reader.shape))
+    size = max(1, math.ceil(len(planes) / (jobs * CHUNKS_PER_JOB)))
+    return [planes[i:i + size] for i in range(0, len(planes), size)]
+
+def batch_parallel(build, jobs):
+    """Fan flat files and detailed Z-plane chunks out over a process pool.
+
+    With stack-wide normalization each detailed stack runs in two waves:
+    chunked histograms (merged here into one range per channel), then the
+    chunked render using those ranges.
+    """
+    summary = build['summary']
+    stack_stats = getattr(czi_utils, 'STACK_NORMALIZATION', 'plane') == 'stack'
+    ensure(MAIN_OUT)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(czi_utils.OUTPUT_FORMAT, czi_utils.OUTPUT_PRESET,
+                                       czi_utils.TILE_SIZE, czi_utils.BUNDLE_SLICES,
+                                       czi_utils.SLICE_MODE, czi_utils.DEDUPE_SLICES,
+                                       czi_utils.CROP_SLICES)) as pool:
+        # future -> (kind, fn), stage; a file is only recorded once all its chunks ran
+        running = {}
+        pending = {}
+        targets = {}
+        chunks_of = {}
+        hists = {}
+        ranges_of = {}
+        outputs = {}
+        errors = {}
+
+        def submit_chunks(key, stage, value_ranges=None):
+            src, _, out_dir = targets[key]
+            pending[key] = len(chunks_of[key])
+            for planes in chunks_of[key]:
+                if stage == 'stats':
+                    future = pool.submit(_detail_histograms, src, planes)
+                else:
+                    future = pool.submit(_detail_chunk, src, out_dir, planes, value_ranges)
+                running[future] = (key, stage)
+
+        for fn, src in flat_inputs():
+            key = ('flat', fn)
+            try:
+                digest = stale_digest(build, 'flat', src)
+            except Exception as e:
+                errors[key] = e
+                continue
+            if digest is None:
+                continue
+            print(f"[Flat] → {src}")
+            running[pool.submit(flat_fn, src, MAIN_OUT)] = (key, 'render')
+            pending[key], targets[key], outputs[key] = 1, (src, digest, MAIN_OUT), []
+
+        if detailed_fn:
+            for fn, src, out_dir in detailed_inputs():
+                key = ('detail', fn)
+                try:
+                    digest = stale_digest(build, 'detail', src)
+                    if digest is None:
+                        continue
+                    chunks_of[key] = _plane_chunks(src, jobs)
+                except Exception as e:
+                    errors[key] = e
+                    continue
+                ensure(out_dir)
+                print(f"[Detail] → {src}")
+                targets[key], outputs[key], hists[key] = (src, digest, out_dir), {}, []
+                submit_chunks(key, 'stats' if stack_stats else 'render')
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, stage = running.pop(future)
+                try:
+                    result = future.result()
+                    if stage == 'stats':
+                        hists[key].append(result)
+                    elif key[0] == 'detail':
+                        outputs[key].update(result or {})   # slice name -> crop placement
+                    else:
+                        outputs[key].extend(result or ())
+                except Exception as e:
+                    errors.setdefault(key, e)
+                pending[key] -= 1
+                if pending[key] or key in errors:
+                    continue
+
+                if stage == 'stats':
+                    ranges_of[key] = czi_utils.histogram_ranges(czi_utils.merge_histograms(*hists.pop(key)))
+                    submit_chunks(key, 'render', ranges_of[key])
+                    continue
+
+                src, digest, out_dir = targets[key]
+                names = outputs[key]
+                if key[0] == 'detail':
+                    summary['planes'] += len(names)
                     try:
-                        detailed_fn(src, out_dir)
+                        names = pack_stack(out_dir, names, src, ranges_of.get(key))
                     except Exception as e:
-                        print(f"  [ERROR] {fn}: {e}")
+                        errors[key] = e
+                        continue
+                record_build(build, key[0], src, digest, out_dir, names)
+                summary['ok'] += 1
+
+    for (kind, fn), e in errors.items():
+        print(f"  [ERROR] {fn}: {e}")
+        summary['failed'].append(fn)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-convert CZI stacks into PNG slices.")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="worker processes; 1 (default) runs serially, 0 uses all cores")
+    parser.add_argument('--force', action='store_true',
+                        help="rebuild every input even if the build manifest says it is up to date")
+    parser.add_argument('--format', choices=sorted(czi_utils.ENCODERS), default=czi_utils.OUTPUT_FORMAT,
+                        help="slice image format (default: %(default)s)")
+    parser.add_argument('--preset', choices=('default', 'fast', 'small'), default=czi_utils.OUTPUT_PRESET,
+                        help="encoder preset: fast to encode or small on disk (default: %(default)s)")
+    parser.add_argument('--tiles', type=int, default=czi_utils.TILE_SIZE, metavar='N',
+                        help="also write N-pixel Deep Zoom tile pyramids of the flat images (0 = off)")
+    parser.add_argument('--bundle', action='store_true', default=czi_utils.BUNDLE_SLICES,
+                        help="pack each detailed stack into one bundle + offset index per channel")
+    parser.add_argument('--gray', action='store_const', const='gray', default=czi_utils.SLICE_MODE, dest='mode',
+                        help="write the flat channels as 8-bit grayscale, tinted by the tilescans viewer (app SLICE_MODE=gray)")
+    parser.add_argument('--no-dedupe', action='store_false', default=czi_utils.DEDUPE_SLICES, dest='dedupe',
+                        help="write every detailed slice as its own file, blank and duplicate ones included")
+    parser.add_argument('--no-crop', action='store_false', default=czi_utils.CROP_SLICES, dest='crop',
+                        help="write detailed slices at full frame instead of cropped to their content")
+    args = parser.parse_args(argv)
+    jobs = args.jobs or os.cpu_count() or 1
+    _init_worker(args.format, args.preset, args.tiles, args.bundle, args.mode, args.dedupe, args.crop)
+
+    summary = {'ok': 0, 'skipped': 0, 'failed': [], 'planes': 0, 'pruned': 0}
+    build = {
+        'manifest': BuildManifest(MANIFEST),
+        'params': processing_params(),
+        'force': args.force,
+        'summary': summary,
+    }
+    start = time.perf_counter()
 
-if __name__ == "__main__":
     print("=== Starting batch preprocessing ===")
-    batch_flat()
-    batch_detailed()
+    try:
+        if jobs > 1:
+            batch_parallel(build, jobs)
+        else:
+            batch_flat(build)
+            batch_detailed(build)
+        removed = build['manifest'].prune()
+        for out in removed:
+            print(f"[Prune] {out}")
+        summary['pruned'] = len(removed)
+    finally:
+        build['manifest'].save()
+    # Width variants for the pages' srcset; only new or changed images are resized
+    variants = responsive_images.build(responsive_images.STATIC, responsive_images.VARIANT_MANIFEST)
+    print(f"[Variants] {variants['built']} built, {variants['removed']} removed")
+    # Fingerprints for the /assets/ URLs; only new or changed files are hashed
+    assets = asset_manifest.build(asset_manifest.STATIC, asset_manifest.ASSET_MANIFEST)
+    print(f"[Assets] {assets['hashed']} hashed, {assets['removed']} removed")
+    asset_manifest.precompress(asset_manifest.STATIC)
     print("=== Batch preprocessing complete ===")
+
+    elapsed = time.perf_counter() - start
+    print(f"Files: {summary['ok']} built, {summary['skipped']} up to date, {len(summary['failed'])} failed | "
+          f"detailed planes: {summary['planes']} | pruned: {summary['pruned']} | jobs: {jobs} | {elapsed:.1f}s")
+    for fn in summary['failed']:
+        print(f"  failed: {fn}")
+    return 1 if summary['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
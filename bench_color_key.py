@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: transform_assets.color_key vs. the getdata()/putdata() loop
+that clear_black.py and the old heatmap/channel scripts used.
+
+Keys black and the heatmap blue (0, 0, 131) on synthetic heatmap-like
+images (or the given PNGs), checks the results are pixel-identical and
+reports best-of-N time per image.
+
+    python bench_color_key.py --size 2048
+    python bench_color_key.py static/heatmaps/*.png --tolerance 0
+"""
+
+import argparse
+import time
+import warnings
+
+import numpy as np
+from PIL import Image
+
+from transform_assets import color_key
+
+KEYS = [(0, 0, 0), (0, 0, 131)]
+
+def legacy_color_key(img: Image.Image, colors, tolerance: int = 0) -> Image.Image:
+    """The original per-pixel loop over getdata(), generalized to several keys and a tolerance."""
+    img = img.convert('RGBA')
+    new_pixels = []
+    for r, g, b, a in img.getdata():
+        if any(abs(r - kr) <= tolerance and abs(g - kg) <= tolerance and abs(b - kb) <= tolerance
+               for kr, kg, kb in colors):
+            new_pixels.append((0, 0, 0, 0))
+        else:
+            new_pixels.append((r, g, b, a))
+    out = img.copy()
+    out.putdata(new_pixels)
+    return out
+
+def synthetic_heatmap(size: int, rng) -> Image.Image:
+    """Heatmap blue background, a black border and a smooth colored blob, with a little noise."""
+    arr = np.zeros((size, size, 3), dtype=np.uint8)
+    arr[...] = (0, 0, 131)
+    yy, xx = np.mgrid[:size, :size] / size
+    blob = np.exp(-((xx - 0.5) ** 2 + (yy - 0.5) ** 2) * 12)
+    inside = blob > 0.2
+    arr[inside, 0] = (blob[inside] * 255).astype(np.uint8)
+    arr[inside, 1] = (blob[inside] * 180).astype(np.uint8)
+    arr[..., 2] = np.clip(arr[..., 2].astype(int) + rng.integers(-2, 3, (size, size)), 0, 255)
+    border = size // 16
+    arr[:border] = arr[-border:] = arr[:, :border] = arr[:, -border:] = 0
+    return Image.fromarray(arr, 'RGB')
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='*', help="PNGs to key (default: synthetic heatmaps)")
+    parser.add_argument('--size', type=int, default=1024, help="edge length of synthetic images")
+    parser.add_argument('--tolerance', type=int, default=2, help="per-component key tolerance")
+    parser.add_argument('--repeat', type=int, default=3, help="timing runs per image (best is reported)")
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore', category=DeprecationWarning)   # getdata() in the legacy loop
+
+    if args.images:
+        images = [(p, Image.open(p).convert('RGBA')) for p in args.images]
+    else:
+        rng = np.random.default_rng(0)
+        images = [(f'synthetic {size}px', synthetic_heatmap(size, rng)) for size in (args.size // 2, args.size)]
+
+    print(f"{'image':32} {'loop ms':>9} {'numpy ms':>9} {'speedup':>8} identical")
+    for name, img in images:
+        old = legacy_color_key(img, KEYS, args.tolerance)
+        new = color_key(img, KEYS, args.tolerance)
+        same = np.array_equal(np.asarray(old), np.asarray(new))
+        # The loop is slow: timed once
+        t_old = best_of(lambda: legacy_color_key(img, KEYS, args.tolerance), 1)
+        t_new = best_of(lambda: color_key(img, KEYS, args.tolerance), args.repeat)
+        print(f"{name[-32:]:32} {t_old * 1e3:>9.1f} {t_new * 1e3:>9.1f} {t_old / t_new:>7.0f}x {same}")
+
+if __name__ == "__main__":
+    main()
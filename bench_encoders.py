@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Encode-time and size report for the slice encoders in czi_utils.ENCODERS.
+
+Encodes sample slices with every format/preset, checks that decoding gives
+back the same RGBA pixels (AVIF reports its max deviation instead) and
+prints encode time and bytes per format.
+
+    python bench_encoders.py                                 # synthetic tinted slices
+    python bench_encoders.py static/processed_detailed/week0/week0_z5*_ch*.png
+"""
+
+import argparse
+import io
+import time
+
+import numpy as np
+from PIL import Image, features
+
+from bench_tint import synthetic_plane
+from czi_utils import ENCODERS, _tint_plane
+
+def sample_slices(paths, size):
+    if paths:
+        return [(p, Image.open(p).convert('RGBA')) for p in paths]
+    rng = np.random.default_rng(0)
+    return [(f'synthetic ch{ch}', _tint_plane(synthetic_plane(size, np.uint16, rng), ch))
+            for ch in (1, 2, 3, 4)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='*', help="slice images to encode (default: synthetic slices)")
+    parser.add_argument('--size', type=int, default=1024, help="edge length of synthetic slices")
+    parser.add_argument('--repeat', type=int, default=3, help="encodes per slice (best is reported)")
+    args = parser.parse_args()
+
+    slices = sample_slices(args.images, args.size)
+    print(f"{len(slices)} slice(s)\n")
+    print(f"{'format':6} {'preset':8} {'encode ms':>10} {'KiB':>10} {'vs png':>7}  pixels")
+
+    baseline = None
+    for fmt, (_, pil_format, presets) in ENCODERS.items():
+        if fmt != 'png' and not features.check(fmt):
+            print(f"{fmt:6} (not supported by this Pillow build)")
+            continue
+        for preset, options in presets.items():
+            total_time, total_bytes, max_diff = 0.0, 0, 0
+            for _, img in slices:
+                best = float('inf')
+                for _ in range(args.repeat):
+                    buf = io.BytesIO()
+                    t = time.perf_counter()
+                    img.save(buf, pil_format, **options)
+                    best = min(best, time.perf_counter() - t)
+                total_time += best
+                total_bytes += buf.tell()
+                buf.seek(0)
+                decoded = np.asarray(Image.open(buf).convert('RGBA'), dtype=np.int16)
+                max_diff = max(max_diff, int(np.abs(decoded - np.asarray(img, dtype=np.int16)).max()))
+
+            if baseline is None:
+                baseline = total_bytes
+            pixels = 'identical' if max_diff == 0 else f'max diff {max_diff}'
+            print(f"{fmt:6} {preset:8} {total_time * 1e3:>10.1f} {total_bytes / 1024:>10.1f} "
+                  f"{total_bytes / baseline:>6.0%}  {pixels}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# build_manifest.py
+
+import hashlib
+import json
+import os
+
+import czi_utils
+
+MANIFEST_VERSION = 1
+
+def processing_params() -> dict:
+    """Parameters that change the rendered PNGs, normalized to plain JSON."""
+    params = {
+        'SLICE_MODE': czi_utils.SLICE_MODE,
+        'WEEK_ORIENTATION': czi_utils.WEEK_ORIENTATION,
+        'STACK_NORMALIZATION': czi_utils.STACK_NORMALIZATION,
+        'STACK_CLIP_PERCENTILES': czi_utils.STACK_CLIP_PERCENTILES,
+        'OUTPUT_FORMAT': czi_utils.OUTPUT_FORMAT,
+        'OUTPUT_PRESET': czi_utils.OUTPUT_PRESET,
+        'OPTIMIZE_PNG': czi_utils.OPTIMIZE_PNG,
+        'OPTIMIZE_PNG_MAX_PIXELS': czi_utils.OPTIMIZE_PNG_MAX_PIXELS,
+        'TILE_SIZE': czi_utils.TILE_SIZE,
+        'BUNDLE_SLICES': czi_utils.BUNDLE_SLICES,
+        'DEDUPE_SLICES': czi_utils.DEDUPE_SLICES,
+        'CROP_SLICES': czi_utils.CROP_SLICES,
+    }
+    if czi_utils.SLICE_MODE != 'gray':
+        # Baked into the flat channels; gray slices are tinted by the viewer
+        params['CHANNEL_COLORS'] = czi_utils.CHANNEL_COLORS
+        params['CHANNEL_THRESHOLDS'] = czi_utils.CHANNEL_THRESHOLDS
+    return json.loads(json.dumps(params, sort_keys=True))
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(chunk_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+class BuildManifest:
+    """Record of which CZI inputs produced which PNGs, with which parameters.
+
+    Stored as JSON next to the outputs (``static/.build_manifest.json``).
+    Paths are kept relative to the folder containing ``static/`` so the
+    manifest works from any checkout and working directory.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self.root = os.path.dirname(os.path.dirname(self.path))
+        self.entries = {}
+        if os.path.isfile(self.path):
+            with open(self.path, encoding='utf-8') as fh:
+                data = json.load(fh)
+            if data.get('version') == MANIFEST_VERSION:
+                self.entries = data.get('entries', {})
+
+    def key(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, '/')
+
+    def abspath(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+    def digest(self, src: str) -> str:
+        """SHA-256 of ``src``, reusing the recorded one while size and mtime match."""
+        st = os.stat(src)
+        entry = self.entries.get(self.key(src))
+        if entry and entry.get('size') == st.st_size and entry.get('mtime_ns') == st.st_mtime_ns:
+            return entry['sha256']
+        return file_sha256(src)
+
+    def is_fresh(self, src: str, kind: str, digest: str, params: dict) -> bool:
+        """True if ``src`` was built with the same content and parameters and all outputs still exist."""
+        entry = self.entries.get(self.key(src))
+        if not entry:
+            return False
+        return (entry.get('kind') == kind
+                and entry.get('sha256') == digest
+                and entry.get('params') == params
+                and all(os.path.isfile(self.abspath(out)) for out in entry.get('outputs', ())))
+
+    def record(self, src: str, kind: str, digest: str, params: dict, outputs) -> list[str]:
+        """Store a successful build of ``src``; returns outputs it no longer produces, now removed."""
+        key = self.key(src)
+        st = os.stat(src)
+        new_outputs = sorted(self.key(out) for out in outputs)
+        old_outputs = self.entries.get(key, {}).get('outputs', [])
+        self.entries[key] = {
+            'kind': kind,
+            'sha256': digest,
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'params': params,
+            'outputs': new_outputs,
+        }
+        return self._remove_outputs(set(old_outputs) - set(new_outputs))
+
+    def prune(self) -> list[str]:
+        """Forget inputs that no longer exist and delete the PNGs only they produced."""
+        gone = [key for key in self.entries if not os.path.isfile(self.abspath(key))]
+        orphans = set()
+        for key in gone:
+            orphans.update(self.entries.pop(key).get('outputs', ()))
+        return self._remove_outputs(orphans)
+
+    def _remove_outputs(self, outputs) -> list[str]:
+        live = {out for entry in self.entries.values() for out in entry.get('outputs', ())}
+        removed = []
+        for out in sorted(set(outputs) - live):
+            path = self.abspath(out)
+            if os.path.isfile(path):
+                os.remove(path)
+                removed.append(out)
+        return removed
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump({'version': MANIFEST_VERSION, 'entries': self.entries},
+                      fh, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
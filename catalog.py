@@ -0,0 +1,286 @@
+# catalog.py
+
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from PIL import Image
+
+# Detailed sections as the pages name them -> folder under czi_images_detailed/week<w>/
+VESSEL_CODES = {
+    'healthy_venule': 'HV',
+    'fibrotic_venule': 'FV',
+    'healthy_arteriole': 'HA',
+    'fibrotic_arteriole': 'FA',
+}
+
+# Seconds between checks of the watched directories' mtimes
+CHECK_INTERVAL = 2.0
+
+_SLICE = re.compile(r'^(?P<stem>.+)_z(?P<z>\d+)_ch(?P<ch>\d+)(?P<ext>\.\w+)$')
+_BUNDLE_INDEX = re.compile(r'^(?P<stem>.+)_ch(?P<ch>\d+)\.json$')
+_SLICE_MANIFEST = re.compile(r'^(?P<stem>.+)\.slices\.json$')
+_DOWNLOAD = re.compile(r'^week(?P<week>\d+)(?:_(?P<code>[^.]+))?\.(?P<ext>czi|tif)$')
+
+def _week_number(name: str):
+    return int(name[4:]) if name.startswith('week') and name[4:].isdigit() else None
+
+def _listdir(path: str) -> list[str]:
+    try:
+        return sorted(os.listdir(path))
+    except OSError:
+        return []
+
+def _image_size(source):
+    try:
+        with Image.open(source) as img:
+            return list(img.size)
+    except OSError:   # not decodable, e.g. a git-lfs pointer
+        return None
+
+def scan_slices(folder: str, rel: str):
+    """Slice stack in ``folder`` (loose slices, bundles or deduplicated objects), or None if it holds none.
+
+    ``z`` is the [first, last] slice number, ``missing`` the [z, channel]
+    pairs inside that range that have no slice (blank slices the pipeline
+    skipped are missing too). ``size`` is the full frame, also for slices
+    cropped to their content (``crop``). A channel counts only if it
+    covers at least half the stack, so stray files left by an earlier run
+    (a handful of z1_ch5..ch101 slices) don't show up as channels.
+    """
+    names = _listdir(folder)
+    planes, exts, stems = set(), Counter(), Counter()
+    for name in names:
+        m = _SLICE.match(name)
+        if m:
+            planes.add((int(m['z']), int(m['ch'])))
+            exts[m['ext']] += 1
+            stems[m['stem']] += 1
+
+    bundles = {}
+    for name in names:
+        m = _BUNDLE_INDEX.match(name)
+        if not m:
+            continue
+        try:
+            with open(os.path.join(folder, name), encoding='utf-8') as fh:
+                index = json.load(fh)
+        except (OSError, ValueError):
+            continue
+        ch, offsets = int(m['ch']), index['offsets']
+        bundles[ch] = (m['stem'], index)
+        exts[index['ext']] += 1
+        stems[m['stem']] += 1
+        for i in range(len(offsets) - 1):
+            if offsets[i + 1] > offsets[i]:
+                planes.add((index['z0'] + i, ch))
+
+    objects = {}
+    for name in names:
+        m = _SLICE_MANIFEST.match(name)
+        if not m:
+            continue
+        try:
+            with open(os.path.join(folder, name), encoding='utf-8') as fh:
+                manifest = json.load(fh)
+        except (OSError, ValueError):
+            continue
+        exts[manifest['ext']] += 1
+        stems[m['stem']] += 1
+        for ch, digests in manifest['channels'].items():
+            for i, digest in enumerate(digests):
+                if digest:
+                    planes.add((manifest['z0'] + i, int(ch)))
+                    objects[(manifest['z0'] + i, int(ch))] = f"{manifest['objects']}/{digest}{manifest['ext']}"
+
+    if not planes:
+        return None
+    stem, ext = stems.most_common(1)[0][0], exts.most_common(1)[0][0]
+    per_channel = Counter(ch for _, ch in planes)
+    channels = sorted(ch for ch, n in per_channel.items() if 2 * n >= max(per_channel.values()))
+    planes = {(z, ch) for z, ch in planes if ch in channels}
+    zs = sorted({z for z, _ in planes})
+    missing = [[z, ch] for z in range(zs[0], zs[-1] + 1) for ch in channels if (z, ch) not in planes]
+
+    frame = None
+    if f'{stem}.crop.json' in names:
+        try:
+            with open(os.path.join(folder, f'{stem}.crop.json'), encoding='utf-8') as fh:
+                frame = json.load(fh)['frame']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    # Dimensions from the crop sidecar, else the first slice's header
+    z0, ch0 = min(planes)
+    if frame:
+        size = frame
+    elif (z0, ch0) in objects:
+        size = _image_size(os.path.join(folder, objects[(z0, ch0)]))
+    elif ch0 in bundles:
+        _, index = bundles[ch0]
+        i = z0 - index['z0']
+        with open(os.path.join(folder, f'{stem}_ch{ch0}.bundle'), 'rb') as fh:
+            fh.seek(index['offsets'][i])
+            size = _image_size(io.BytesIO(fh.read(index['offsets'][i + 1] - index['offsets'][i])))
+    else:
+        size = _image_size(os.path.join(folder, f'{stem}_z{z0}_ch{ch0}{ext}'))
+
+    return {
+        'folder': rel,
+        'stem': stem,
+        'ext': ext,
+        'z': [zs[0], zs[-1]],
+        'channels': channels,
+        'missing': missing,
+        'size': size,
+        'bundle': sorted(bundles) == channels,
+        'dedup': bool(objects),
+        'crop': frame is not None,
+    }
+
+class Catalog:
+    """What the dataset on disk holds, built once and rebuilt when it changes.
+
+    ``data`` lists every week (whether it has a detail page, its downloads,
+    its sections with their slice stacks and downloads), the overview
+    sections and every download route; ``downloads`` maps a download name (``week1.czi``,
+    ``detailweek1kmc1.tif``) to its file (relative to static/) and route.
+    Changes are noticed through the mtimes of the scanned directories,
+    checked at most every CHECK_INTERVAL seconds.
+    """
+
+    def __init__(self, static_dir: str):
+        self.static_dir = static_dir
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._watched = {}
+        self.data, self.downloads, self.version = {}, {}, None
+        self.rebuild()
+
+    def rebuild(self):
+        watched, downloads, weeks, overview = {}, {}, {}, {}
+
+        def folder(*parts):
+            path = os.path.join(self.static_dir, *parts)
+            try:
+                watched[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                watched[path] = None
+            return path
+
+        def week(w):
+            return weeks.setdefault(str(w), {'page': False, 'downloads': {}, 'sections': {}})
+
+        def download(name, rel, url, into):
+            downloads[name] = {'path': rel, 'url': url}
+            into[os.path.splitext(name)[1][1:]] = url
+
+        for name in _listdir(folder('3d_images')):
+            w = _week_number(name)
+            if w is not None and os.path.isdir(os.path.join(self.static_dir, '3d_images', name)):
+                week(w)['page'] = True
+
+        # Alveoli stacks: processed_detailed/week0/ (flat) and processed_detailed/week<w>/<kmc>/
+        for name in _listdir(folder('processed_detailed')):
+            w = _week_number(name)
+            if w is None:
+                continue
+            stack = scan_slices(folder('processed_detailed', name), f'processed_detailed/{name}')
+            if stack:
+                week(w)['sections'][name] = stack
+            for section in _listdir(os.path.join(self.static_dir, 'processed_detailed', name)):
+                if os.path.isdir(os.path.join(self.static_dir, 'processed_detailed', name, section)):
+                    stack = scan_slices(folder('processed_detailed', name, section),
+                                        f'processed_detailed/{name}/{section}')
+                    if stack:
+                        week(w)['sections'][section] = stack
+
+        # Vessel stacks: vessel_processed_detailed/week<w>/<healthy|fibrotic>_<venule|arteriole>/
+        for name in _listdir(folder('vessel_processed_detailed')):
+            w = _week_number(name)
+            if w is None:
+                continue
+            for section in _listdir(folder('vessel_processed_detailed', name)):
+                stack = scan_slices(folder('vessel_processed_detailed', name, section),
+                                    f'vessel_processed_detailed/{name}/{section}')
+                if stack:
+                    week(w)['sections'][section.replace('_', '-')] = stack
+
+        for section in _listdir(folder('overview_processed_detailed')):
+            stack = scan_slices(folder('overview_processed_detailed', section),
+                                f'overview_processed_detailed/{section}')
+            if stack:
+                overview[section] = stack
+
+        # Downloads, named as the download routes send them: czi_images/week<w>.<ext> and
+        # czi_images_detailed/week<w>/week<w>.<ext> or week<w>/<code>/week<w>_<code>.<ext>
+        for name in _listdir(folder('czi_images')):
+            m = _DOWNLOAD.match(name)
+            if m and not m['code']:
+                w, ext = int(m['week']), m['ext']
+                route = 'week' if ext == 'czi' else 'weektif'
+                download(f'week{w}.{ext}', f'czi_images/{name}', f'/download/{route}{w}', week(w)['downloads'])
+
+        section_of = {code: name.replace('_', '-') for name, code in VESSEL_CODES.items()}
+        for name in _listdir(folder('czi_images_detailed')):
+            w = _week_number(name)
+            if w is None:
+                continue
+            files = [('', f) for f in _listdir(folder('czi_images_detailed', name))]
+            for code in _listdir(os.path.join(self.static_dir, 'czi_images_detailed', name)):
+                if os.path.isdir(os.path.join(self.static_dir, 'czi_images_detailed', name, code)):
+                    files += [(code, f) for f in _listdir(folder('czi_images_detailed', name, code))]
+            for code, filename in files:
+                m = _DOWNLOAD.match(filename)
+                if not m or int(m['week']) != w or (m['code'] or '') != code:
+                    continue
+                ext = m['ext']
+                stack = week(w)['sections'].get(section_of.get(code, code) if code else f'week{w}')
+                route = 'detailweek' if ext == 'czi' else 'detailweektif'
+                rel = '/'.join(filter(None, ('czi_images_detailed', name, code, filename)))
+                download(f'detailweek{w}{code}.{ext}', rel, f'/download/{route}{w}{code}',
+                         stack.setdefault('downloads', {}) if stack else {})
+
+        data = {'weeks': dict(sorted(weeks.items(), key=lambda kv: int(kv[0]))), 'overview': overview,
+                'downloads': sorted(entry['url'] for entry in downloads.values())}
+        version = hashlib.sha1(json.dumps([data, downloads], sort_keys=True).encode()).hexdigest()[:16]
+        self.data, self.downloads, self.version, self._watched = data, downloads, version, watched
+        self._checked = time.monotonic()
+
+    def _changed(self) -> bool:
+        for path, mtime_ns in self._watched.items():
+            try:
+                current = os.stat(path).st_mtime_ns
+            except OSError:
+                current = None
+            if current != mtime_ns:
+                return True
+        return False
+
+    def refresh(self):
+        """Rebuild if a scanned directory changed; checked at most every CHECK_INTERVAL seconds."""
+        if time.monotonic() - self._checked < CHECK_INTERVAL:
+            return
+        with self._lock:
+            if time.monotonic() - self._checked < CHECK_INTERVAL:
+                return
+            if self._changed():
+                self.rebuild()
+            else:
+                self._checked = time.monotonic()
+
+    def week(self, week: int):
+        """Catalog entry of ``week``, or None."""
+        self.refresh()
+        return self.data['weeks'].get(str(week))
+
+    def download_path(self, name: str):
+        """File (relative to static/) of the download called ``name``, or None."""
+        self.refresh()
+        entry = self.downloads.get(name)
+        return entry['path'] if entry else None
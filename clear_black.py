@@ -1,14 +1,102 @@
+#!/usr/bin/env python3
+"""
+Make key colors transparent in PNGs: pure black, the heatmap blue (0, 0, 131),
+or any --color, optionally within a per-component --tolerance.
+
+Files and directories (every *.png in them) are processed in one run; the
+keying itself is transform_assets.color_key.
+
+    python clear_black.py static/heatmaps/week6_dapi_heatmap.png -o out/
+    python clear_black.py static/heatmaps --color 0,0,131 --color 0,0,0 --tolerance 4 --in-place -j 4
+"""
+
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
 from PIL import Image
 
-img = Image.open("static/heatmaps/week6_dapi_heatmap.png").convert("RGBA")
-pixels = img.getdata()
+from transform_assets import color_key
+
+DEFAULT_COLORS = [(0, 0, 131)]
+
+def parse_color(text: str):
+    try:
+        color = tuple(int(v) for v in text.split(','))
+    except ValueError:
+        color = ()
+    if len(color) != 3 or not all(0 <= v <= 255 for v in color):
+        raise argparse.ArgumentTypeError(f"expected R,G,B with 0-255 components, got {text!r}")
+    return color
+
+def collect(paths):
+    """Input PNGs: files as given, directories expanded to their *.png files."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(glob.glob(os.path.join(path, '*.png'))))
+        else:
+            found.append(path)
+    return found
+
+def key_file(src: str, dst: str, colors, tolerance: int):
+    with Image.open(src) as img:
+        out = color_key(img, colors, tolerance)
+    tmp = dst + '.tmp'
+    out.save(tmp, 'PNG')
+    os.replace(tmp, dst)
+    return dst
+
+def run_jobs(jobs, colors, tolerance, workers):
+    """Yield (source, output path or the exception) per (source, destination) job."""
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(src, pool.submit(key_file, src, dst, colors, tolerance)) for src, dst in jobs]
+            for src, future in futures:
+                try:
+                    yield src, future.result()
+                except Exception as e:
+                    yield src, e
+        return
+    for src, dst in jobs:
+        try:
+            yield src, key_file(src, dst, colors, tolerance)
+        except Exception as e:
+            yield src, e
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help="PNG files or directories of PNGs")
+    parser.add_argument('--color', type=parse_color, action='append',
+                        help="key color R,G,B (repeatable; default 0,0,131)")
+    parser.add_argument('--tolerance', type=int, default=0, help="max difference per RGB component")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('-o', '--output', help="directory for the keyed images")
+    target.add_argument('--in-place', action='store_true', help="overwrite the inputs")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="worker processes (0 = all cores)")
+    args = parser.parse_args(argv)
+
+    colors = args.color or DEFAULT_COLORS
+    sources = collect(args.paths)
+    if not sources:
+        print("No PNGs found")
+        return 1
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    jobs = [(src, src if args.in_place else os.path.join(args.output, os.path.basename(src)))
+            for src in sources]
 
-new_pixels = []
-for r,g,b,a in pixels:
-    if r == 0 and g == 0 and b == 131:
-        new_pixels.append((0, 0, 0, 0))
-    else:
-        new_pixels.append((r, g, b, a))
+    failed = 0
+    for src, result in run_jobs(jobs, colors, args.tolerance, args.jobs or os.cpu_count() or 1):
+        if isinstance(result, Exception):
+            print(f"  [ERROR] {src}: {result}")
+            failed += 1
+        else:
+            print(f"[OK] {src} → {result}")
+    print(f"{len(jobs) - failed} keyed, {failed} failed")
+    return 1 if failed else 0
 
-img.putdata(new_pixels)
-img.save("/Users/hayden/Desktop/week6_clear_black.png", "PNG")
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+# conftest.py
+
+import struct
+import uuid
+
+import numpy as np
+import pytest
+
+def _segment(sid: bytes, data: bytes) -> bytes:
+    return struct.pack('<16sqq', sid, len(data), len(data)) + data
+
+def _directory_entry(position: int, dims) -> bytes:
+    """DirectoryEntryDV of a uint16 subblock; ``dims`` is (name, start, size) from the slowest axis."""
+    entry = struct.pack('<2siqiiBB4si', b'DV', 1, position, 0, 0, 0, 0, b'', len(dims))
+    for name, start, size in reversed(dims):   # stored fastest axis first
+        entry += struct.pack('<4siifi', name.encode(), start, size, 0.0, size)
+    return entry
+
+def write_czi(path, tiles):
+    """Write a minimal uncompressed uint16 CZI.
+
+    ``tiles`` is a list of ((z, c), (y, x), uint16 (H, W) array), one
+    subblock each, in mosaic order; Y/X positions are absolute.
+    """
+    header_size = 32 + 80
+    body, entries = b'', []
+    for m, ((z, c), (y, x), data) in enumerate(tiles):
+        dims = [('Z', z, 1), ('C', c, 1), ('M', m, 1), ('Y', y, data.shape[0]), ('X', x, data.shape[1])]
+        position = header_size + len(body)
+        entry = _directory_entry(position, dims)
+        pixels = np.ascontiguousarray(data, dtype='<u2').tobytes()
+        sub = struct.pack('<iiq', 0, 0, len(pixels)) + entry + bytes(max(240 - len(entry), 0)) + pixels
+        body += _segment(b'ZISRAWSUBBLOCK', sub)
+        entries.append(entry)
+    directory_position = header_size + len(body)
+    directory = _segment(b'ZISRAWDIRECTORY', struct.pack('<i', len(entries)) + bytes(124) + b''.join(entries))
+    guid = uuid.uuid4().bytes
+    header = _segment(b'ZISRAWFILE', struct.pack('<iiii16s16siqqiq', 1, 0, 0, 0, guid, guid, 0,
+                                                 directory_position, 0, 0, 0))
+    with open(path, 'wb') as fh:
+        fh.write(header + body + directory)
+
+@pytest.fixture
+def czi_stack(tmp_path):
+    """A 3 Z x 2 channel mosaic CZI with overlapping tiles, a blank plane and a duplicated one.
+
+    Returns its path; every plane is 6 x 13 pixels at Y/X offset (40, 100).
+    """
+    rng = np.random.default_rng(0)
+    tiles = []
+    for z in range(3):
+        for c in range(2):
+            if (z, c) == (1, 1):
+                blank = np.zeros((6, 8), np.uint16)
+                tiles += [((z, c), (40, 100), blank), ((z, c), (40, 105), blank)]
+                continue
+            # A spot of signal, so the slice crops to less than the frame
+            left = np.zeros((6, 8), np.uint16)
+            left[1:4, 2 + z:6 + z] = rng.integers(1, 4000, (3, 4))
+            right = rng.integers(0, 4000, (6, 8)).astype(np.uint16) if c == 0 else np.zeros((6, 8), np.uint16)
+            tiles += [((z, c), (40, 100), left), ((z, c), (40, 105), right)]
+    # Plane (2, 1) repeats (0, 1), so a deduplicated stack stores it once
+    tiles = [t for t in tiles if t[0] != (2, 1)] + [((2, 1), yx, data) for (zc, yx, data) in tiles if zc == (0, 1)]
+    path = tmp_path / 'week1_kmc1.czi'
+    write_czi(path, tiles)
+    return str(path)
@@ -1,9 +1,17 @@
 # czi_utils.py
 
+import hashlib
+import io
+import json
 import os
+import re
+import shutil
+import warnings
 from czifile import CziFile
 import numpy as np
-from PIL import Image
+from PIL import Image, features
+
+import png_optimize
 
 # Tint colors per channel (R, G, B)
 CHANNEL_COLORS = {
@@ -13,17 +21,16 @@ CHANNEL_COLORS = {
     4: (100, 100, 255)    # DAPI
 }
 
-# Per–week rotations (k counts of 90° CCW):
-# week0: 90° CW  → k=3
-# week1: 180°   → k=2
-# week2: 90° CCW→ k=1
-# week3: 90° CW → k=3
-# all others: 0
-WEEK_ROT_K = {
-    'week0': 3,
-    'week1': 2,
-    'week2': 1,
-    'week3': 3
+# Per-week orientation of the overviews, applied by process_czi in one pass:
+# 'rotate' degrees counter-clockwise (multiples of 90 are exact, other angles
+# are one affine resample onto the rotated bounding box), then 'flip'
+# ('horizontal' or 'vertical'). All others: unchanged.
+WEEK_ORIENTATION = {
+    'week0': {'rotate': 270},                         # 90° CW
+    'week1': {'rotate': 180},
+    'week2': {'rotate': 90, 'flip': 'horizontal'},    # 90° CCW, mirrored
+    'week3': {'rotate': 270},                         # 90° CW
+    'week6': {'rotate': 35},
 }
 
 # Predefined thresholds [0–1] per channel
@@ -34,132 +41,580 @@ CHANNEL_THRESHOLDS = {
     4: 10/230
 }
 
-def _apply_threshold(norm_arr: np.ndarray, ch_idx: int) -> np.ndarray:
+# Z-stack normalization for process_detailed_czi:
+# 'plane' scales every slice by its own min/max (brightness jumps between slices),
+# 'stack' uses one range per channel over the whole stack, clipped at these percentiles
+STACK_NORMALIZATION = 'stack'
+STACK_CLIP_PERCENTILES = (0.0, 100.0)
+
+# Raw dtypes normalized through a lookup table indexed by the pixel value
+LUT_DTYPES = (np.uint8, np.uint16)
+
+# Slice encoders: format -> (extension, Pillow format, {preset: save options}).
+# 'default' keeps the encoder defaults, 'fast' favours encode speed, 'small'
+# file size. PNG and WebP are lossless; AVIF at quality 100 / 4:4:4 is
+# near-lossless (it goes through YUV).
+ENCODERS = {
+    'png': ('.png', 'PNG', {
+        'default': {},
+        'fast': {'compress_level': 1},
+        'small': {'compress_level': 9, 'optimize': True},
+    }),
+    'webp': ('.webp', 'WEBP', {
+        'default': {'lossless': True, 'exact': True},
+        'fast': {'lossless': True, 'exact': True, 'quality': 0, 'method': 0},
+        'small': {'lossless': True, 'exact': True, 'quality': 100, 'method': 6},
+    }),
+    'avif': ('.avif', 'AVIF', {
+        'default': {'quality': 100, 'subsampling': '4:4:4'},
+        'fast': {'quality': 100, 'subsampling': '4:4:4', 'speed': 10},
+        'small': {'quality': 100, 'subsampling': '4:4:4', 'speed': 0},
+    }),
+}
+OUTPUT_FORMAT = 'png'
+OUTPUT_PRESET = 'default'
+
+# PNG slices also go through png_optimize.encode_png (smallest lossless layout, e.g.
+# a tinted slice as an alpha-indexed palette, and the best filter) at the preset's
+# compress_level, and the smaller of it and Pillow's PNG is kept; the 'fast' preset
+# keeps Pillow's encoder. Images above OPTIMIZE_PNG_MAX_PIXELS (the full-resolution
+# flat overviews) skip it, since its filter candidates cost several times the image
+# in memory and deflates; run png_optimize.py over those separately
+OPTIMIZE_PNG = True
+OPTIMIZE_PNG_MAX_PIXELS = 4096 * 4096
+
+# Deep Zoom tiles for the tilescans overviews: process_czi also writes a DZI
+# pyramid per channel into <output_dir>/tiles/ when this is > 0 (e.g. 256)
+TILE_SIZE = 0
+
+# Z-stack bundles: pack a section's slices into one file per channel plus a
+# JSON offset index (bundle_slices), served with Range requests by app.py
+BUNDLE_SLICES = False
+
+# Detailed stacks: slices that are blank after thresholding are not written, and
+# each distinct slice is stored once as <section>/objects/<digest><ext> with a
+# <stem>.slices.json manifest mapping every z and channel to it (dedupe_slices)
+DEDUPE_SLICES = True
+SLICE_OBJECTS = 'objects'
+OBJECT_DIGEST_LENGTH = 16
+
+# Detailed slices are cropped to the bounding box of their content; where each
+# crop sits in the full frame goes into a <stem>.crop.json sidecar (write_crops)
+CROP_SLICES = True
+
+# Flat channels (process_czi): 'tinted' bakes CHANNEL_COLORS and CHANNEL_THRESHOLDS
+# into RGBA, 'gray' writes the normalized intensity as 8-bit L and leaves tint and
+# threshold to tile_viewer.js (run the app with SLICE_MODE=gray to match). Detailed
+# slices are always gray; viewer_detail.js tints and thresholds them in the browser.
+SLICE_MODE = 'tinted'
+
+def _normalized_alpha(f: np.ndarray, ch_idx, lo=None, hi=None) -> np.ndarray:
+    """Normalize float32 ``f`` to [lo, hi] (default: its min/max), threshold and scale to uint8 alpha, in place."""
+    # Normalize
+    f -= f.min() if lo is None else lo
+    span = (f.max() if hi is None else hi - lo) or 1.0
+    f /= span
+    if lo is not None:
+        np.clip(f, 0.0, 1.0, out=f)
+
+    # Threshold: values below thr end up negative and are clipped to 0
     thr = CHANNEL_THRESHOLDS.get(ch_idx, 0.0)
-    mask = norm_arr >= thr
-    out = np.zeros_like(norm_arr, dtype=np.float32)
-    if thr < 1.0:
-        out[mask] = (norm_arr[mask] - thr) / (1.0 - thr)
-    return out
+    if thr >= 1.0:
+        return np.zeros(f.shape, dtype=np.uint8)
+    f -= thr
+    f /= 1.0 - thr
+    np.maximum(f, 0.0, out=f)
 
-def process_czi(czi_path: str, output_dir: str) -> list[str]:
-    os.makedirs(output_dir, exist_ok=True)
-    base = os.path.splitext(os.path.basename(czi_path))[0]
+    # To uint8
+    f *= 255
+    return f.astype(np.uint8)
 
-    # 1) Load & squeeze
-    arr = np.squeeze(CziFile(czi_path).asarray())
+def _alpha_lut(lo: int, hi: int, ch_idx, size: int) -> np.ndarray:
+    """uint8 alpha for every raw value in [0, size) when normalizing to [lo, hi]."""
+    return _normalized_alpha(np.arange(size, dtype=np.float32), ch_idx, lo, hi)
 
-    # 2) Rotate array if needed
-    k = WEEK_ROT_K.get(base, 0)
-    if k:
-        # rotate last two dims (Y,X)
-        arr = np.rot90(arr, k=k, axes=(-2, -1))
+def _plane_alpha(plane: np.ndarray, ch_idx, lut=None) -> np.ndarray:
+    """Fused normalize/threshold kernel: raw (Y, X) plane -> uint8 alpha.
 
-    # 3) Split into channels
-    if arr.ndim == 2:
-        channels = [arr]
-    else:
-        # arr shape: (C, Y, X)
-        channels = [arr[c] for c in range(arr.shape[0])]
+    uint8/uint16 planes are mapped through a lookup table indexed by the
+    raw value (built per plane from its min/max unless a stack-wide ``lut``
+    is given), so the only full-size allocation is the result. Other dtypes
+    use a single float32 working copy.
+    """
+    if lut is not None:
+        return lut[plane]
+    if plane.dtype in LUT_DTYPES:
+        lo, hi = int(plane.min()), int(plane.max())
+        return _alpha_lut(lo, hi, ch_idx, hi + 1)[plane]
+    return _normalized_alpha(plane.astype(np.float32), ch_idx)
+
+def stack_histograms(planes, channel_axis: int) -> dict:
+    """Per-channel histograms of raw values from an iterable of ``(index, plane)``.
+
+    Streams: only one plane (and a row block of bin indices) is held at a
+    time. ``channel_axis`` says which entry of ``index`` is the channel.
+    """
+    hists = {}
+    for index, plane in planes:
+        if plane.dtype not in LUT_DTYPES:
+            raise ValueError(f"Stack normalization needs uint8/uint16 planes, got {plane.dtype}")
+        c = index[channel_axis] if len(index) > channel_axis else 0
+        hist = hists.setdefault(c, np.zeros(np.iinfo(plane.dtype).max + 1, dtype=np.int64))
+        for row in range(0, plane.shape[0], 256):
+            block = plane[row:row + 256].ravel()
+            hist += np.bincount(block, minlength=hist.size)
+    return hists
+
+def merge_histograms(*parts: dict) -> dict:
+    """Sum per-channel histograms from several stack_histograms() calls."""
+    merged = {}
+    for part in parts:
+        for c, hist in part.items():
+            if c in merged:
+                size = max(merged[c].size, hist.size)
+                merged[c] = np.pad(merged[c], (0, size - merged[c].size)) + np.pad(hist, (0, size - hist.size))
+            else:
+                merged[c] = hist
+    return merged
+
+def histogram_ranges(hists: dict, clip=None) -> dict:
+    """Raw value range per channel at the (low, high) ``clip`` percentiles (default STACK_CLIP_PERCENTILES)."""
+    clip = STACK_CLIP_PERCENTILES if clip is None else clip
+    ranges = {}
+    for c, hist in hists.items():
+        cdf = np.cumsum(hist)
+        total = cdf[-1]
+        lo = int(np.searchsorted(cdf, total * clip[0] / 100.0, side='right'))
+        hi = int(np.searchsorted(cdf, total * clip[1] / 100.0, side='left'))
+        ranges[c] = (lo, max(lo, min(hi, hist.size - 1)))
+    return ranges
+
+def stack_value_ranges(planes, channel_axis: int, clip=None) -> dict:
+    """One streaming pass: per-channel (lo, hi) raw range for stack-wide normalization."""
+    return histogram_ranges(stack_histograms(planes, channel_axis), clip)
+
+def slice_ext(fmt: str = None) -> str:
+    """File extension of the configured (or given) slice format."""
+    return ENCODERS[fmt or OUTPUT_FORMAT][0]
+
+def _encoder(fmt: str = None, preset: str = None):
+    """(extension, Pillow format, save options) of the configured (or given) encoder."""
+    fmt, preset = fmt or OUTPUT_FORMAT, preset or OUTPUT_PRESET
+    ext, pil_format, presets = ENCODERS[fmt]
+    if fmt != 'png' and not features.check(fmt):
+        raise ValueError(f"Pillow was built without {fmt} support")
+    return ext, pil_format, presets[preset]
+
+def save_slice(img: Image.Image, path_stem: str, fmt: str = None, preset: str = None) -> str:
+    """Encode ``img`` to ``path_stem`` + extension with the configured encoder; returns the path."""
+    ext, _, _ = _encoder(fmt, preset)
+    path = path_stem + ext
+    with open(path, 'wb') as fh:
+        fh.write(encode_slice(img, fmt, preset))
+    return path
+
+def encode_slice(img: Image.Image, fmt: str = None, preset: str = None) -> bytes:
+    """Like save_slice, but returns the encoded bytes."""
+    _, pil_format, options = _encoder(fmt, preset)
+    buf = io.BytesIO()
+    img.save(buf, pil_format, **options)
+    if (pil_format == 'PNG' and OPTIMIZE_PNG and (preset or OUTPUT_PRESET) != 'fast'
+            and img.mode in png_optimize.REDUCIBLE_MODES
+            and img.width * img.height <= OPTIMIZE_PNG_MAX_PIXELS):
+        # Tiny or noisy images can come out larger than Pillow's PNG
+        optimized = png_optimize.encode_png(img, options.get('compress_level', 6))
+        if len(optimized) < buf.tell():
+            return optimized
+    return buf.getvalue()
+
+def write_tile_pyramid(img: Image.Image, out_dir: str, name: str, tile_size: int = None) -> list[str]:
+    """Write ``img`` as a Deep Zoom pyramid: ``<name>.dzi`` + ``<name>_files/<level>/<col>_<row>.<ext>``.
+
+    Level ``max`` is full resolution and every level below halves it (rounding
+    up) down to 1x1, as Deep Zoom expects; tiles do not overlap. Returns the
+    written paths relative to ``out_dir``.
+    """
+    tile_size = tile_size or TILE_SIZE
+    ext = slice_ext()
+    width, height = img.size
+    max_level = max(width, height).bit_length() - 1
+    if 1 << max_level < max(width, height):
+        max_level += 1
+
+    written = []
+    for level in range(max_level, -1, -1):
+        level_dir = os.path.join(out_dir, f"{name}_files", str(level))
+        os.makedirs(level_dir, exist_ok=True)
+        w, h = img.size
+        for row in range(0, h, tile_size):
+            for col in range(0, w, tile_size):
+                tile = img.crop((col, row, min(col + tile_size, w), min(row + tile_size, h)))
+                path = save_slice(tile, os.path.join(level_dir, f"{col // tile_size}_{row // tile_size}"))
+                written.append(os.path.relpath(path, out_dir))
+        if level:
+            img = img.reduce(2)
+
+    dzi = os.path.join(out_dir, f"{name}.dzi")
+    with open(dzi, 'w', encoding='utf-8') as fh:
+        fh.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+                 f'Format="{ext[1:]}" Overlap="0" TileSize="{tile_size}">\n'
+                 f'  <Size Width="{width}" Height="{height}"/>\n'
+                 '</Image>\n')
+    written.append(os.path.relpath(dzi, out_dir))
+    return written
+
+_SLICE_NAME = re.compile(r'^(?P<stem>.+)_z(?P<z>\d+)_ch(?P<ch>\d+)(?P<ext>\.\w+)$')
+
+def bundle_slices(out_dir: str, names, keep_slices: bool = False) -> list[str]:
+    """Pack ``<stem>_z<z>_ch<c><ext>`` slices into ``<stem>_ch<c>.bundle`` + ``<stem>_ch<c>.json``.
+
+    The bundle is the encoded slices back to back in z order; the index holds
+    ``ext``, the first ``z0`` and ``offsets`` (one per z plus the end), so
+    slice z is bytes ``offsets[z - z0]`` up to ``offsets[z - z0 + 1]`` and a
+    missing z is empty. The slices are removed unless ``keep_slices``.
+    Returns the names now in ``out_dir``: bundles, indexes and any non-slice
+    name passed in.
+    """
+    groups, others = {}, []
+    for name in names:
+        m = _SLICE_NAME.match(name)
+        if not m:
+            others.append(name)
+            continue
+        key = (m['stem'], int(m['ch']), m['ext'])
+        groups.setdefault(key, {})[int(m['z'])] = name
 
     out_names = []
-    for idx, ch in enumerate(channels, start=1):
-        # Normalize
-        f = ch.astype(np.float32)
-        f -= f.min()
-        span = np.ptp(f) or 1.0
-        f /= span
+    for (stem, ch, ext), slices in sorted(groups.items()):
+        base = os.path.join(out_dir, f"{stem}_ch{ch}")
+        z0, z1 = min(slices), max(slices)
+        offsets = [0]
+        with open(base + '.bundle.tmp', 'wb') as out:
+            for z in range(z0, z1 + 1):
+                if z in slices:
+                    with open(os.path.join(out_dir, slices[z]), 'rb') as fh:
+                        shutil.copyfileobj(fh, out)
+                offsets.append(out.tell())
+        with open(base + '.json.tmp', 'w', encoding='utf-8') as fh:
+            json.dump({'ext': ext, 'z0': z0, 'offsets': offsets}, fh, separators=(',', ':'))
+        os.replace(base + '.bundle.tmp', base + '.bundle')
+        os.replace(base + '.json.tmp', base + '.json')
+        out_names += [f"{stem}_ch{ch}.bundle", f"{stem}_ch{ch}.json"]
 
-        # Threshold
-        f = _apply_threshold(f, idx)
+        if not keep_slices:
+            for name in slices.values():
+                os.remove(os.path.join(out_dir, name))
+        else:
+            out_names += slices.values()
 
-        # To uint8
-        p8 = (f * 255).astype(np.uint8)
+    return out_names + others
 
-        # Tint RGBA
-        color = CHANNEL_COLORS[idx]
-        img = Image.new("RGBA", p8.shape[::-1], color + (0,))
-        alpha = Image.fromarray(p8, mode="L")
-        img.putalpha(alpha)
+def _channel_table(slices: dict):
+    """``{(z, ch): value}`` as (z0, {ch: [value or None per z from z0]})."""
+    z0, z1 = min(z for z, _ in slices), max(z for z, _ in slices)
+    table = {str(ch): [None] * (z1 - z0 + 1) for ch in sorted({ch for _, ch in slices})}
+    for (z, ch), value in slices.items():
+        table[str(ch)][z - z0] = value
+    return z0, table
 
-        # Save
-        name = f"{base}_channel{idx}.png"
-        img.save(os.path.join(output_dir, name))
-        out_names.append(name)
+def write_crops(out_dir: str, slices: dict) -> list[str]:
+    """Write ``<stem>.crop.json`` for the slices process_detailed_czi returned; returns the sidecar names.
+
+    The sidecar holds the full ``frame`` [W, H], the first ``z0`` and per
+    channel one [x, y] offset per z from there (null where no slice was
+    written): the slice is the part of the frame at that offset.
+    """
+    groups = {}
+    for name, placement in slices.items():
+        m = _SLICE_NAME.match(name)
+        if m:
+            group = groups.setdefault(m['stem'], {'frame': placement['frame'], 'offsets': {}})
+            group['offsets'][(int(m['z']), int(m['ch']))] = placement['offset']
 
+    out_names = []
+    for stem, group in sorted(groups.items()):
+        z0, channels = _channel_table(group['offsets'])
+        sidecar = os.path.join(out_dir, f"{stem}.crop.json")
+        with open(sidecar + '.tmp', 'w', encoding='utf-8') as fh:
+            json.dump({'frame': group['frame'], 'z0': z0, 'channels': channels}, fh, separators=(',', ':'))
+        os.replace(sidecar + '.tmp', sidecar)
+        out_names.append(f"{stem}.crop.json")
     return out_names
 
-def process_detailed_czi(czi_path: str, output_root: str) -> tuple[int,int]:
-    os.makedirs(output_root, exist_ok=True)
+def write_value_ranges(out_dir: str, stem: str, value_ranges: dict) -> str:
+    """Write ``<stem>.ranges.json`` (channel -> [lo, hi], as stack_value_ranges returns)
+    so the live slice server need not scan the stack again; returns the sidecar name."""
+    sidecar = os.path.join(out_dir, f"{stem}.ranges.json")
+    with open(sidecar + '.tmp', 'w', encoding='utf-8') as fh:
+        json.dump({str(c): [int(lo), int(hi)] for c, (lo, hi) in sorted(value_ranges.items())},
+                  fh, separators=(',', ':'))
+    os.replace(sidecar + '.tmp', sidecar)
+    return f"{stem}.ranges.json"
+
+def read_value_ranges(path: str) -> dict:
+    """The ranges write_value_ranges stored at ``path``, keyed by int channel."""
+    with open(path, encoding='utf-8') as fh:
+        return {int(c): (lo, hi) for c, (lo, hi) in json.load(fh).items()}
+
+def dedupe_slices(out_dir: str, names, size=None) -> list[str]:
+    """Store ``<stem>_z<z>_ch<c><ext>`` slices once per distinct content under ``objects/``.
+
+    Each slice becomes ``objects/<digest><ext>`` (the start of its SHA-256),
+    shared by every identical slice of the section. ``<stem>.slices.json``
+    holds ``ext``, ``objects``, the slice ``size`` (the first slice's unless
+    given, e.g. the frame of cropped slices), the first ``z0`` and per
+    channel one digest per z from there, null where no slice was written
+    (blank). The loose slices are removed. Returns the names now in
+    ``out_dir``: manifests, objects and any non-slice name passed in.
+    """
+    groups, others = {}, []
+    for name in names:
+        m = _SLICE_NAME.match(name)
+        if not m:
+            others.append(name)
+            continue
+        groups.setdefault((m['stem'], m['ext']), {})[(int(m['z']), int(m['ch']))] = name
+
+    out_names = set()
+    os.makedirs(os.path.join(out_dir, SLICE_OBJECTS), exist_ok=True)
+    for (stem, ext), slices in sorted(groups.items()):
+        stack_size = size
+        if stack_size is None:
+            with Image.open(os.path.join(out_dir, slices[min(slices)])) as img:
+                stack_size = list(img.size)
+        digests = {}
+        for (z, ch), name in sorted(slices.items()):
+            path = os.path.join(out_dir, name)
+            with open(path, 'rb') as fh:
+                digest = hashlib.sha256(fh.read()).hexdigest()[:OBJECT_DIGEST_LENGTH]
+            obj = f"{SLICE_OBJECTS}/{digest}{ext}"
+            if os.path.exists(os.path.join(out_dir, obj)):
+                os.remove(path)
+            else:
+                os.replace(path, os.path.join(out_dir, obj))
+            digests[(z, ch)] = digest
+            out_names.add(obj)
+
+        z0, channels = _channel_table(digests)
+        manifest = os.path.join(out_dir, f"{stem}.slices.json")
+        with open(manifest + '.tmp', 'w', encoding='utf-8') as fh:
+            json.dump({'ext': ext, 'objects': SLICE_OBJECTS, 'size': stack_size, 'z0': z0, 'channels': channels},
+                      fh, separators=(',', ':'))
+        os.replace(manifest + '.tmp', manifest)
+        out_names.add(f"{stem}.slices.json")
+
+    return sorted(out_names) + others
+
+def orientation_affine(size, rotate: float = 0.0, flip: str = None):
+    """Output size and Pillow AFFINE coefficients for rotating ``size`` (W, H) then flipping.
+
+    The output is the rotated bounding box; the coefficients map output
+    coordinates back to the source in one float matrix.
+    """
+    if flip not in (None, 'horizontal', 'vertical'):
+        raise ValueError(f"Unknown flip {flip!r}")
+    w, h = size
+    rad = np.radians(rotate)
+    cos, sin = float(np.cos(rad)), float(np.sin(rad))
+    out_w = int(np.ceil(w * abs(cos) + h * abs(sin) - 1e-6))
+    out_h = int(np.ceil(w * abs(sin) + h * abs(cos) - 1e-6))
+    sx = -1.0 if flip == 'horizontal' else 1.0
+    sy = -1.0 if flip == 'vertical' else 1.0
+    a, b = sx * cos, -sy * sin
+    d, e = sx * sin, sy * cos
+    c = w / 2 - a * out_w / 2 - b * out_h / 2
+    f = h / 2 - d * out_w / 2 - e * out_h / 2
+    return (out_w, out_h), (a, b, c, d, e, f)
+
+def orient_plane(p8: np.ndarray, orientation: dict = None) -> np.ndarray:
+    """Apply a WEEK_ORIENTATION entry to a uint8 (Y, X) plane.
+
+    Multiples of 90° and flips only reorder pixels; any other angle is a
+    single bilinear resample, uncovered pixels 0.
+    """
+    if not orientation:
+        return p8
+    rotate, flip = orientation.get('rotate', 0) % 360, orientation.get('flip')
+    if rotate % 90 == 0:
+        p8 = np.rot90(p8, k=int(rotate // 90))
+        if flip:
+            p8 = p8[:, ::-1] if flip == 'horizontal' else p8[::-1]
+        return np.ascontiguousarray(p8)
+    size, coeffs = orientation_affine(p8.shape[::-1], rotate, flip)
+    img = Image.fromarray(p8, mode='L').transform(size, Image.Transform.AFFINE, coeffs,
+                                                  resample=Image.Resampling.BILINEAR, fillcolor=0)
+    return np.asarray(img)
+
+def _tint_alpha(p8: np.ndarray, ch_idx: int) -> Image.Image:
+    """Tint a uint8 alpha plane into an RGBA image."""
+    color = CHANNEL_COLORS[ch_idx]
+    img = Image.new("RGBA", p8.shape[::-1], color + (0,))
+    alpha = Image.fromarray(p8, mode="L")
+    img.putalpha(alpha)
+    return img
+
+def _tint_plane(plane: np.ndarray, ch_idx: int, lut=None) -> Image.Image:
+    """Normalize, threshold and tint one (Y, X) plane into an RGBA image."""
+    return _tint_alpha(_plane_alpha(plane, ch_idx, lut), ch_idx)
+
+class CziPlaneReader:
+    """Read single (Y, X) planes of a CZI through its subblock directory.
+
+    Only the subblocks of the requested plane are decoded, so peak memory is
+    one plane instead of the whole stack. ``shape`` holds the non-singleton
+    axes in front of Y/X, i.e. ``np.squeeze(CziFile(path).asarray()).shape[:-2]``,
+    and ``read(*index)`` returns the same plane that indexing that array would.
+    """
+
+    def __init__(self, czi_path: str):
+        self._czi = CziFile(czi_path)
+        try:
+            self._build_index()
+        except Exception:
+            self._czi.close()
+            raise
+
+    def _build_index(self):
+        czi = self._czi
+        axes, shape, start = czi.axes, czi.shape, czi.start
+        self._y, self._x = axes.index('Y'), axes.index('X')
+        if shape[-1] != 1:
+            raise ValueError(f"Expected single-sample pixels, got {czi.dtype}")
+
+        lead = [i for i, ax in enumerate(axes)
+                if ax not in ('Y', 'X', '0') and shape[i] > 1]
+        if len(lead) > 2:
+            raise ValueError(f"Expected at most 2 axes before Y/X, got {axes} {shape}")
+
+        self.shape = tuple(shape[i] for i in lead)
+        self.plane_shape = (shape[self._y], shape[self._x])
+        self.dtype = czi.dtype
+        self._start = start
+
+        # Subblocks per plane, kept in directory order so overlapping mosaic
+        # tiles are pasted exactly like CziFile.asarray() does serially.
+        self._index = {}
+        for entry in czi.filtered_subblock_directory:
+            key = tuple(entry.start[i] - start[i] for i in lead)
+            self._index.setdefault(key, []).append(entry)
+
+    def read(self, *index: int) -> np.ndarray:
+        """Decode and return the (Y, X) plane at ``index``."""
+        plane = np.zeros(self.plane_shape, dtype=self.dtype)
+        y0, x0 = self._start[self._y], self._start[self._x]
+        for entry in self._index.get(tuple(index), ()):
+            tile = entry.data_segment().data()
+            h, w = tile.shape[self._y], tile.shape[self._x]
+            if tile.size != h * w:
+                raise ValueError(f"Subblock spans more than one plane: {entry.shape}")
+            ys = entry.start[self._y] - y0
+            xs = entry.start[self._x] - x0
+            try:
+                plane[ys:ys + h, xs:xs + w] = tile.reshape(h, w)
+            except ValueError as e:
+                warnings.warn(str(e))
+        return plane
+
+    def __iter__(self):
+        """Yield ``(index, plane)`` in C order over ``shape``."""
+        for index in np.ndindex(*self.shape):
+            yield index, self.read(*index)
+
+    def close(self):
+        self._czi.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def process_czi(czi_path: str, output_dir: str) -> list[str]:
+    os.makedirs(output_dir, exist_ok=True)
     base = os.path.splitext(os.path.basename(czi_path))[0]
-    k = WEEK_ROT_K.get(base, 0)
-    out_base = os.path.join(output_root, base)
-    os.makedirs(out_base, exist_ok=True)
 
+    # 1) Load & squeeze
     arr = np.squeeze(CziFile(czi_path).asarray())
+    orientation = WEEK_ORIENTATION.get(base)
 
-    # Determine dims
+    # 2) Split into channels
     if arr.ndim == 2:
-        channels, zcount = 1, 1
-    elif arr.ndim == 3:
-        channels, zcount = arr.shape[0], 1
+        channels = [arr]
     else:
-        channels, zcount = arr.shape[0], arr.shape[1]
-
-    for c in range(channels):
-        ch_dir = os.path.join(out_base, f"channel{c+1}")
-        os.makedirs(ch_dir, exist_ok=True)
+        # arr shape: (C, Y, X)
+        channels = [arr[c] for c in range(arr.shape[0])]
 
-        for z in range(zcount):
-            if zcount == 1:
-                plane = arr[c] if arr.ndim >= 3 else arr
-            else:
-                plane = arr[c, z]
+    out_names = []
+    for idx, ch in enumerate(channels, start=1):
+        # Normalize, then orient the alpha in one pass before tinting
+        if SLICE_MODE == 'gray':
+            img = Image.fromarray(orient_plane(_plane_alpha(ch, None), orientation), mode="L")
+        else:
+            img = _tint_alpha(orient_plane(_plane_alpha(ch, idx), orientation), idx)
 
-            # Rotate if needed
-            if k:
-                plane = np.rot90(plane, k=k, axes=(-2, -1))
+        # Save
+        path = save_slice(img, os.path.join(output_dir, f"{base}_channel{idx}"))
+        out_names.append(os.path.basename(path))
 
-            # Normalize
-            f = plane.astype(np.float32)
-            f -= f.min()
-            span = np.ptp(f) or 1.0
-            f /= span
+        # Deep Zoom pyramid, served by /tiles/ for the tilescans viewer
+        if TILE_SIZE:
+            tiles = write_tile_pyramid(img, os.path.join(output_dir, 'tiles'), f"{base}_channel{idx}")
+            out_names.extend(os.path.join('tiles', t) for t in tiles)
 
-            # Threshold
-            f = _apply_threshold(f, c+1)
+    return out_names
 
-            # To uint8
-            p8 = (f * 255).astype(np.uint8)
+def detail_luts(value_ranges: dict, dtype) -> dict:
+    """Stack-wide alpha LUT per channel for the raw detailed slices."""
+    size = np.iinfo(dtype).max + 1
+    return {c: _alpha_lut(lo, hi, None, size) for c, (lo, hi) in value_ranges.items()}
 
-            # Tint RGBA
-            color = CHANNEL_COLORS[c+1]
-            img = Image.new("RGBA", p8.shape[::-1], color + (0,))
-            alpha = Image.fromarray(p8, mode="L")
-            img.putalpha(alpha)
+def detail_alpha(plane: np.ndarray, lut=None) -> np.ndarray:
+    """One raw (Y, X) plane as the uint8 values of a detailed slice."""
+    if lut is not None:
+        return lut[plane]
+    # Per-plane (v - lo) / (hi - lo), the same scaling the stack-wide LUTs use
+    return _plane_alpha(plane, None)
 
-            # Save slice
-            img.save(os.path.join(ch_dir, f"slice{z}.png"))
+def render_detail_plane(plane: np.ndarray, lut=None) -> Image.Image:
+    """One raw (Y, X) plane as the grayscale slice process_detailed_czi writes."""
+    return Image.fromarray(detail_alpha(plane, lut))
 
-    return channels, zcount
-# in czi_utils.py
+def process_detailed_czi(filename, output_dir, planes=None, value_ranges=None):
+    """Write one PNG per (Z,C) plane; ``planes`` limits it to those (z, c) indices.
 
+    With DEDUPE_SLICES, planes that are blank (all zero) are not written;
+    with CROP_SLICES, each slice is cropped to its content's bounding box.
+    Returns ``{slice name: {'frame': [W, H], 'offset': [x, y]}}``: the
+    slice is the part of the W x H frame at x, y.
 
-def process_detailed_czi(filename, output_dir):
-    czi = CziFile(filename)
-    arr = np.squeeze(czi.asarray())  # e.g. (Z,C,Y,X)
-    if arr.ndim != 4:
-        raise ValueError("Expected 4D (Z,C,Y,X), got %s" % (arr.shape,))
-    Z, C, H, W = arr.shape
+    With STACK_NORMALIZATION == 'stack' every channel is scaled by one range
+    over the whole stack; pass ``value_ranges`` (channel -> (lo, hi)) when it
+    was already computed, e.g. once for all chunks of a parallel build.
+    """
+    with CziPlaneReader(filename) as reader:  # planes decoded one at a time
+        if len(reader.shape) != 2:
+            raise ValueError("Expected 4D (Z,C,Y,X), got %s" % (reader.shape + reader.plane_shape,))
+        if planes is None:
+            planes = np.ndindex(*reader.shape)
 
-    os.makedirs(output_dir, exist_ok=True)
-    for z in range(Z):
-        for c in range(C):
-            plane = arr[z, c, :, :].astype(np.float32)
-            plane = (plane/plane.max()*255).astype(np.uint8)
-            img = Image.fromarray(plane)
-            name = os.path.basename(filename).replace('.czi','')
-            out = os.path.join(output_dir,
-                 f"{name}_z{z+1}_ch{c+1}.png")
-            img.save(out)
+        luts = {}
+        if STACK_NORMALIZATION == 'stack':
+            if value_ranges is None:
+                value_ranges = stack_value_ranges(reader, channel_axis=1)
+            luts = detail_luts(value_ranges, reader.dtype)
 
+        os.makedirs(output_dir, exist_ok=True)
+        name = os.path.basename(filename).replace('.czi','')
+        out_names = {}
+        for z, c in planes:
+            img = render_detail_plane(reader.read(z, c), luts.get(c))
+            frame, bbox = list(img.size), img.getbbox()
+            if DEDUPE_SLICES and bbox is None:
+                continue   # blank: nothing to show at any threshold
+            offset = [0, 0]
+            if CROP_SLICES and bbox is not None:
+                img, offset = img.crop(bbox), list(bbox[:2])
+            path = save_slice(img, os.path.join(output_dir, f"{name}_z{z+1}_ch{c+1}"))
+            out_names[os.path.basename(path)] = {'frame': frame, 'offset': offset}
+    return out_names
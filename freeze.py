@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Export the site as plain files ("freeze") for any static host.
+
+Requests every route through the Flask test client and writes the responses
+under the output directory:
+- the pages: /, /overview, /tilescans and every /week/<n>, plus any page
+  they link to;
+- every file under static/ at /static/..., and under its fingerprinted
+  /assets/<digest>/... URL;
+- /assets/manifest.json, /api/catalog, the Deep Zoom tiles (/tiles/...), the Z-stack
+  bundles (/stack/...) and the CZI/TIF downloads (/download/...).
+
+The pages link the current fingerprints: the asset manifest is rebuilt into
+the output directory (.asset_manifest.json, reusing the hashes of unchanged
+files from static/'s) and the export reads that one; static/ is left as is.
+Files are hard-linked from static/ where possible (--copy to copy them):
+the app runs with X-Sendfile on, so every file route only names the file
+it would send. Pages become <path>/index.html. Live slices and server-side
+composites need Python, so they are switched off in the export.
+
+    python freeze.py                    # -> site/
+    python freeze.py -o /srv/bleo --no-downloads
+"""
+
+import argparse
+import os
+import re
+import shutil
+import sys
+from urllib.parse import unquote, urlsplit
+
+import asset_manifest
+from app import app, ASSETS, CATALOG
+
+LINK_ATTR = re.compile(r'''(?:href|src|data-src|data-dzi)=["'](/(?!/)[^"'#?]*)''')
+PAGES = ['/', '/overview', '/tilescans']
+
+def static_urls(static_dir):
+    """/static/, /assets/, /tiles/ and /stack/ URLs for the files on disk."""
+    ASSETS.reload()
+    for rel, _ in asset_manifest.walk_assets(static_dir):
+        yield f'/static/{rel}'
+        digest = ASSETS.digest(rel)
+        if digest:
+            yield f'/assets/{digest}/{rel}'
+        if rel.startswith('processed/tiles/'):
+            yield '/tiles/' + rel[len('processed/tiles/'):]
+        bundle = re.match(r'processed_detailed/week(\d+)/(?:([^/]+)/)?week\1(?:_\2)?_ch(\d+)\.(bundle|json)$', rel)
+        if bundle:
+            week, section, chan, kind = bundle.groups()
+            yield f'/stack/week{week}/{section or "week" + week}/ch{chan}.{kind}'
+    yield '/assets/manifest.json'
+    yield '/api/catalog'
+
+def download_urls():
+    """The download routes for every CZI/TIF the app can send."""
+    CATALOG.rebuild()
+    for entry in CATALOG.downloads.values():
+        yield entry['url']
+
+def week_pages():
+    for week, entry in CATALOG.data['weeks'].items():
+        if entry['page']:
+            yield f'/week/{week}'
+
+def target_path(out_dir, url, is_page):
+    parts = [p for p in unquote(url).split('/') if p]
+    if any(p in ('.', '..') for p in parts):
+        raise ValueError(f"Unsafe URL {url!r}")
+    if is_page:
+        parts.append('index.html')
+    return os.path.join(out_dir, *parts)
+
+def place_file(src, dst, copy):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if not copy:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:   # other filesystem, or links not supported
+            pass
+    shutil.copy2(src, dst)
+
+def freeze(out_dir, copy=False, downloads=True):
+    static_dir = app.static_folder
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, '.asset_manifest.json')
+    asset_manifest.build(static_dir, manifest_path, reuse=ASSETS.path)
+    ASSETS.path = manifest_path   # pages link the current fingerprints
+    app.config.update(USE_X_SENDFILE=True, DOWNLOAD_OFFLOAD='x-sendfile',
+                      LIVE_SLICES=False, COMPOSITE_SLICES=False)
+    client = app.test_client()
+
+    queue = PAGES + list(week_pages()) + list(static_urls(static_dir))
+    if downloads:
+        queue += list(download_urls())
+    seen, stats = set(), {'pages': 0, 'files': 0, 'missing': []}
+    while queue:
+        url = queue.pop(0)
+        if url in seen:
+            continue
+        seen.add(url)
+        resp = client.get(url)
+        if resp.status_code != 200:
+            stats['missing'].append(f"{url} ({resp.status_code})")
+            continue
+
+        sendfile = resp.headers.get('X-Sendfile')
+        is_page = resp.mimetype == 'text/html' and not sendfile
+        dst = target_path(out_dir, url, is_page)
+        if sendfile:
+            place_file(sendfile, dst, copy)
+            stats['files'] += 1
+        else:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            with open(dst, 'wb') as fh:
+                fh.write(resp.get_data())
+            stats['files' if not is_page else 'pages'] += 1
+        if is_page:
+            # Crawl the pages it links to (/overview, /tilescans, ...)
+            for link in LINK_ATTR.findall(resp.get_data(as_text=True)):
+                path = urlsplit(link).path
+                if path not in seen and not path.startswith(('/static/', '/assets/', '/download/')):
+                    queue.append(path)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', default='site', help="output directory (default: %(default)s)")
+    parser.add_argument('--copy', action='store_true', help="copy files instead of hard-linking them")
+    parser.add_argument('--no-downloads', action='store_true', help="leave out the CZI/TIF downloads")
+    args = parser.parse_args()
+
+    stats = freeze(args.output, copy=args.copy, downloads=not args.no_downloads)
+    for url in stats['missing']:
+        print(f"  [SKIPPED] {url}")
+    print(f"{args.output}: {stats['pages']} pages, {stats['files']} files, {len(stats['missing'])} skipped")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Lossless size optimization of the processed slice PNGs.
+
+Every PNG is re-encoded in the smallest form that decodes to the same
+pixels:
+- a palette with tRNS when it has at most 256 distinct RGBA values;
+- otherwise L, LA or RGB when the data allows it.
+Only 8-bit (or narrower) images are handled; 16-bit and float PNGs are left
+as they are.
+
+Detailed slices and --gray flat channels are 8-bit L and stay L; on them
+the gain is the filter choice. A tinted flat channel (one color, varying
+alpha) becomes an 8-bit palette indexed by alpha. The image is filtered with
+each PNG filter and with per-row adaptive filtering, and the candidate that
+deflates smallest is kept. A file is only replaced when the result is
+smaller and decodes back to identical pixels.
+
+czi_utils writes slices up to OPTIMIZE_PNG_MAX_PIXELS through encode_png
+already (OPTIMIZE_PNG), so this pass is for the existing corpus and the
+full-resolution flat overviews:
+
+    python png_optimize.py -j 8                    # the three slice directories
+    python png_optimize.py static/processed_detailed/week1 --dry-run
+"""
+
+import argparse
+import io
+import os
+import struct
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+SLICE_DIRS = [
+    os.path.join('static', 'processed_detailed'),
+    os.path.join('static', 'vessel_processed_detailed'),
+    os.path.join('static', 'overview_processed_detailed'),
+]
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+COLOR_TYPES = {'L': 0, 'RGB': 2, 'P': 3, 'LA': 4, 'RGBA': 6}
+
+# Modes whose pixels convert to RGBA without loss; wider ones (I;16, I, F) would be cut to 8 bits
+REDUCIBLE_MODES = ('1', 'L', 'P', 'LA', 'RGB', 'RGBA')
+ZLIB_LEVEL = 9
+
+# Filter candidates are ranked by a fast deflate, which orders them like level 9
+# does, and only the winner is compressed at the requested level
+RANK_LEVEL = 1
+
+def reduce_pixels(img: Image.Image):
+    """Smallest lossless PNG layout of ``img``: (mode, (H, W[, bands]) uint8, palette RGBA or None).
+
+    Raises ValueError for modes outside REDUCIBLE_MODES.
+    """
+    if img.mode not in REDUCIBLE_MODES:
+        raise ValueError(f"No lossless 8-bit layout for mode {img.mode}")
+    if img.mode == 'L':
+        return 'L', np.asarray(img), None
+    rgba = np.ascontiguousarray(np.asarray(img.convert('RGBA')))
+    opaque = bool((rgba[..., 3] == 255).all())
+    gray = bool((rgba[..., 0] == rgba[..., 1]).all() and (rgba[..., 1] == rgba[..., 2]).all())
+    if gray and opaque:
+        return 'L', rgba[..., 0], None
+
+    # Packed little-endian RGBA sorts by alpha first, so a tinted slice's
+    # palette index follows its alpha and filters as well as the alpha itself
+    packed = rgba.view('<u4')[..., 0]
+    colors, index = np.unique(packed, return_inverse=True)
+    if colors.size <= 256:
+        palette = colors.astype('<u4').view(np.uint8).reshape(-1, 4)
+        return 'P', index.reshape(packed.shape).astype(np.uint8), palette
+    if gray:
+        return 'LA', rgba[..., [0, 3]], None
+    if opaque:
+        return 'RGB', rgba[..., :3], None
+    return 'RGBA', rgba, None
+
+def _low_byte(f: np.ndarray) -> np.ndarray:
+    return (f & 0xFF).astype(np.uint8)
+
+def filter_scanlines(raw: np.ndarray, bpp: int):
+    """The (H, 1 + W*bpp) filtered scanlines for each PNG filter 0-4, plus per-row adaptive."""
+    h = raw.astype(np.int16)
+    left = np.zeros_like(h)
+    left[:, bpp:] = h[:, :-bpp]
+    up = np.zeros_like(h)
+    up[1:] = h[:-1]
+    up_left = np.zeros_like(h)
+    up_left[1:, bpp:] = h[:-1, :-bpp]
+
+    # Each filter is cut to bytes as soon as it is computed, and the int16
+    # temporaries are dropped before the candidates are assembled
+    filtered = [raw, _low_byte(h - left), _low_byte(h - up), _low_byte(h - ((left + up) >> 1))]
+    p = left + up - up_left
+    pa, pb, pc = np.abs(p - left), np.abs(p - up), np.abs(p - up_left)
+    del p
+    paeth = np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, up_left))
+    del pa, pb, pc, left, up, up_left
+    filtered.append(_low_byte(h - paeth))
+    del h, paeth
+
+    # Adaptive: per row, the filter with the smallest sum of absolute (signed) residuals
+    costs = np.stack([np.abs(f.view(np.int8).astype(np.int32)).sum(axis=1) for f in filtered])
+    best = costs.argmin(axis=0)
+    adaptive = np.choose(best[:, None], filtered)
+
+    rows = np.arange(raw.shape[0])
+    out = []
+    for ftype, f in enumerate(filtered):
+        out.append(np.hstack([np.full((raw.shape[0], 1), ftype, np.uint8), f]))
+    out.append(np.hstack([best.astype(np.uint8)[rows, None], adaptive]))
+    return out
+
+def _chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+def encode_png(img: Image.Image, level: int = ZLIB_LEVEL) -> bytes:
+    """``img`` as the smallest PNG over the reduced layout and every filter choice."""
+    mode, pixels, palette = reduce_pixels(img)
+    height, width = pixels.shape[:2]
+    bpp = 1 if pixels.ndim == 2 else pixels.shape[2]
+    raw = pixels.reshape(height, width * bpp)
+
+    # The scanline arrays are contiguous, so zlib reads them without a bytes copy
+    candidates = filter_scanlines(raw, bpp)
+    best = min(candidates, key=lambda lines: len(zlib.compress(lines, RANK_LEVEL)))
+    del candidates
+    idat = zlib.compress(best, level)
+
+    chunks = [_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, COLOR_TYPES[mode], 0, 0, 0))]
+    if palette is not None:
+        chunks.append(_chunk(b'PLTE', palette[:, :3].tobytes()))
+        alpha = palette[:, 3]
+        opaque_tail = len(alpha) - len(np.trim_zeros(alpha != 255, 'b'))
+        if opaque_tail < len(alpha):
+            # tRNS may stop before the trailing fully opaque entries
+            chunks.append(_chunk(b'tRNS', alpha[:len(alpha) - opaque_tail].tobytes()))
+    chunks.append(_chunk(b'IDAT', idat))
+    chunks.append(_chunk(b'IEND', b''))
+    return PNG_SIGNATURE + b''.join(chunks)
+
+def same_pixels(a: Image.Image, b: Image.Image) -> bool:
+    """True if ``b`` decodes to exactly the pixels of ``a``; wide modes are compared as they are."""
+    if a.size != b.size:
+        return False
+    if a.mode == b.mode and a.mode != 'P':
+        return np.array_equal(np.asarray(a), np.asarray(b))
+    if a.mode not in REDUCIBLE_MODES or b.mode not in REDUCIBLE_MODES:
+        return False   # converting would drop the bits that differ
+    return np.array_equal(np.asarray(a.convert('RGBA')), np.asarray(b.convert('RGBA')))
+
+def optimize_file(path: str, dry_run: bool = False, level: int = ZLIB_LEVEL):
+    """(bytes before, bytes after) for one PNG, rewritten in place unless ``dry_run``.
+
+    Files that don't decode (git-lfs pointers), 16-bit or float ones and those
+    that wouldn't shrink are left alone.
+    """
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.load()
+            if img.mode not in REDUCIBLE_MODES:
+                return len(data), len(data)
+            out = encode_png(img, level)
+            if len(out) >= len(data):
+                return len(data), len(data)
+            with Image.open(io.BytesIO(out)) as check:
+                if not same_pixels(img, check):
+                    raise ValueError("re-encoded pixels differ")
+    except OSError:
+        return len(data), len(data)
+    if not dry_run:
+        st = os.stat(path)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as fh:
+            fh.write(out)
+        os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(tmp, path)
+    return len(data), len(out)
+
+def collect(paths):
+    """(directory as given, PNG path) for every *.png under ``paths``."""
+    for top in paths:
+        if os.path.isfile(top):
+            yield os.path.dirname(top) or '.', top
+            continue
+        for root, dirs, files in os.walk(top):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith('.png'):
+                    yield top, os.path.join(root, name)
+
+def run(files, workers: int, dry_run: bool, level: int):
+    """Yield (top, path, (before, after) or the exception) per file."""
+    if workers > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(top, path, pool.submit(optimize_file, path, dry_run, level)) for top, path in files]
+            for top, path, future in futures:
+                try:
+                    yield top, path, future.result()
+                except Exception as e:
+                    yield top, path, e
+        return
+    for top, path in files:
+        try:
+            yield top, path, optimize_file(path, dry_run, level)
+        except Exception as e:
+            yield top, path, e
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', default=SLICE_DIRS,
+                        help="PNG files or directories (default: the three slice directories)")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="worker processes (0 = all cores)")
+    parser.add_argument('--level', type=int, choices=range(1, 10), default=ZLIB_LEVEL, metavar='1-9',
+                        help="deflate level of the kept candidate (default: %(default)s)")
+    parser.add_argument('--dry-run', action='store_true', help="report the savings without rewriting")
+    args = parser.parse_args(argv)
+
+    files = list(collect(p for p in args.paths if os.path.exists(p)))
+    if not files:
+        print("No PNGs found")
+        return 1
+
+    totals, failed = {}, 0
+    for top, path, result in run(files, args.jobs or os.cpu_count() or 1, args.dry_run, args.level):
+        if isinstance(result, Exception):
+            print(f"  [ERROR] {path}: {result}")
+            failed += 1
+            continue
+        entry = totals.setdefault(top, [0, 0, 0, 0])   # files, smaller, before, after
+        entry[0] += 1
+        entry[1] += result[1] < result[0]
+        entry[2] += result[0]
+        entry[3] += result[1]
+
+    verb = "would save" if args.dry_run else "saved"
+    for top, (count, smaller, before, after) in totals.items():
+        saved = before - after
+        print(f"{top}: {smaller}/{count} files smaller, {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB, "
+              f"{verb} {saved / 1e6:.1f} MB ({100 * saved / (before or 1):.1f}%)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,10 @@
 # preprocess.py
 
 import os
+import sys
 from czi_utils import process_czi, process_detailed_czi
+from batch_preprocess import pack_stack, stack_ranges
+from build_manifest import BuildManifest, processing_params
 
 ROOT                   = os.path.dirname(os.path.abspath(__file__))
 STATIC                 = os.path.join(ROOT, 'static')
@@ -14,26 +17,58 @@ PROCESSED_DIR          = os.path.join(STATIC, 'processed')
 DETAILED_CZI_DIR       = os.path.join(STATIC, 'czi_images_detailed')
 PROCESSED_DETAILED_DIR = os.path.join(STATIC, 'processed_detailed')
 
+# Inputs whose hash and parameters match the manifest are skipped (--force rebuilds all)
+MANIFEST               = BuildManifest(os.path.join(STATIC, '.build_manifest.json'))
+PARAMS                 = processing_params()
+FORCE                  = '--force' in sys.argv[1:]
+
 # Make sure output dirs exist
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 os.makedirs(PROCESSED_DETAILED_DIR, exist_ok=True)
 
-# 1) Re‐process single‐layer CZI → processed/*.png
-print("=== Reprocessing single‐layer CZI files ===")
-for fn in sorted(os.listdir(CZI_DIR)):
-    if not fn.lower().endswith('.czi'):
-        continue
-    src = os.path.join(CZI_DIR, fn)
-    print(f"[PROCESSING] single‐layer: {fn}")
-    process_czi(src, PROCESSED_DIR)
-
-# 2) Re‐process detailed multi‐Z CZI → processed_detailed/<week>/...
-print("\n=== Reprocessing multi‐Z CZI files ===")
-for fn in sorted(os.listdir(DETAILED_CZI_DIR)):
-    if not fn.lower().endswith('.czi'):
-        continue
-    src = os.path.join(DETAILED_CZI_DIR, fn)
-    print(f"[PROCESSING] multi‐Z: {fn}")
-    process_detailed_czi(src, PROCESSED_DETAILED_DIR)
+def needs_build(src, kind):
+    digest = MANIFEST.digest(src)
+    if not FORCE and MANIFEST.is_fresh(src, kind, digest, PARAMS):
+        print(f"[UP TO DATE] {os.path.basename(src)}")
+        return None
+    return digest
+
+try:
+    # 1) Re‐process single‐layer CZI → processed/*.png
+    print("=== Reprocessing single‐layer CZI files ===")
+    for fn in sorted(os.listdir(CZI_DIR)):
+        if not fn.lower().endswith('.czi'):
+            continue
+        src = os.path.join(CZI_DIR, fn)
+        digest = needs_build(src, 'flat')
+        if digest is None:
+            continue
+        print(f"[PROCESSING] single‐layer: {fn}")
+        names = process_czi(src, PROCESSED_DIR)
+        MANIFEST.record(src, 'flat', digest, PARAMS,
+                        [os.path.join(PROCESSED_DIR, n) for n in names])
+
+    # 2) Re‐process detailed multi‐Z CZI → processed_detailed/<week>/...
+    print("\n=== Reprocessing multi‐Z CZI files ===")
+    for fn in sorted(os.listdir(DETAILED_CZI_DIR)):
+        if not fn.lower().endswith('.czi'):
+            continue
+        src = os.path.join(DETAILED_CZI_DIR, fn)
+        digest = needs_build(src, 'detail')
+        if digest is None:
+            continue
+        print(f"[PROCESSING] multi‐Z: {fn}")
+        # Ranges and crop sidecars, then bundles or deduplicated objects, as batch_preprocess.py writes them
+        ranges = stack_ranges(src)
+        slices = process_detailed_czi(src, PROCESSED_DETAILED_DIR, value_ranges=ranges)
+        names = pack_stack(PROCESSED_DETAILED_DIR, slices, src, ranges)
+        MANIFEST.record(src, 'detail', digest, PARAMS,
+                        [os.path.join(PROCESSED_DETAILED_DIR, n) for n in names])
+
+    # 3) Drop outputs of CZIs that were deleted
+    for out in MANIFEST.prune():
+        print(f"[PRUNED] {out}")
+finally:
+    MANIFEST.save()
 
 print("\n✅ All done!")
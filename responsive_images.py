@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Width-stepped variants of the images the overview pages show in cards:
+week thumbnails, flat channels, heatmaps and the merged 3D renders. The
+pages list them in srcset (app.py responsive_img()), so a phone showing a
+240px card downloads a 320px image instead of the full-size one.
+
+For every file matching SOURCES, a copy at each of WIDTHS narrower than the
+source is written to static/variants/<dir>/<stem>_<width>w<ext>, encoded
+like the slices (czi_utils.encode_slice). The manifest
+(static/.image_variants.json) maps each source, relative to static/, to its
+width and variants. Sources whose size and mtime are unchanged are skipped,
+and variants of removed sources are deleted. Files that don't decode
+(git-lfs pointers) get no variants. batch_preprocess.py rebuilds it after
+every run.
+
+    python responsive_images.py
+    python responsive_images.py --force
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from PIL import Image
+
+import czi_utils
+
+STATIC            = 'static'
+VARIANT_MANIFEST  = os.path.join(STATIC, '.image_variants.json')
+VARIANT_DIR       = 'variants'
+VARIANT_VERSION   = 1
+
+# Widths offered in srcset next to the original
+WIDTHS = (320, 640, 1280)
+
+# Seconds between checks of the manifest's mtime by refresh()
+CHECK_INTERVAL = 2.0
+
+# Images shown in cards, relative to static/
+SOURCES = (
+    'thumbnails/week*.*',
+    'processed/week*_channel*.*',
+    'heatmaps/*.*',
+    '3d_images/**/merged.png',
+    'overview/*/merged.png',
+    'vessel/**/merged.png',
+)
+
+def _formats() -> dict:
+    """Extension -> czi_utils encoder format."""
+    return {ext: fmt for fmt, (ext, _, _) in czi_utils.ENCODERS.items()}
+
+def sources(static_dir: str = STATIC):
+    """Sorted paths (relative to ``static_dir``, '/'-separated) of the images to make variants of."""
+    formats = _formats()
+    found = set()
+    for pattern in SOURCES:
+        for path in glob.glob(os.path.join(static_dir, pattern), recursive=True):
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in formats:
+                found.add(os.path.relpath(path, static_dir).replace(os.sep, '/'))
+    return sorted(found)
+
+def variant_name(rel: str, width: int) -> str:
+    stem, ext = os.path.splitext(rel)
+    return f"{VARIANT_DIR}/{stem}_{width}w{ext}"
+
+def make_variants(static_dir: str, rel: str, widths=WIDTHS):
+    """Write the variants of ``rel``; returns (source width, {width: variant path}) or None if it doesn't decode."""
+    fmt = _formats()[os.path.splitext(rel)[1].lower()]
+    try:
+        with Image.open(os.path.join(static_dir, rel)) as img:
+            img.load()
+    except OSError:   # e.g. a git-lfs pointer
+        return None
+    width, height = img.size
+    variants = {}
+    for w in sorted(widths):
+        if w >= width:
+            break
+        resized = img.resize((w, max(1, round(height * w / width))), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        name = variant_name(rel, w)
+        path = os.path.join(static_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as fh:
+            fh.write(czi_utils.encode_slice(resized, fmt))
+        os.replace(path + '.tmp', path)
+        variants[str(w)] = name
+    return width, variants
+
+def build(static_dir: str = STATIC, manifest_path: str = VARIANT_MANIFEST, force: bool = False) -> dict:
+    """Rebuild the variants of new or changed sources; returns counts of built, reused and removed entries."""
+    old = ImageVariants(manifest_path).entries
+    entries, stats = {}, {'built': 0, 'reused': 0, 'removed': 0}
+    for rel in sources(static_dir):
+        st = os.stat(os.path.join(static_dir, rel))
+        entry = old.get(rel)
+        if (not force and entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns
+                and all(os.path.isfile(os.path.join(static_dir, v)) for v in entry['variants'].values())):
+            stats['reused'] += 1
+        else:
+            made = make_variants(static_dir, rel)
+            width, variants = made if made else (None, {})
+            entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'width': width, 'variants': variants}
+            stats['built'] += 1
+        entries[rel] = entry
+
+    # Variants nothing refers to any more
+    live = {v for entry in entries.values() for v in entry['variants'].values()}
+    for entry in old.values():
+        for name in entry['variants'].values():
+            path = os.path.join(static_dir, name)
+            if name not in live and os.path.isfile(path):
+                os.remove(path)
+    stats['removed'] = len(set(old) - set(entries))
+
+    tmp = manifest_path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump({'version': VARIANT_VERSION, 'images': entries}, fh, indent=1, sort_keys=True)
+    os.replace(tmp, manifest_path)
+    return stats
+
+class ImageVariants:
+    """Read side of the variant manifest, reloaded when the file changes on disk."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        self._mtime_ns = None
+        self._checked = 0.0
+        self.reload()
+
+    def refresh(self):
+        """reload(), checked at most every CHECK_INTERVAL seconds; for callers on every request or URL."""
+        if time.monotonic() - self._checked >= CHECK_INTERVAL:
+            self.reload()
+
+    def reload(self):
+        self._checked = time.monotonic()
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except OSError:
+            self.entries, self._mtime_ns = {}, None
+            return
+        if mtime_ns == self._mtime_ns:
+            return
+        with open(self.path, encoding='utf-8') as fh:
+            data = json.load(fh)
+        self.entries = data.get('images', {}) if data.get('version') == VARIANT_VERSION else {}
+        self._mtime_ns = mtime_ns
+
+    def srcset(self, filename: str) -> list:
+        """(path, width) of every variant of ``filename`` and the original, narrowest first; [] without variants."""
+        entry = self.entries.get(filename)
+        if not entry or not entry['variants']:
+            return []
+        variants = sorted((int(w), name) for w, name in entry['variants'].items())
+        return [(name, w) for w, name in variants] + [(filename, entry['width'])]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--force', action='store_true', help="rebuild every variant")
+    args = parser.parse_args(argv)
+    stats = build(force=args.force)
+    print(f"{VARIANT_MANIFEST}: {stats['built']} built, {stats['reused']} unchanged, {stats['removed']} removed")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
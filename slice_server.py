@@ -0,0 +1,375 @@
+# slice_server.py
+
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+import czi_utils
+from catalog import VESSEL_CODES
+
+def _nbytes(value) -> int:
+    return value.nbytes if isinstance(value, np.ndarray) else len(value)
+
+class LRUCache:
+    """Thread-safe LRU of encoded slices (or decoded planes), bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if _nbytes(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= _nbytes(old)
+            self._items[key] = value
+            self.size += _nbytes(value)
+            while self.size > self.max_bytes:
+                _, dropped = self._items.popitem(last=False)
+                self.size -= _nbytes(dropped)
+
+class CziStack:
+    """One detailed CZI kept open with its per-plane subblock index.
+
+    Reads share the file handle, so they are serialized; normalizing and
+    encoding happen outside the lock. With stack normalization the
+    per-channel ranges come from the ``<stem>.ranges.json`` the batch run
+    wrote (``ranges_path``); without one (or if it is older than the CZI)
+    luts() computes them once, through a reader of its own rather than
+    under the read lock.
+    """
+
+    def __init__(self, path: str, ranges_path: str = None):
+        self.path = path
+        self.reader = czi_utils.CziPlaneReader(path)
+        if len(self.reader.shape) != 2:
+            self.reader.close()
+            raise ValueError("Expected 4D (Z,C,Y,X), got %s" % (self.reader.shape + self.reader.plane_shape,))
+        self.zcount, self.channels = self.reader.shape
+        self._lock = threading.Lock()
+        self._luts_lock = threading.Lock()
+        self._luts = None
+        if czi_utils.STACK_NORMALIZATION == 'stack' and ranges_path:
+            try:
+                if os.path.getmtime(ranges_path) >= os.path.getmtime(path):
+                    self._luts = czi_utils.detail_luts(czi_utils.read_value_ranges(ranges_path),
+                                                       self.reader.dtype)
+            except (OSError, ValueError):
+                pass
+
+    def luts(self) -> dict:
+        if czi_utils.STACK_NORMALIZATION != 'stack':
+            return {}
+        if self._luts is None:
+            with self._luts_lock:
+                if self._luts is None:
+                    with czi_utils.CziPlaneReader(self.path) as reader:
+                        ranges = czi_utils.stack_value_ranges(reader, channel_axis=1)
+                    self._luts = czi_utils.detail_luts(ranges, self.reader.dtype)
+        return self._luts
+
+    def alpha(self, z: int, c: int) -> np.ndarray:
+        """uint8 slice values for 0-based ``z``/``c``, as process_detailed_czi renders them."""
+        luts = self.luts()
+        with self._lock:
+            plane = self.reader.read(z, c)
+        return czi_utils.detail_alpha(plane, luts.get(c))
+
+    def render(self, z: int, c: int, fmt: str = None, preset: str = None) -> bytes:
+        """Encoded slice for 0-based ``z``/``c``, identical to what process_detailed_czi writes."""
+        return czi_utils.encode_slice(Image.fromarray(self.alpha(z, c)), fmt, preset)
+
+    def close(self):
+        self.reader.close()
+
+class SliceServer:
+    """On-demand Z-slices straight from ``static/czi_images_detailed``.
+
+    Every CZI is opened once at startup so its subblock directory is indexed
+    up front and random (z, c) access never rescans the file. Rendered slices
+    are kept in an LRU bounded by ``cache_bytes``. Sections follow the
+    download routes: ``week0/week0.czi`` is section ``week0``, otherwise
+    ``week<w>/<section>/week<w>_<section>.czi``; vessel sections are also
+    reachable under their page name (``HV`` as ``healthy-venule``). Stack
+    ranges are read from the same place under ``ranges_root`` (the batch
+    run's processed_detailed).
+    """
+
+    def __init__(self, root: str, cache_bytes: int, fmt: str = None, preset: str = None,
+                 ranges_root: str = None):
+        self.fmt, self.preset = fmt, preset
+        self.cache = LRUCache(cache_bytes)
+        self.stacks = {}
+        self.errors = {}
+        for key, path in self._sources(root):
+            ranges_path = None
+            if ranges_root:
+                ranges_path = os.path.join(ranges_root, os.path.relpath(path, root))[:-len('.czi')] + '.ranges.json'
+            try:
+                self.stacks[key] = CziStack(path, ranges_path)
+            except Exception as e:   # e.g. git-lfs pointers, 2D files
+                self.errors[key] = f"{path}: {e}"
+        for (w, section), stack in list(self.stacks.items()):
+            for name, code in VESSEL_CODES.items():
+                if section == code:
+                    self.stacks[(w, name.replace('_', '-'))] = stack
+        # Stacks without a ranges sidecar: scan them in the background, not on a request
+        missing = [stack for stack in set(self.stacks.values()) if stack._luts is None]
+        if missing and czi_utils.STACK_NORMALIZATION == 'stack':
+            threading.Thread(target=self._scan, args=(missing,), daemon=True).start()
+
+    @staticmethod
+    def _scan(stacks):
+        for stack in stacks:
+            try:
+                stack.luts()
+            except Exception:   # the request that needs it raises again
+                pass
+
+    @staticmethod
+    def _sources(root):
+        if not os.path.isdir(root):
+            return
+        for week in sorted(os.listdir(root)):
+            week_dir = os.path.join(root, week)
+            if not (week.startswith('week') and week[4:].isdigit() and os.path.isdir(week_dir)):
+                continue
+            w = int(week[4:])
+            flat = os.path.join(week_dir, f'{week}.czi')
+            if os.path.isfile(flat):
+                yield (w, week), flat
+            for section in sorted(os.listdir(week_dir)):
+                path = os.path.join(week_dir, section, f'{week}_{section}.czi')
+                if os.path.isfile(path):
+                    yield (w, section), path
+
+    def _stack(self, week, section, z, chan):
+        stack = self.stacks.get((week, section))
+        if stack is None or not (1 <= z <= stack.zcount and 1 <= chan <= stack.channels):
+            return None
+        return stack
+
+    def alpha(self, week: int, section: str, z: int, chan: int):
+        """uint8 slice values for 1-based ``z``/``chan``, or None if there is no such plane."""
+        stack = self._stack(week, section, z, chan)
+        return None if stack is None else stack.alpha(z - 1, chan - 1)
+
+    def render(self, week: int, section: str, z: int, chan: int):
+        """Encoded slice for 1-based ``z``/``chan``, or None if there is no such plane."""
+        stack = self._stack(week, section, z, chan)
+        if stack is None:
+            return None
+        key = (week, section, z, chan, self.fmt, self.preset)
+        data = self.cache.get(key)
+        if data is None:
+            data = stack.render(z - 1, chan - 1, self.fmt, self.preset)
+            self.cache.put(key, data)
+        return data
+
+class SliceFiles:
+    """Pre-rendered detailed slices under ``static/processed_detailed``.
+
+    Reads ``<stem>_z<z>_ch<c><ext>`` files, the slice out of the section's
+    ``<stem>_ch<c>.bundle`` when the stack was packed (--bundle), or its
+    object named by ``<stem>.slices.json`` when it was deduplicated. Decoded
+    objects are kept in an LRU bounded by ``cache_bytes``, so identical
+    slices are read and decoded once; a blank slice the pipeline skipped
+    reads as zeros. Slices cropped to their content are put back into
+    their full frame (``<stem>.crop.json``). Vessel sections (``healthy-venule``)
+    are read from ``vessel_root``, as ``week<w>/healthy_venule/week<w>_healthy_venule``.
+    """
+
+    def __init__(self, root: str, cache_bytes: int = 0, vessel_root: str = None):
+        self.root = root
+        self.vessel_root = vessel_root
+        self.objects = LRUCache(cache_bytes)
+        self._manifests = {}   # path -> (mtime_ns, parsed JSON): slice manifests, crop sidecars, bundle indexes
+
+    def _manifest(self, path):
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        cached = self._manifests.get(path)
+        if cached is None or cached[0] != mtime_ns:
+            with open(path, encoding='utf-8') as fh:
+                cached = (mtime_ns, json.load(fh))
+            self._manifests[path] = cached
+        return cached[1]
+
+    def _object(self, folder, manifest, digest):
+        key = (folder, digest)
+        alpha = self.objects.get(key)
+        if alpha is None:
+            try:
+                with Image.open(os.path.join(folder, manifest['objects'], digest + manifest['ext'])) as img:
+                    alpha = np.asarray(img.convert('L'))
+            except OSError:   # missing, or not decodable
+                return None
+            self.objects.put(key, alpha)
+        return alpha
+
+    def _stem(self, week, section):
+        """(root, path stem) of a section's slices, or None."""
+        vessel = section.replace('-', '_')
+        if vessel in VESSEL_CODES:
+            if not self.vessel_root:
+                return None
+            return self.vessel_root, os.path.join(self.vessel_root, f'week{week}', vessel, f'week{week}_{vessel}')
+        if section == f'week{week}':
+            return self.root, os.path.join(self.root, f'week{week}', f'week{week}')
+        return self.root, os.path.join(self.root, f'week{week}', section, f'week{week}_{section}')
+
+    def alpha(self, week: int, section: str, z: int, chan: int):
+        located = self._stem(week, section)
+        if located is None:
+            return None
+        root, stem = located
+        if os.path.relpath(stem, root).startswith(os.pardir):
+            return None
+        alpha = self._slice(stem, z, chan)
+        crops = self._manifest(f'{stem}.crop.json')
+        if alpha is None or crops is None:
+            return alpha
+        width, height = crops['frame']
+        if alpha.shape == (height, width):
+            return alpha
+        offsets = crops['channels'].get(str(chan))
+        i = z - crops['z0']
+        x, y = (offsets[i] if offsets and 0 <= i < len(offsets) else None) or (0, 0)
+        frame = np.zeros((height, width), dtype=np.uint8)
+        frame[y:y + alpha.shape[0], x:x + alpha.shape[1]] = alpha
+        return frame
+
+    def _slice(self, stem, z, chan):
+        """The slice as stored (cropped or not), zeros for a skipped blank, or None."""
+        manifest = self._manifest(f'{stem}.slices.json')
+        if manifest is not None:
+            digests = manifest['channels'].get(str(chan))
+            i = z - manifest['z0']
+            if digests is None or not 0 <= i < len(digests):
+                return None
+            if digests[i] is None:
+                return np.zeros(manifest['size'][::-1], dtype=np.uint8)
+            return self._object(os.path.dirname(stem), manifest, digests[i])
+        index = self._manifest(f'{stem}_ch{chan}.json')
+        if index is not None:
+            i = z - index['z0']
+            offsets = index['offsets']
+            if not 0 <= i < len(offsets) - 1:
+                return None
+            if offsets[i] == offsets[i + 1]:
+                # Not written: a skipped blank when the stack's frame is known (crop sidecar)
+                crops = self._manifest(f'{stem}.crop.json')
+                return None if crops is None else np.zeros(crops['frame'][::-1], dtype=np.uint8)
+            with open(f'{stem}_ch{chan}.bundle', 'rb') as fh:
+                fh.seek(offsets[i])
+                source = io.BytesIO(fh.read(offsets[i + 1] - offsets[i]))
+        else:
+            for ext, _, _ in czi_utils.ENCODERS.values():
+                source = f'{stem}_z{z}_ch{chan}{ext}'
+                if os.path.isfile(source):
+                    break
+            else:
+                return None
+        try:
+            with Image.open(source) as img:
+                return np.asarray(img.convert('L'))
+        except OSError:   # not decodable, e.g. a git-lfs pointer
+            return None
+
+def threshold_lut(threshold: float) -> np.ndarray:
+    """Gray slice value -> alpha above ``threshold`` [0-1], as the viewers apply it before tinting (tintLut)."""
+    if threshold >= 1.0:
+        return np.zeros(256, dtype=np.uint8)
+    levels = np.arange(256, dtype=np.float32) / 255
+    levels -= threshold
+    levels /= 1.0 - threshold
+    np.maximum(levels, 0.0, out=levels)
+    levels *= 255
+    return levels.astype(np.uint8)
+
+def screen_composite(alphas: dict, colors: dict = None) -> np.ndarray:
+    """Tint channel -> uint8 alpha planes and screen them over black into one (Y, X, 3) uint8 image.
+
+    Matches stacking the tinted channels with ``mix-blend-mode: screen`` on
+    the viewers' black background: ``1 - prod(1 - color * alpha)`` per RGB
+    component. Each component is one float32 plane built from per-channel
+    lookups (alpha -> factor); channels with a zero component are skipped.
+    """
+    colors = colors or czi_utils.CHANNEL_COLORS
+    if not alphas:
+        raise ValueError("No channels to composite")
+    levels = np.arange(256, dtype=np.float32) / 255
+    out = np.zeros(next(iter(alphas.values())).shape + (3,), dtype=np.uint8)
+    for k in range(3):
+        remaining = None
+        for chan, alpha in alphas.items():
+            if not colors[chan][k]:
+                continue
+            factor = 1 - levels * np.float32(colors[chan][k] / 255)
+            if remaining is None:
+                remaining = factor[alpha]
+            else:
+                remaining *= factor[alpha]
+        if remaining is None:
+            continue
+        np.subtract(1, remaining, out=remaining)
+        remaining *= 255
+        remaining += 0.5
+        out[..., k] = remaining
+    return out
+
+class Compositor:
+    """Channel composites rendered server-side and kept in an LRU.
+
+    ``source`` provides ``alpha(week, section, z, chan)`` (a SliceServer
+    or SliceFiles), the gray slices; each channel is thresholded like the
+    per-channel view (CHANNEL_THRESHOLDS unless ``thresholds`` overrides
+    them) before tinting. Results are cached per (week, section, z,
+    channel set, thresholds); thresholds are rounded to 4 decimals, as the
+    viewers send them, so the defaults and the same slider values share entries.
+    """
+
+    def __init__(self, source, cache_bytes: int, fmt: str = None, preset: str = None):
+        self.source = source
+        self.fmt, self.preset = fmt, preset
+        self.cache = LRUCache(cache_bytes)
+
+    def render(self, week: int, section: str, z: int, chans, thresholds: dict = None) -> bytes:
+        """Encoded RGB composite of ``chans`` at 1-based ``z``, or None if any plane is missing.
+
+        ``thresholds`` maps a channel to its threshold [0-1]; unlisted channels use CHANNEL_THRESHOLDS.
+        """
+        thresholds = thresholds or {}
+        levels = tuple((chan, round(float(thresholds.get(chan, czi_utils.CHANNEL_THRESHOLDS.get(chan, 0.0))), 4))
+                       for chan in sorted(set(chans)))
+        key = (week, section, z, levels, self.fmt, self.preset)
+        data = self.cache.get(key)
+        if data is None:
+            alphas = {}
+            for chan, threshold in levels:
+                alpha = self.source.alpha(week, section, z, chan)
+                if alpha is None:
+                    return None
+                alphas[chan] = threshold_lut(threshold)[alpha]
+            img = Image.fromarray(screen_composite(alphas), mode='RGB')
+            data = czi_utils.encode_slice(img, self.fmt, self.preset)
+            self.cache.put(key, data)
+        return data
@@ -0,0 +1,33 @@
+// static/js/assets.js
+// Fingerprinted URLs for assets the viewers build in JS. The app serves every
+// file in its asset manifest at /assets/<digest>/<path> with year-long,
+// immutable caching, so unchanged slices are never requested again.
+//
+//   Assets.load('processed_detailed/week1/')   // -> Promise, digests under that prefix
+//   Assets.url('/static/processed_detailed/week1/kmc1/week1_kmc1_z5_ch2.png')
+//
+// url() returns its argument unchanged for anything not (yet) in a loaded
+// manifest, so callers never have to wait for it.
+(function () {
+  const digests = new Map();   // path relative to static/ -> digest
+  const loaded = new Map();    // prefix -> Promise
+
+  function load(prefix) {
+    if (!loaded.has(prefix)) {
+      loaded.set(prefix, fetch(`/assets/manifest.json?prefix=${encodeURIComponent(prefix)}`)
+        .then(res => (res.ok ? res.json() : {}))
+        .then(map => Object.entries(map).forEach(([path, digest]) => digests.set(path, digest)))
+        .catch(() => {}));
+    }
+    return loaded.get(prefix);
+  }
+
+  function url(src) {
+    if (!src.startsWith('/static/')) return src;
+    const path = src.slice('/static/'.length);
+    const digest = digests.get(path);
+    return digest ? `/assets/${digest}/${path}` : src;
+  }
+
+  window.Assets = { load, url };
+})();
@@ -0,0 +1,88 @@
+// static/js/catalog.js
+// What the dataset holds, from /api/catalog (catalog.py): every week's
+// sections with their Z range, channels, missing slices and downloads, so the
+// viewers only request slices that exist instead of probing for 404s.
+//
+//   Catalog.stack('1', 'kmc2')      // -> Promise, { folder, stem, ext, z: [1, 101], channels, missing, ... }
+//   Catalog.has(stack, z, ch)       // false for a slice the stack lacks
+//   Catalog.slices(stack)           // -> Promise, a deduplicated stack's <stem>.slices.json
+//   Catalog.crops(stack)            // -> Promise, a cropped stack's <stem>.crop.json
+//
+// Every lookup resolves to undefined when the catalog itself can't be loaded,
+// and callers then fall back to their built-in defaults; null means the
+// catalog is loaded and the thing isn't there.
+(function () {
+  let loaded = null;
+  const missing = new WeakMap();   // stack -> Set of "z:ch"
+  const sidecars = new WeakMap();  // stack -> { name: Promise of <stem>.<name>.json }
+
+  function load() {
+    if (!loaded) {
+      loaded = fetch('/api/catalog')
+        .then(res => (res.ok ? res.json() : undefined))
+        .catch(() => undefined);
+    }
+    return loaded;
+  }
+
+  function stack(week, section) {
+    return load().then(catalog => {
+      if (!catalog) return undefined;
+      const entry = week === 'overview' ? { sections: catalog.overview } : catalog.weeks[week];
+      return (entry && entry.sections[section]) || null;
+    });
+  }
+
+  // The stack stored in `folder` (relative to static/), as the viewers' data-folder names it
+  function stackIn(folder) {
+    folder = folder.replace(/^\/?static\//, '').replace(/\/$/, '');
+    return load().then(catalog => {
+      if (!catalog) return undefined;
+      const all = [catalog.overview, ...Object.values(catalog.weeks).map(entry => entry.sections)];
+      for (const sections of all) {
+        for (const s of Object.values(sections)) if (s.folder === folder) return s;
+      }
+      return null;
+    });
+  }
+
+  function has(stack, z, ch) {
+    if (!stack) return true;
+    if (z < stack.z[0] || z > stack.z[1] || !stack.channels.includes(ch)) return false;
+    if (!missing.has(stack)) missing.set(stack, new Set(stack.missing.map(([mz, mch]) => `${mz}:${mch}`)));
+    return !missing.get(stack).has(`${z}:${ch}`);
+  }
+
+  function sidecar(stack, name) {
+    if (!sidecars.has(stack)) sidecars.set(stack, {});
+    const loaded = sidecars.get(stack);
+    if (!loaded[name]) {
+      const src = `/static/${stack.folder}/${stack.stem}.${name}.json`;
+      const assets = window.Assets ? Assets.load(`${stack.folder}/`) : Promise.resolve();
+      loaded[name] = assets
+        .then(() => fetch(window.Assets ? Assets.url(src) : src))
+        .then(res => (res.ok ? res.json() : null))
+        .catch(() => null);
+    }
+    return loaded[name];
+  }
+
+  // Where a deduplicated stack (czi_utils.dedupe_slices) keeps each slice: { ext, objects,
+  // z0, channels: { ch: [digest or null per z] } }, objects at <folder>/<objects>/<digest><ext>.
+  // null for stacks stored as loose slices or bundles.
+  function slices(stack) {
+    return stack && stack.dedup ? sidecar(stack, 'slices') : Promise.resolve(null);
+  }
+
+  // Where each slice of a stack cropped to its content (czi_utils.write_crops) sits:
+  // { frame: [w, h], z0, channels: { ch: [[x, y] or null per z] } }; null if not cropped.
+  function crops(stack) {
+    return stack && stack.crop ? sidecar(stack, 'crop') : Promise.resolve(null);
+  }
+
+  function hasDownload(url) {
+    return load().then(catalog => (catalog ? catalog.downloads.includes(url) : undefined));
+  }
+
+  window.Catalog = { load, stack, stackIn, has, slices, crops, hasDownload };
+})();
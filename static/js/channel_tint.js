@@ -0,0 +1,51 @@
+// static/js/channel_tint.js
+// Tint and threshold of the grayscale slices (8-bit normalized intensity) in the
+// browser: the detailed Z-slices (viewer_detail.js) and the flat channels of a
+// --gray build (tile_viewer.js). Colors and default thresholds are the app's
+// CHANNELS (czi_utils.CHANNEL_COLORS / CHANNEL_THRESHOLDS).
+//
+//   ChannelTint.threshold(2)                          // default threshold [0-1]
+//   ChannelTint.apply(ctx, x, y, width, height, 2, 0.1)   // tints that region in place
+(function () {
+  const luts = new Map();
+
+  function channel(chan) {
+    return (window.CHANNELS || {})[chan] || {};
+  }
+
+  function threshold(chan) {
+    return channel(chan).threshold || 0;
+  }
+
+  // Gray value -> tinted RGBA pixel (packed little-endian, as a Uint32Array view of
+  // ImageData reads it): the channel color with alpha rescaled above the threshold,
+  // exactly like czi_utils._normalized_alpha + _tint_alpha
+  function lut(chan, t) {
+    const key = `${chan}:${t}`;
+    let table = luts.get(key);
+    if (!table) {
+      const [r, g, b] = channel(chan).color || [255, 255, 255];
+      table = new Uint32Array(256);
+      for (let v = 0; v < 256; v++) {
+        const a = Math.max(0, Math.floor(255 * (v / 255 - t) / (1 - t)));
+        table[v] = ((a << 24) | (b << 16) | (g << 8) | r) >>> 0;
+      }
+      luts.set(key, table);
+    }
+    return table;
+  }
+
+  // Tint the gray pixels of a canvas region in place; transparent pixels stay transparent
+  function apply(ctx, x, y, width, height, chan, t = threshold(chan)) {
+    if (!width || !height) return;
+    const pixels = ctx.getImageData(x, y, width, height);
+    const px = new Uint32Array(pixels.data.buffer);
+    const table = lut(chan, t);
+    for (let i = 0; i < px.length; i++) {
+      px[i] = px[i] >>> 24 ? table[px[i] & 0xff] : 0;   // red byte = gray value
+    }
+    ctx.putImageData(pixels, x, y);
+  }
+
+  window.ChannelTint = { threshold, lut, apply };
+})();
@@ -0,0 +1,28 @@
+// static/js/media.js
+// URLs of the images, videos and slices under static/ that the pages build in
+// JS, resolved like media_url() in the templates: under window.MEDIA_URL when
+// the app is configured with a media origin, else served by the app itself
+// (fingerprinted through assets.js when its manifest is loaded).
+//
+//   Media.url('3d_images/week0/asma/asma.png')
+//   Media.url('processed_detailed/week1/kmc1/')   // folder prefixes work too
+//   Media.resolve('3d_images/week0/asma/asma.png')   // -> Promise, after its folder's digests
+//
+// Paths are relative to static/ and unencoded ('overview/healthy airway/...').
+(function () {
+  function url(path) {
+    if (window.MEDIA_URL) return window.MEDIA_URL + encodeURI(path);
+    const src = `/static/${path}`;
+    return encodeURI(window.Assets ? Assets.url(src) : src);
+  }
+
+  // url() once the digests of the file's folder are loaded, so it is the fingerprinted
+  // URL whenever the manifest has the file
+  function resolve(path) {
+    const folder = path.slice(0, path.lastIndexOf('/') + 1);
+    const loaded = window.Assets && !window.MEDIA_URL ? Assets.load(folder) : Promise.resolve();
+    return loaded.then(() => url(path));
+  }
+
+  window.Media = { url, resolve };
+})();
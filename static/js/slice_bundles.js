@@ -0,0 +1,107 @@
+// static/js/slice_bundles.js
+// Client for the packed Z-stacks written by batch_preprocess.py --bundle: one
+// .bundle per section/channel (encoded slices back to back) plus a .json
+// offset index. Slices are fetched with HTTP Range requests, a run of
+// neighbours per request, and handed out as object URLs.
+//
+//   SliceBundles.open('/stack/week1/kmc1/ch2')   // -> Promise<bundle or null>
+//   bundle.get(z)                                // -> Promise<object URL or null>
+//   bundle.prefetch(zFrom, zTo)                  // one request for the missing run
+//
+// open() resolves to null when the section has no bundle, so callers fall
+// back to the per-slice files.
+(function () {
+  const WINDOW = 4;    // neighbours fetched on each side of a miss
+  const CACHE = 64;    // object URLs kept per bundle, least recently used dropped
+  const MIME = { '.png': 'image/png', '.webp': 'image/webp', '.avif': 'image/avif' };
+
+  const opened = new Map();   // base url -> Promise<SliceBundle | null>
+
+  class SliceBundle {
+    constructor(url, index) {
+      this.url = url;
+      this.type = MIME[index.ext] || 'application/octet-stream';
+      this.z0 = index.z0;
+      this.z1 = index.z0 + index.offsets.length - 2;
+      this.offsets = index.offsets;
+      this.urls = new Map();       // z -> object URL
+      this.inflight = new Map();   // z -> Promise<object URL | null>
+    }
+
+    known(z) {
+      return this.urls.has(z) || this.inflight.has(z);
+    }
+
+    get(z) {
+      if (z < this.z0 || z > this.z1) return Promise.resolve(null);
+      const url = this.urls.get(z);
+      if (url) {
+        this.urls.delete(z);
+        this.urls.set(z, url);
+        return Promise.resolve(url);
+      }
+      if (!this.inflight.has(z)) this.prefetch(z - WINDOW, z + WINDOW, z);
+      return this.inflight.get(z);
+    }
+
+    // Fetch the slices in [lo, hi] not cached or on their way, in one Range request.
+    // `needed` (if given) must be part of the request even when its neighbours are known.
+    prefetch(lo, hi, needed) {
+      lo = Math.max(lo, this.z0);
+      hi = Math.min(hi, this.z1);
+      while (lo <= hi && lo !== needed && this.known(lo)) lo++;
+      while (hi >= lo && hi !== needed && this.known(hi)) hi--;
+      if (lo > hi) return;
+
+      const start = this.offsets[lo - this.z0];
+      const end = this.offsets[hi - this.z0 + 1];
+      const done = end > start ? this.fetchRange(lo, hi, start, end) : Promise.resolve();
+      for (let z = lo; z <= hi; z++) {
+        if (this.known(z)) continue;
+        const result = done.then(() => this.urls.get(z) || null);
+        this.inflight.set(z, result);
+        result.then(() => {
+          if (this.inflight.get(z) === result) this.inflight.delete(z);
+        });
+      }
+    }
+
+    fetchRange(lo, hi, start, end) {
+      return fetch(this.url, { headers: { Range: `bytes=${start}-${end - 1}` } })
+        .then(res => {
+          if (!res.ok) throw new Error(`${this.url}: ${res.status}`);
+          // A server that ignores Range sends the whole bundle (200)
+          const base = res.status === 206 ? start : 0;
+          return res.arrayBuffer().then(buf => {
+            for (let z = lo; z <= hi; z++) {
+              const a = this.offsets[z - this.z0] - base;
+              const b = this.offsets[z - this.z0 + 1] - base;
+              if (b > a && !this.urls.has(z)) this.store(z, buf.slice(a, b));
+            }
+          });
+        })
+        .catch(err => console.warn('Slice bundle fetch failed:', err));
+    }
+
+    store(z, bytes) {
+      this.urls.set(z, URL.createObjectURL(new Blob([bytes], { type: this.type })));
+      while (this.urls.size > CACHE) {
+        const [oldZ, oldUrl] = this.urls.entries().next().value;
+        URL.revokeObjectURL(oldUrl);
+        this.urls.delete(oldZ);
+      }
+    }
+  }
+
+  function open(base) {
+    if (!opened.has(base)) {
+      opened.set(base, fetch(`${base}.json`)
+        .then(res => (res.ok ? res.json() : null))
+        .then(index => (index ? new SliceBundle(`${base}.bundle`, index) : null))
+        .catch(() => null));
+    }
+    return opened.get(base);
+  }
+
+  window.SliceBundles = { open };
+})();
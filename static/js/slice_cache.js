@@ -0,0 +1,94 @@
+// static/js/slice_cache.js
+// Decoded Z-slices for the viewers: a bounded LRU of ImageBitmaps, decoded off
+// the main thread by createImageBitmap and drawn straight onto a canvas, so a
+// slider drag over slices already prefetched costs no network and no decode.
+//
+//   const cache = new SliceCache(96);
+//   cache.peek(key)                 // -> decoded slice or undefined, never loads
+//   cache.get(key, () => url)       // -> Promise<decoded slice or null>, loads on a miss
+//   cache.retain(keys)              // abort loads whose key is not in `keys`
+//
+// `url` may be a promise (bundle and fingerprinted URLs resolve late); an
+// aborted or failed load resolves to null.
+(function () {
+  function decode(blob) {
+    if (window.createImageBitmap) return createImageBitmap(blob);
+    // Older browsers: decode through an <img>, still off the drawing path
+    const url = URL.createObjectURL(blob);
+    const img = new Image();
+    img.src = url;
+    return img.decode().then(() => img).finally(() => URL.revokeObjectURL(url));
+  }
+
+  function release(slice) {
+    if (slice && slice.close) slice.close();
+  }
+
+  class SliceCache {
+    constructor(capacity) {
+      this.capacity = capacity;
+      this.slices = new Map();     // key -> ImageBitmap, least recently used first
+      this.inflight = new Map();   // key -> { controller, promise }
+    }
+
+    peek(key) {
+      const slice = this.slices.get(key);
+      if (slice) {
+        this.slices.delete(key);
+        this.slices.set(key, slice);
+      }
+      return slice;
+    }
+
+    get(key, resolveUrl) {
+      const slice = this.peek(key);
+      if (slice) return Promise.resolve(slice);
+      const pending = this.inflight.get(key);
+      if (pending) return pending.promise;
+
+      const controller = new AbortController();
+      const { signal } = controller;
+      const promise = Promise.resolve(resolveUrl())
+        .then(url => (url && !signal.aborted ? fetch(url, { signal }) : null))
+        .then(res => (res && res.ok ? res.blob() : null))
+        .then(blob => (blob && !signal.aborted ? decode(blob) : null))
+        .then(decoded => {
+          if (signal.aborted) {
+            release(decoded);
+            return null;
+          }
+          if (decoded) this.store(key, decoded);
+          return decoded;
+        })
+        .catch(() => null)
+        .finally(() => {
+          const entry = this.inflight.get(key);
+          if (entry && entry.controller === controller) this.inflight.delete(key);
+        });
+      this.inflight.set(key, { controller, promise });
+      return promise;
+    }
+
+    store(key, slice) {
+      release(this.slices.get(key));
+      this.slices.delete(key);
+      this.slices.set(key, slice);
+      while (this.slices.size > this.capacity) {
+        const [oldest, evicted] = this.slices.entries().next().value;
+        this.slices.delete(oldest);
+        release(evicted);
+      }
+    }
+
+    retain(keys) {
+      for (const [key, entry] of this.inflight) {
+        if (!keys.has(key)) {
+          entry.controller.abort();
+          this.inflight.delete(key);
+        }
+      }
+    }
+  }
+
+  window.SliceCache = SliceCache;
+})();
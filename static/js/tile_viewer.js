@@ -0,0 +1,342 @@
+// static/js/tile_viewer.js
+// Deep Zoom viewer for the tilescans overviews. Every channel <img> in a
+// .viewer carries data-dzi (pyramid written by batch_preprocess.py --tiles)
+// and data-src (the full-size image, data-srcset its width variants). Channels with a pyramid become a canvas
+// that only requests the tiles visible at the current zoom; the others fall
+// back to the full image. Nothing is fetched until a channel is switched on.
+// Channels of a --gray build (window.SLICE_MODE) are tinted and thresholded on
+// their canvas (channel_tint.js), with a threshold slider per channel.
+document.addEventListener('DOMContentLoaded', () => {
+  const MAX_ZOOM = 64;       // relative to fit-to-viewer
+  const TILE_CACHE = 256;    // tiles kept per channel (least recently used dropped)
+  const COARSE_LEVELS = 4;   // cached coarser levels drawn under tiles still loading
+  const GRAY = window.SLICE_MODE === 'gray' && Boolean(window.ChannelTint);
+
+  function loadDzi(url) {
+    return fetch(url)
+      .then(res => {
+        if (!res.ok) throw new Error(`${url}: ${res.status}`);
+        return res.text();
+      })
+      .then(text => {
+        const doc = new DOMParser().parseFromString(text, 'application/xml');
+        const image = doc.documentElement;
+        const size = doc.getElementsByTagName('Size')[0];
+        if (image.localName !== 'Image' || !size) throw new Error(`${url}: not a DZI descriptor`);
+        const width = +size.getAttribute('Width');
+        const height = +size.getAttribute('Height');
+        return {
+          width,
+          height,
+          tileSize: +image.getAttribute('TileSize'),
+          overlap: +image.getAttribute('Overlap') || 0,
+          format: image.getAttribute('Format'),
+          maxLevel: Math.ceil(Math.log2(Math.max(width, height))),
+          base: url.replace(/\.dzi$/, '_files/'),
+        };
+      });
+  }
+
+  // Full-size fallback, loaded the first time the channel is shown
+  function useFullImage(img) {
+    const load = () => {
+      if (img.getAttribute('src') || !img.classList.contains('visible')) return;
+      if (img.dataset.srcset) {
+        // Width variants (app responsive_img): the browser picks one for the viewer's size
+        img.sizes = img.dataset.sizes || '100vw';
+        img.srcset = img.dataset.srcset;
+      }
+      img.src = img.dataset.src;
+    };
+    new MutationObserver(load).observe(img, { attributes: true, attributeFilter: ['class'] });
+    load();
+  }
+
+  // Canvas in place of a channel <img>, keeping its classes (visibility, CSS) and label
+  function replaceWithCanvas(img) {
+    const canvas = document.createElement('canvas');
+    canvas.className = img.className;
+    canvas.dataset.week = img.dataset.week;
+    canvas.dataset.chan = img.dataset.chan;
+    canvas.setAttribute('role', 'img');
+    canvas.setAttribute('aria-label', img.alt);
+    img.replaceWith(canvas);
+    return canvas;
+  }
+
+  // Full-size fallback of a gray channel: the image tinted on a canvas of its size,
+  // tinted again when the channel's threshold moves
+  function useTintedImage(img, viewer) {
+    const chan = img.dataset.chan;
+    const canvas = replaceWithCanvas(img);
+    const source = new Image();
+    source.crossOrigin = 'anonymous';   // MEDIA_URL origin: its pixels are read back
+    const draw = () => {
+      if (!source.naturalWidth) return;
+      canvas.width = source.naturalWidth;
+      canvas.height = source.naturalHeight;
+      const ctx = canvas.getContext('2d', { willReadFrequently: true });
+      ctx.drawImage(source, 0, 0);
+      ChannelTint.apply(ctx, 0, 0, canvas.width, canvas.height, chan, viewer.threshold(chan));
+    };
+    source.onload = draw;
+    viewer.retint.set(chan, draw);
+    const load = () => {
+      if (source.getAttribute('src') || !canvas.classList.contains('visible')) return;
+      if (img.dataset.srcset) {
+        source.sizes = img.dataset.sizes || '100vw';
+        source.srcset = img.dataset.srcset;
+      }
+      source.src = img.dataset.src;
+    };
+    new MutationObserver(load).observe(canvas, { attributes: true, attributeFilter: ['class'] });
+    load();
+  }
+
+  class TileLayer {
+    constructor(img, dzi, viewer) {
+      this.dzi = dzi;
+      this.viewer = viewer;
+      this.tiles = new Map();   // "level/col_row" -> Image, oldest first
+
+      const canvas = replaceWithCanvas(img);
+      this.canvas = canvas;
+      new MutationObserver(() => viewer.schedule())
+        .observe(canvas, { attributes: true, attributeFilter: ['class'] });
+    }
+
+    get visible() {
+      return this.canvas.classList.contains('visible');
+    }
+
+    // Loaded tile or null; missing tiles are requested when `request` is set
+    tile(level, col, row, request) {
+      const key = `${level}/${col}_${row}`;
+      let img = this.tiles.get(key);
+      if (img) {
+        this.tiles.delete(key);
+        this.tiles.set(key, img);
+        return img.complete && img.naturalWidth ? img : null;
+      }
+      if (!request) return null;
+
+      img = new Image();
+      img.onload = () => this.viewer.schedule();
+      img.src = `${this.dzi.base}${key}.${this.dzi.format}`;
+      this.tiles.set(key, img);
+      if (this.tiles.size > TILE_CACHE) {
+        const [oldKey, old] = this.tiles.entries().next().value;
+        old.onload = null;
+        old.removeAttribute('src');   // aborts it if still in flight
+        this.tiles.delete(oldKey);
+      }
+      return null;
+    }
+
+    draw(view) {
+      const { canvas, dzi } = this;
+      const dpr = window.devicePixelRatio || 1;
+      const width = Math.round(view.width * dpr);
+      const height = Math.round(view.height * dpr);
+      if (canvas.width !== width || canvas.height !== height) {
+        canvas.width = width;
+        canvas.height = height;
+      }
+      const ctx = canvas.getContext('2d', { willReadFrequently: GRAY });
+      ctx.setTransform(1, 0, 0, 1, 0, 0);
+      ctx.clearRect(0, 0, width, height);
+      if (!this.visible) return;
+
+      // Draw in full-resolution image pixels from here on
+      const s = view.scale * dpr;
+      ctx.setTransform(s, 0, 0, s, dpr * view.width / 2 - view.cx * s, dpr * view.height / 2 - view.cy * s);
+
+      // Coarsest level with at least one tile pixel per device pixel
+      const target = Math.max(0, Math.min(dzi.maxLevel, dzi.maxLevel + Math.ceil(Math.log2(s))));
+      for (let level = Math.max(0, target - COARSE_LEVELS); level <= target; level++) {
+        const f = 2 ** (dzi.maxLevel - level);      // image pixels per level pixel
+        const step = dzi.tileSize * f;
+        const cols = Math.ceil(Math.ceil(dzi.width / f) / dzi.tileSize);
+        const rows = Math.ceil(Math.ceil(dzi.height / f) / dzi.tileSize);
+        const c0 = Math.max(0, Math.floor(view.x0 / step));
+        const c1 = Math.min(cols, Math.ceil(view.x1 / step));
+        const r0 = Math.max(0, Math.floor(view.y0 / step));
+        const r1 = Math.min(rows, Math.ceil(view.y1 / step));
+
+        for (let row = r0; row < r1; row++) {
+          for (let col = c0; col < c1; col++) {
+            const img = this.tile(level, col, row, level === target);
+            if (!img) continue;
+            const x = (col * dzi.tileSize - (col ? dzi.overlap : 0)) * f;
+            const y = (row * dzi.tileSize - (row ? dzi.overlap : 0)) * f;
+            const w = img.naturalWidth * f;
+            const h = img.naturalHeight * f;
+            // Replace (not blend over) the coarser tile underneath: tiles have alpha
+            ctx.clearRect(x, y, w, h);
+            ctx.drawImage(img, x, y, w, h);
+          }
+        }
+      }
+      if (GRAY) {
+        const chan = canvas.dataset.chan;
+        ChannelTint.apply(ctx, 0, 0, width, height, chan, this.viewer.threshold(chan));
+      }
+    }
+  }
+
+  class TileViewer {
+    constructor(el) {
+      this.el = el;
+      this.layers = [];
+      this.zoom = 1;
+      this.cx = this.cy = 0;
+      this.frame = 0;
+      this.drag = null;
+      this.coverFit = false;
+      this.thresholds = {};      // channel -> threshold [0-1] set by its slider
+      this.retint = new Map();   // channel -> redraw of a tinted full-size image
+    }
+
+    threshold(chan) {
+      return chan in this.thresholds ? this.thresholds[chan] : ChannelTint.threshold(chan);
+    }
+
+    setThreshold(chan, value) {
+      this.thresholds[chan] = value;
+      const retint = this.retint.get(chan);
+      if (retint) retint();
+      this.schedule();
+    }
+
+    add(layer) {
+      this.layers.push(layer);
+      if (this.layers.length === 1) {
+        this.reset();
+        this.listen();
+      }
+      this.schedule();
+    }
+
+    get size() {
+      return this.layers[0].dzi;
+    }
+
+    reset() {
+      this.zoom = 1;
+      this.cx = this.size.width / 2;
+      this.cy = this.size.height / 2;
+      this.schedule();
+    }
+
+    view() {
+      const width = this.el.clientWidth;
+      const height = this.el.clientHeight;
+      const fit = (this.coverFit ? Math.max : Math.min)(width / this.size.width, height / this.size.height);
+      const scale = fit * this.zoom;
+      return {
+        width, height, scale, cx: this.cx, cy: this.cy,
+        x0: this.cx - width / 2 / scale, x1: this.cx + width / 2 / scale,
+        y0: this.cy - height / 2 / scale, y1: this.cy + height / 2 / scale,
+      };
+    }
+
+    schedule() {
+      if (this.frame || !this.layers.length) return;
+      this.frame = requestAnimationFrame(() => {
+        this.frame = 0;
+        const view = this.view();
+        this.layers.forEach(layer => layer.draw(view));
+      });
+    }
+
+    clampCenter() {
+      this.cx = Math.min(Math.max(this.cx, 0), this.size.width);
+      this.cy = Math.min(Math.max(this.cy, 0), this.size.height);
+    }
+
+    // Zoom by `factor`, keeping the image point under (px, py) in place
+    zoomAt(factor, px, py) {
+      const before = this.view();
+      const ix = this.cx + (px - before.width / 2) / before.scale;
+      const iy = this.cy + (py - before.height / 2) / before.scale;
+      this.zoom = Math.min(Math.max(this.zoom * factor, 1), MAX_ZOOM);
+      const after = this.view();
+      this.cx = ix - (px - after.width / 2) / after.scale;
+      this.cy = iy - (py - after.height / 2) / after.scale;
+      this.clampCenter();
+      this.schedule();
+    }
+
+    listen() {
+      const el = this.el;
+      const active = () => this.layers.some(layer => layer.visible);
+
+      el.addEventListener('wheel', e => {
+        if (!active()) return;   // let the page scroll past an empty viewer
+        e.preventDefault();
+        const rect = el.getBoundingClientRect();
+        this.zoomAt(Math.exp(-e.deltaY * 0.002), e.clientX - rect.left, e.clientY - rect.top);
+      }, { passive: false });
+
+      el.addEventListener('pointerdown', e => {
+        if (!active()) return;
+        this.drag = { id: e.pointerId, x: e.clientX, y: e.clientY };
+        el.setPointerCapture(e.pointerId);
+      });
+      el.addEventListener('pointermove', e => {
+        if (!this.drag || this.drag.id !== e.pointerId) return;
+        const scale = this.view().scale;
+        this.cx -= (e.clientX - this.drag.x) / scale;
+        this.cy -= (e.clientY - this.drag.y) / scale;
+        this.drag.x = e.clientX;
+        this.drag.y = e.clientY;
+        this.clampCenter();
+        this.schedule();
+      });
+      const endDrag = () => { this.drag = null; };
+      el.addEventListener('pointerup', endDrag);
+      el.addEventListener('pointercancel', endDrag);
+      el.addEventListener('dblclick', () => this.reset());
+
+      new ResizeObserver(() => this.schedule()).observe(el);
+    }
+  }
+
+  // A threshold slider per channel under the viewer's checkboxes
+  function thresholdRow(el, viewer) {
+    const channels = el.closest('.viewer-column');
+    const checkboxes = channels ? channels.querySelectorAll('.channel-cbx') : [];
+    if (!checkboxes.length) return;
+    const row = document.createElement('div');
+    row.className = 'threshold-row';
+    checkboxes.forEach(cbx => {
+      const chan = cbx.dataset.chan;
+      const input = document.createElement('input');
+      input.type = 'range';
+      input.className = 'threshold-slider';
+      input.dataset.chan = chan;
+      input.min = 0;
+      input.max = 254;
+      input.value = Math.round(viewer.threshold(chan) * 255);
+      input.addEventListener('input', () => viewer.setThreshold(chan, parseInt(input.value, 10) / 255));
+      const label = document.createElement('label');
+      label.append(`${cbx.parentElement.textContent.trim() || `Channel ${chan}`} threshold `, input);
+      row.appendChild(label);
+    });
+    checkboxes[0].closest('.channel-row').after(row);
+  }
+
+  document.querySelectorAll('.viewer').forEach(el => {
+    const viewer = new TileViewer(el);
+    const fallback = img => (GRAY ? useTintedImage(img, viewer) : useFullImage(img));
+    if (GRAY) thresholdRow(el, viewer);
+    el.querySelectorAll('img.chan-img[data-src]').forEach(img => {
+      // Honour the per-week CSS (week 1 fills the viewer instead of fitting it)
+      if (getComputedStyle(img).objectFit === 'cover') viewer.coverFit = true;
+      if (!img.dataset.dzi) return fallback(img);
+      loadDzi(img.dataset.dzi)
+        .then(dzi => viewer.add(new TileLayer(img, dzi, viewer)))
+        .catch(() => fallback(img));
+    });
+  });
+});
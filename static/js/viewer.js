@@ -1,5 +1,8 @@
 // static/js/viewer.js
 document.addEventListener('DOMContentLoaded', () => {
+  // Slice file extension configured by the page template (app SLICE_FORMAT)
+  const SLICE_EXT = window.SLICE_EXT || '.png';
+
   // Handle main page heatmaps
   const heatmapContainers = document.querySelectorAll('.heatmaps');
   heatmapContainers.forEach(container => {
@@ -32,6 +35,10 @@ document.addEventListener('DOMContentLoaded', () => {
 
     if (!viewer || !slider) return; // Skip if not a detail page
 
+    // The stack in this folder from the dataset catalog (/api/catalog): file names,
+    // Z range, channels and missing slices; undefined without a catalog
+    let stack;
+
     // Create an <img> for each channel
     const chanImgs = {};
     controls.forEach(cbx => {
@@ -60,24 +67,28 @@ document.addEventListener('DOMContentLoaded', () => {
       controls.forEach(cbx => {
         const chan = cbx.dataset.chan;
         const img  = chanImgs[chan];
-        if (cbx.checked) {
+        if (stack && !Catalog.has(stack, parseInt(z, 10), parseInt(chan, 10))) {
+          img.hidden = true;   // no such slice on disk
+        } else if (cbx.checked) {
           let imagePath;
           
-          if (week === 'overview') {
+          if (stack) {
+            imagePath = `/static/${stack.folder}/${stack.stem}_z${z}_ch${chan}${stack.ext}`;
+          } else if (week === 'overview') {
             // Handle overview data - different path pattern
             let sliderName = block.querySelector('h2').textContent.toLowerCase().replace(/ /g, '_');
             
             if (folder.includes('overview_processed_detailed')) {
               // Format: overview_processed_detailed/healthy_airway/overview_healthy_airway_z1_ch1.png
-              imagePath = `/static/${folder}/overview_${sliderName}_z${z}_ch${chan}.png`;
+              imagePath = `/static/${folder}/overview_${sliderName}_z${z}_ch${chan}${SLICE_EXT}`;
             } else if (folder.includes('vessel_processed_detailed')) {
               // Format: vessel_processed_detailed/week3/fibrotic_arteriole/week3_fibrotic_arteriole_z1_ch1.png
               const weekMatch = folder.match(/week(\d+)/);
               const weekNum = weekMatch ? weekMatch[1] : '3';
-              imagePath = `/static/${folder}/week${weekNum}_${sliderName}_z${z}_ch${chan}.png`;
+              imagePath = `/static/${folder}/week${weekNum}_${sliderName}_z${z}_ch${chan}${SLICE_EXT}`;
             } else {
               // Fallback for other overview data
-              imagePath = `/static/${folder}/${sliderName}_z${z}_ch${chan}.png`;
+              imagePath = `/static/${folder}/${sliderName}_z${z}_ch${chan}${SLICE_EXT}`;
             }
           } else {
             // Regular week data - handle different naming patterns
@@ -87,10 +98,10 @@ document.addEventListener('DOMContentLoaded', () => {
               // Fibrotic alveoli format: week3_kmc2_z1_ch1.png
               const kmcMatch = folder.match(/kmc(\d+)/);
               const kmcNum = kmcMatch ? kmcMatch[1] : '2';
-              imagePath = `/static/${folder}/week3_kmc${kmcNum}_z${z}_ch${chan}.png`;
+              imagePath = `/static/${folder}/week3_kmc${kmcNum}_z${z}_ch${chan}${SLICE_EXT}`;
             } else if (folder.includes('processed_detailed/week0')) {
               // Healthy alveoli format: week0_z1_ch1.png
-              imagePath = `/static/${folder}/week0_z${z}_ch${chan}.png`;
+              imagePath = `/static/${folder}/week0_z${z}_ch${chan}${SLICE_EXT}`;
             } else if (folder.includes('vessel_processed_detailed')) {
               // Vessel data format: week3_fibrotic_venule_z1_ch1.png
               const weekMatch = folder.match(/week(\d+)/);
@@ -98,11 +109,11 @@ document.addEventListener('DOMContentLoaded', () => {
               // Extract tissue name from folder path
               const folderParts = folder.split('/');
               const tissueName = folderParts[folderParts.length - 1]; // Get last part of folder path
-              imagePath = `/static/${folder}/week${weekNum}_${tissueName}_z${z}_ch${chan}.png`;
+              imagePath = `/static/${folder}/week${weekNum}_${tissueName}_z${z}_ch${chan}${SLICE_EXT}`;
             } else {
               // Fallback to original logic
               sliderName = sliderName.replace(/^week\d*_?/, '');
-              imagePath = `/static/${folder}/week${week}/${chan}/week${week}_${sliderName}_ch${chan}_z${z}.png`;
+              imagePath = `/static/${folder}/week${week}/${chan}/week${week}_${sliderName}_ch${chan}_z${z}${SLICE_EXT}`;
             }
           }
           
@@ -110,7 +121,8 @@ document.addEventListener('DOMContentLoaded', () => {
           console.log('Loading image:', imagePath);
           console.log('Components:', { week, sliderName: block.querySelector('h2').textContent, chan, z, folder });
           
-          img.src = imagePath;
+          // At the media origin when MEDIA_URL is set (media.js)
+          img.src = window.Media ? Media.url(imagePath.slice('/static/'.length)) : imagePath;
           img.hidden = false;
           
           // Add error handling to catch failed image loads
@@ -133,17 +145,31 @@ document.addEventListener('DOMContentLoaded', () => {
       updateImages(slider.value);
     });
 
-    // Initialize: check any default-checked checkboxes and load initial images
-    controls.forEach(cbx => {
-      if (cbx.checked) {
-        updateImages(slider.value);
-        return; // Only need to call once if any checkbox is checked
+    const lookup = window.Catalog && folder ? Catalog.stackIn(folder) : Promise.resolve(undefined);
+    lookup.then(found => {
+      if (found === null) {
+        slider.disabled = true;
+        return;
+      }
+      stack = found;
+      if (stack) {
+        slider.min = stack.z[0];
+        slider.max = stack.z[1];
+        controls.forEach(cbx => {
+          if (!stack.channels.includes(parseInt(cbx.dataset.chan, 10))) {
+            cbx.checked = false;
+            cbx.disabled = true;
+          }
+        });
+      }
+
+      // Initialize: check any default-checked checkboxes and load initial images
+      const enabled = controls.filter(cbx => !cbx.disabled);
+      if (!enabled.some(cbx => cbx.checked) && enabled.length > 0) {
+        // If no checkboxes are checked by default, check the first one
+        enabled[0].checked = true;
       }
-    });
-    // If no checkboxes are checked by default, check the first one
-    if (!controls.some(cbx => cbx.checked) && controls.length > 0) {
-      controls[0].checked = true;
       updateImages(slider.value);
-    }
+    });
   });
 });
\ No newline at end of file
@@ -1,99 +1,258 @@
 // static/js/viewer_detail.js
-document.addEventListener("DOMContentLoaded", () => {
-  // Figure out which week we're on
-  const match = window.location.pathname.match(/week\/(\d+)/);
-  const WEEK = match ? parseInt(match[1], 10) : null;
-  console.log("🔍 Detail viewer for week:", WEEK);
-
-  if (WEEK === null) {
-    console.error("Could not determine week from URL");
-    return;
+// Z-stack viewer of one detailed section, mounted by the pages (week_detail.html,
+// overview.html) on their viewer markup. The checked channels' slices at the
+// slider's Z are drawn on canvases, and the neighbours on each side are
+// prefetched into a bounded LRU of decoded slices (slice_cache.js), so a slider
+// drag over slices already fetched costs no network and no decode.
+//
+//   DetailViewer.mount({ viewer, slider, label, checkboxes, stack, folder, naming, bundle, live })
+//   DetailViewer.mountComposite({ viewer, slider, label, checkboxes, composite })
+//
+// `stack` is the section's catalog entry (catalog.js), undefined when the catalog
+// can't be loaded: its slices are loose files, a deduplicated stack's objects
+// (<stem>.slices.json) or packed bundles, and may be cropped to their content
+// (<stem>.crop.json). Without a catalog the slice is `folder`/`naming` (relative
+// to static/, {z} and {ch} filled in), after the packed stack at `bundle` ({ch}).
+// With LIVE_SLICES the app renders `live` + z{z}/ch{ch} from the CZI instead.
+// With COMPOSITE_SLICES the pages mount the composite view instead: one image per
+// Z step that the app renders from the checked channels at the sliders' thresholds.
+(function () {
+  const PREFETCH_Z = 4;
+  const CACHE_SLICES = 96;
+  const PREFETCH_COMPOSITES = [1, -1, 2, -2];
+
+  const idle = window.requestIdleCallback || (fn => setTimeout(fn, 50));
+
+  // Slider, checkbox and threshold events are coalesced into at most one call per animation frame
+  function perFrame(fn) {
+    let frame = 0;
+    return () => {
+      if (!frame) {
+        frame = requestAnimationFrame(() => {
+          frame = 0;
+          fn();
+        });
+      }
+    };
   }
 
-  // Find all section containers and set up viewers for each
-  const sections = document.querySelectorAll('.section-container');
-  console.log(`Found ${sections.length} sections`);
+  // A threshold slider per channel after the viewer's controls; each move updates
+  // `thresholds` (channel -> threshold [0-1], initialized here) and calls `onChange`
+  function thresholdRow(viewer, checkboxes, thresholds, onChange) {
+    const row = document.createElement('div');
+    row.className = 'threshold-row';
+    checkboxes.forEach(cbx => {
+      const chan = parseInt(cbx.dataset.chan, 10);
+      thresholds[chan] = ChannelTint.threshold(chan);
+      const input = document.createElement('input');
+      input.type = 'range';
+      input.className = 'threshold-slider';
+      input.dataset.chan = chan;
+      input.min = 0;
+      input.max = 254;
+      input.value = Math.round(thresholds[chan] * 255);
+      input.disabled = cbx.disabled;
+      input.addEventListener('input', () => {
+        thresholds[chan] = parseInt(input.value, 10) / 255;
+        onChange();
+      });
+      const name = cbx.parentElement && cbx.parentElement.textContent.trim();
+      const item = document.createElement('label');
+      item.append(`${name || `Channel ${chan}`} threshold `, input);
+      row.appendChild(item);
+    });
+    (checkboxes[0].closest('.viewer-controls') || viewer).after(row);
+  }
 
-  sections.forEach((section, index) => {
-    const viewer = section.querySelector('.czi-viewer');
-    const slider = section.querySelector('.z-slider');
-    const zlabel = section.querySelector('.z-value');
-    const checkboxes = section.querySelectorAll('.channel-cbx');
-    const sectionName = section.dataset.section;
+  // The slices hold the normalized intensity (8-bit gray); each channel is tinted and
+  // thresholded on its canvas (channel_tint.js) and the canvases are screen-blended by the page CSS
+  function draw(canvas, slice, chan, threshold, crop) {
+    if (!slice.width) return;   // evicted and closed meanwhile
+    const [width, height] = crop ? crop.frame : [slice.width, slice.height];
+    const [x, y] = crop ? crop.offset : [0, 0];
+    if (canvas.width !== width || canvas.height !== height) {
+      canvas.width = width;
+      canvas.height = height;
+    }
+    const ctx = canvas.getContext('2d', { willReadFrequently: true });
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+    ctx.drawImage(slice, x, y);
 
-    console.log(`Setting up section: ${sectionName}`);
+    // Only the slice's own pixels are tinted; the rest of the frame stays transparent
+    ChannelTint.apply(ctx, x, y, slice.width, slice.height, chan, threshold);
+    canvas.hidden = false;
+    canvas.classList.add('visible');
+  }
 
-    if (!viewer || !slider || !zlabel || !checkboxes.length) {
-      console.error(`Missing elements in section ${sectionName}`);
-      return;
+  // URL of a file under static/ (media.js), fingerprinted once assets.js has its folder's digests
+  function staticUrl(folder, name) {
+    const path = `${folder}/${name}`;
+    return window.Media ? Media.resolve(path) : Promise.resolve(`/static/${path}`);
+  }
+
+  function mount({ viewer, slider, label, checkboxes, stack, folder, naming, bundle, live }) {
+    checkboxes = [...checkboxes];
+    const cache = new SliceCache(CACHE_SLICES);
+    const liveMode = Boolean(window.LIVE_SLICES && live);
+    const thresholds = {};   // channel -> threshold [0-1]
+    // Slice manifest of a deduplicated stack (Catalog.slices): identical slices share one
+    // object, so they share one URL and one cache entry; blank slices are simply absent
+    let manifest = null;
+    // Crop sidecar (Catalog.crops): slices are cut to their content and drawn at their
+    // offset in the full frame, so only the content is fetched, decoded and tinted
+    let crops = null;
+
+    const fill = (pattern, z, chan) => pattern.replace('{z}', z).replace('{ch}', chan);
+    const exists = (z, chan) => !stack || Catalog.has(stack, z, chan);
+
+    // Object digest of a slice in a deduplicated stack, or undefined
+    function objectOf(z, chan) {
+      const digests = manifest && manifest.channels[chan];
+      return digests ? digests[z - manifest.z0] || undefined : undefined;
     }
 
-    // Show initial slider value
-    zlabel.textContent = slider.value;
+    // Full frame and offset of a cropped slice, or null when it is stored at full frame
+    function placement(z, chan) {
+      const offsets = !liveMode && crops && crops.channels[chan];
+      const offset = offsets && offsets[z - crops.z0];
+      return offset ? { frame: crops.frame, offset } : null;
+    }
 
-    // Whenever slider moves
-    slider.addEventListener("input", () => {
-      zlabel.textContent = slider.value;
-      refreshViewer(section, sectionName);
-    });
+    // Cache key of a slice: its object when the stack is deduplicated, else its position
+    function sliceKey(z, chan) {
+      return (!liveMode && objectOf(z, chan)) || `${z}/${chan}`;
+    }
 
-    // Whenever any checkbox changes
-    checkboxes.forEach(cbx => {
-      console.log(`✅ Wiring checkbox for channel ${cbx.dataset.chan} in section ${sectionName}`);
-      cbx.addEventListener("change", () => {
-        console.log(`☑️ Channel ${cbx.dataset.chan} now ${cbx.checked} in section ${sectionName}`);
-        refreshViewer(section, sectionName);
+    // URL of one slice: rendered live, the slice's object, the packed Z-stack or the slice file
+    function sliceUrl(z, chan) {
+      if (liveMode) return `${live}z${z}/ch${chan}`;
+      const digest = objectOf(z, chan);
+      if (digest) return staticUrl(stack.folder, `${manifest.objects}/${digest}${manifest.ext}`);
+      const open = bundle && window.SliceBundles && (!stack || stack.bundle)
+        ? SliceBundles.open(fill(bundle, z, chan)) : Promise.resolve(null);
+      return open
+        .then(packed => (packed ? packed.get(z) : null))
+        .then(url => url || (stack
+          ? staticUrl(stack.folder, `${stack.stem}_z${z}_ch${chan}${stack.ext}`)
+          : staticUrl(folder, fill(naming, z, chan))));
+    }
+
+    function refresh() {
+      const z = parseInt(slider.value, 10);
+      const load = (zz, chan) => cache.get(sliceKey(zz, chan), () => sliceUrl(zz, chan));
+      const wanted = new Set();
+      const enabled = [];
+
+      // The current slice of each checked channel: drawn at once when decoded already,
+      // otherwise the previous slice stays up until this one arrives
+      checkboxes.forEach(cbx => {
+        const chan = parseInt(cbx.dataset.chan, 10);
+        let canvas = viewer.querySelector(`canvas[data-chan="${chan}"]`);
+        if (!cbx.checked || !exists(z, chan)) {
+          if (canvas) canvas.hidden = true;
+          return;
+        }
+        if (!canvas) {
+          canvas = document.createElement('canvas');
+          canvas.dataset.chan = chan;
+          canvas.className = 'chan-img';
+          canvas.hidden = true;
+          viewer.appendChild(canvas);
+        }
+        enabled.push(chan);
+        wanted.add(sliceKey(z, chan));
+        const slice = cache.peek(sliceKey(z, chan));
+        if (slice) {
+          draw(canvas, slice, chan, thresholds[chan], placement(z, chan));
+          return;
+        }
+        load(z, chan).then(decoded => {
+          if (parseInt(slider.value, 10) !== z || !cbx.checked) return;   // moved on meanwhile
+          if (decoded) draw(canvas, decoded, chan, thresholds[chan], placement(z, chan));
+          else canvas.hidden = true;
+        });
       });
+
+      // Neighbours, nearest first; whatever is still loading outside this window is cancelled
+      for (let d = 1; d <= PREFETCH_Z; d++) {
+        for (const nz of [z + d, z - d]) {
+          if (nz < parseInt(slider.min, 10) || nz > parseInt(slider.max, 10)) continue;
+          for (const chan of enabled) {
+            if (!exists(nz, chan)) continue;
+            wanted.add(sliceKey(nz, chan));
+            load(nz, chan);
+          }
+        }
+      }
+      cache.retain(wanted);
+    }
+
+    const schedule = perFrame(refresh);
+    label.textContent = slider.value;
+    slider.addEventListener('input', () => {
+      label.textContent = slider.value;
+      schedule();
     });
+    checkboxes.forEach(cbx => cbx.addEventListener('change', schedule));
 
-    // Initial load
-    refreshViewer(section, sectionName);
-  });
+    // Moving a threshold only re-tints the decoded slices
+    thresholdRow(viewer, checkboxes, thresholds, schedule);
 
-  function refreshViewer(section, sectionName) {
-    const viewer = section.querySelector('.czi-viewer');
-    const slider = section.querySelector('.z-slider');
-    const checkboxes = section.querySelectorAll('.channel-cbx');
-    
-    const z = slider.value;
+    // First draw once the stack's sidecars are in
+    const sidecars = window.Catalog && stack
+      ? Promise.all([Catalog.slices(stack), Catalog.crops(stack)])
+      : Promise.resolve([null, null]);
+    return sidecars.then(([slices, crop]) => {
+      manifest = slices;
+      crops = crop;
+      refresh();
+    });
+  }
 
-    checkboxes.forEach(cbx => {
-      const chan = cbx.dataset.chan;
-      let img = viewer.querySelector(`img[data-chan="${chan}"]`);
-
-      if (cbx.checked) {
-        if (!img) {
-          console.log(`➕ Creating IMG for channel ${chan} in section ${sectionName}`);
-          img = document.createElement("img");
-          img.dataset.chan = chan;
-          img.classList.add("chan-img");
-          viewer.appendChild(img);
-        }
+  // One server-side composite (`composite` + z{z}?ch=..&t=..) of the checked channels per
+  // Z step instead of a canvas per channel; the thresholds go along, so each setting is
+  // its own cached image on the server and in the browser
+  function mountComposite({ viewer, slider, label, checkboxes, composite }) {
+    checkboxes = [...checkboxes];
+    const thresholds = {};   // channel -> threshold [0-1]
+    const img = document.createElement('img');
+    img.className = 'chan-img visible';
+    img.style.pointerEvents = 'none';
+    viewer.appendChild(img);
+
+    function compositeUrl(z, chans) {
+      const levels = chans.map(chan => thresholds[chan].toFixed(4));
+      return `${composite}z${z}?ch=${chans.join(',')}&t=${levels.join(',')}`;
+    }
 
-        // Build the correct file path based on week and section
-        let src;
-        if (WEEK === 0) {
-          // Week 0: week0_z{z}_ch{chan}.png
-          src = `/static/processed_detailed/week${WEEK}/week${WEEK}_z${z}_ch${chan}.png`;
-        } else {
-          // Other weeks: week{week}_{section}_z{z}_ch{chan}.png
-          src = `/static/processed_detailed/week${WEEK}/${sectionName}/week${WEEK}_${sectionName}_z${z}_ch${chan}.png`;
+    function refresh() {
+      const z = parseInt(slider.value, 10);
+      const chans = checkboxes.filter(cbx => cbx.checked).map(cbx => parseInt(cbx.dataset.chan, 10));
+      img.hidden = !chans.length;
+      if (!chans.length) return;
+      img.src = compositeUrl(z, chans);
+
+      // Warm the browser (and server) cache for the neighbouring steps
+      idle(() => {
+        for (const dz of PREFETCH_COMPOSITES) {
+          const nz = z + dz;
+          if (nz >= parseInt(slider.min, 10) && nz <= parseInt(slider.max, 10)) {
+            new Image().src = compositeUrl(nz, chans);
+          }
         }
+      });
+    }
 
-        console.log(`🔗 Loading ${src}`);
-        img.src = src;
-        img.hidden = false;
-
-        // Handle load errors
-        img.onerror = () => {
-          console.warn(`Failed to load: ${src}`);
-          img.hidden = true;
-        };
-      } else if (img) {
-        console.log(`➖ Hiding channel ${chan} in section ${sectionName}`);
-        img.hidden = true;
-      }
+    const schedule = perFrame(refresh);
+    label.textContent = slider.value;
+    slider.addEventListener('input', () => {
+      label.textContent = slider.value;
+      schedule();
     });
+    checkboxes.forEach(cbx => cbx.addEventListener('change', schedule));
+    thresholdRow(viewer, checkboxes, thresholds, schedule);
+    refresh();
   }
-});
 
+  window.DetailViewer = { mount, mountComposite };
+})();
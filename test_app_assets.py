@@ -0,0 +1,88 @@
+# test_app_assets.py
+
+import gzip
+import re
+
+import pytest
+from PIL import Image
+
+import app as app_module
+import asset_manifest
+import responsive_images
+from asset_manifest import AssetManifest
+from catalog import Catalog
+from responsive_images import ImageVariants
+
+DZI = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+       '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="png" Overlap="0" TileSize="256">'
+       '<Size Width="4096" Height="4096"/></Image>\n' + '<!-- padding -->\n' * 80)
+
+@pytest.fixture
+def static(tmp_path, monkeypatch):
+    tiles = tmp_path / 'processed' / 'tiles'
+    (tiles / 'week1_channel2_files' / '0').mkdir(parents=True)
+    (tiles / 'week1_channel2.dzi').write_text(DZI)
+    (tiles / 'week1_channel2_files' / '0' / '0_0.png').write_bytes(b'\x89PNG tile')
+    asset_manifest.precompress(str(tmp_path))
+    manifest = str(tmp_path / '.asset_manifest.json')
+    asset_manifest.build(str(tmp_path), manifest)
+    monkeypatch.setattr(app_module.app, 'static_folder', str(tmp_path))
+    monkeypatch.setattr(app_module, 'ASSETS', AssetManifest(manifest))
+    return tmp_path
+
+def test_tiles_are_served_precompressed_with_the_asset_digest(static):
+    client = app_module.app.test_client()
+    digest = app_module.ASSETS.digest('processed/tiles/week1_channel2.dzi')
+
+    resp = client.get('/tiles/week1_channel2.dzi', headers={'Accept-Encoding': 'gzip'})
+    assert resp.status_code == 200
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(resp.data).decode() == DZI
+    assert resp.get_etag() == (f'{digest}-gzip', False)
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    assert resp.cache_control.max_age == app_module.TILES_MAX_AGE
+
+    tile = client.get('/tiles/week1_channel2_files/0/0_0.png')
+    assert tile.data == b'\x89PNG tile'
+    etag = app_module.ASSETS.digest('processed/tiles/week1_channel2_files/0/0_0.png')
+    assert tile.get_etag() == (etag, False)
+    assert client.get('/tiles/week1_channel2_files/0/0_0.png',
+                      headers={'If-None-Match': f'"{etag}"'}).status_code == 304
+    assert client.get('/tiles/week1_channel9.dzi').status_code == 404
+
+def test_week_page_media_come_from_media_url(tmp_path, monkeypatch):
+    (tmp_path / '3d_images' / 'week1').mkdir(parents=True)
+    monkeypatch.setattr(app_module.app, 'static_folder', str(tmp_path))
+    monkeypatch.setattr(app_module, 'CATALOG', Catalog(str(tmp_path)))
+    monkeypatch.setitem(app_module.app.config, 'MEDIA_URL', 'https://media.example/static/')
+    page = app_module.app.test_client().get('/week/1').get_data(as_text=True)
+    sources = re.findall(r'<(?:source|img)\b[^>]*\bsrc="([^"]*)"', page)
+    assert len([src for src in sources if src.endswith('.mp4')]) == 7
+    assert sources and all(src.startswith('https://media.example/static/') for src in sources)
+
+def test_responsive_img_lists_the_width_variants(tmp_path, monkeypatch):
+    (tmp_path / 'thumbnails').mkdir()
+    Image.new('RGB', (700, 350), (10, 200, 30)).save(tmp_path / 'thumbnails' / 'week1.png')
+    Image.new('RGB', (300, 150)).save(tmp_path / 'thumbnails' / 'week2.png')   # narrower than every step
+    manifest = str(tmp_path / '.image_variants.json')
+    responsive_images.build(str(tmp_path), manifest)
+    assert (tmp_path / 'variants' / 'thumbnails' / 'week1_640w.png').is_file()
+    monkeypatch.setattr(app_module, 'VARIANTS', ImageVariants(manifest))
+    monkeypatch.setattr(app_module, 'ASSETS', AssetManifest(str(tmp_path / '.asset_manifest.json')))
+
+    with app_module.app.test_request_context():
+        assert str(app_module.responsive_img('thumbnails/week1.png', '50vw')) == (
+            'src="/static/thumbnails/week1.png" '
+            'srcset="/static/variants/thumbnails/week1_320w.png 320w, '
+            '/static/variants/thumbnails/week1_640w.png 640w, /static/thumbnails/week1.png 700w" '
+            'sizes="50vw"')
+        assert str(app_module.responsive_img('thumbnails/week2.png')) == 'src="/static/thumbnails/week2.png"'
+        lazy = str(app_module.responsive_img('thumbnails/week1.png', lazy=True))
+        assert lazy.startswith('data-src="/static/thumbnails/week1.png" data-srcset="') and 'data-sizes="100vw"' in lazy
+
+        monkeypatch.setitem(app_module.app.config, 'MEDIA_URL', 'https://media.example/static/')
+        srcset = str(app_module.responsive_img('thumbnails/week1.png')).split('srcset="')[1].split('"')[0]
+        assert [c.split()[0] for c in srcset.split(', ')] == [
+            'https://media.example/static/variants/thumbnails/week1_320w.png',
+            'https://media.example/static/variants/thumbnails/week1_640w.png',
+            'https://media.example/static/thumbnails/week1.png']
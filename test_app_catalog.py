@@ -0,0 +1,55 @@
+# test_app_catalog.py
+
+import shutil
+
+import numpy as np
+from PIL import Image
+
+import app as app_module
+import batch_preprocess
+import czi_utils
+from catalog import Catalog
+
+def test_api_catalog(czi_stack, tmp_path, monkeypatch):
+    monkeypatch.setattr(czi_utils, 'DEDUPE_SLICES', True)
+    monkeypatch.setattr(czi_utils, 'CROP_SLICES', True)
+    monkeypatch.setattr(czi_utils, 'BUNDLE_SLICES', False)
+    (tmp_path / '3d_images' / 'week1').mkdir(parents=True)
+    (tmp_path / 'czi_images').mkdir()
+    (tmp_path / 'czi_images' / 'week1.czi').write_bytes(b'czi')
+    (tmp_path / 'czi_images_detailed' / 'week1' / 'kmc1').mkdir(parents=True)
+    shutil.copy(czi_stack, tmp_path / 'czi_images_detailed' / 'week1' / 'kmc1' / 'week1_kmc1.czi')
+    (tmp_path / 'czi_images_detailed' / 'week1' / 'HV').mkdir()
+    (tmp_path / 'czi_images_detailed' / 'week1' / 'HV' / 'week1_HV.tif').write_bytes(b'tif')
+
+    out_dir = str(tmp_path / 'processed_detailed' / 'week1' / 'kmc1')
+    batch_preprocess.pack_stack(out_dir, czi_utils.process_detailed_czi(czi_stack, out_dir))
+    vessel = tmp_path / 'vessel_processed_detailed' / 'week1' / 'healthy_venule'
+    vessel.mkdir(parents=True)
+    for z in (1, 2):
+        for ch in (1, 2):
+            Image.fromarray(np.full((4, 5), z * ch, np.uint8)).save(vessel / f'week1_healthy_venule_z{z}_ch{ch}.png')
+
+    monkeypatch.setattr(app_module, 'CATALOG', Catalog(str(tmp_path)))
+    client = app_module.app.test_client()
+    resp = client.get('/api/catalog')
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert resp.get_etag() == (data['version'], False)
+    assert client.get('/api/catalog', headers={'If-None-Match': f'"{data["version"]}"'}).status_code == 304
+
+    week = data['weeks']['1']
+    assert week['page'] is True
+    assert week['downloads'] == {'czi': '/download/week1'}
+    kmc1 = week['sections']['kmc1']
+    assert kmc1['folder'] == 'processed_detailed/week1/kmc1' and kmc1['stem'] == 'week1_kmc1'
+    assert kmc1['z'] == [1, 3] and kmc1['channels'] == [1, 2]
+    assert kmc1['missing'] == [[2, 2]]   # the blank plane the pipeline skipped
+    assert kmc1['size'] == [13, 6]       # the full frame, though the slices are cropped
+    assert kmc1['dedup'] is True and kmc1['crop'] is True and kmc1['bundle'] is False
+    assert kmc1['downloads'] == {'czi': '/download/detailweek1kmc1'}
+
+    venule = week['sections']['healthy-venule']
+    assert venule['z'] == [1, 2] and venule['missing'] == [] and venule['size'] == [5, 4]
+    assert venule['downloads'] == {'tif': '/download/detailweektif1HV'}
+    assert data['downloads'] == ['/download/detailweek1kmc1', '/download/detailweektif1HV', '/download/week1']
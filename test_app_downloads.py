@@ -0,0 +1,65 @@
+# test_app_downloads.py
+
+import pytest
+
+import app as app_module
+from catalog import Catalog
+
+DATA = bytes(range(256)) * 16
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    (tmp_path / 'czi_images').mkdir()
+    (tmp_path / 'czi_images' / 'week7.czi').write_bytes(DATA)
+    (tmp_path / 'czi_images_detailed' / 'week0').mkdir(parents=True)
+    (tmp_path / 'czi_images_detailed' / 'week0' / 'week0.czi').write_bytes(DATA[:100])
+    monkeypatch.setattr(app_module.app, 'static_folder', str(tmp_path))
+    monkeypatch.setattr(app_module, 'CATALOG', Catalog(str(tmp_path)))
+    monkeypatch.setitem(app_module.app.config, 'DOWNLOAD_OFFLOAD', '')
+    return app_module.app.test_client()
+
+def test_full_download(client):
+    resp = client.get('/download/week7')
+    assert resp.status_code == 200
+    assert resp.data == DATA
+    assert resp.headers['Accept-Ranges'] == 'bytes'
+    assert resp.headers['ETag'] and resp.headers['Last-Modified']
+    assert 'attachment' in resp.headers['Content-Disposition']
+    assert client.get('/download/week8').status_code == 404
+
+def test_main_alias(client):
+    # /download/main/week<int> hands an int week to the detailweek route
+    resp = client.get('/download/main/week0')
+    assert resp.status_code == 200
+    assert resp.data == DATA[:100]
+    assert 'detailweek0.czi' in resp.headers['Content-Disposition']
+    assert client.get('/download/main/week1').status_code == 404
+
+def test_range_resumes(client):
+    resp = client.get('/download/week7', headers={'Range': 'bytes=1000-'})
+    assert resp.status_code == 206
+    assert resp.data == DATA[1000:]
+    assert resp.headers['Content-Range'] == f'bytes 1000-{len(DATA) - 1}/{len(DATA)}'
+    assert client.get('/download/week7', headers={'Range': f'bytes={len(DATA)}-'}).status_code == 416
+
+def test_if_range(client):
+    full = client.get('/download/week7')
+    etag, modified = full.headers['ETag'], full.headers['Last-Modified']
+    for validator in (etag, modified):
+        resp = client.get('/download/week7', headers={'Range': 'bytes=0-99', 'If-Range': validator})
+        assert resp.status_code == 206
+        assert resp.data == DATA[:100]
+    # The file changed since: the whole file again, not a range of the new content
+    resp = client.get('/download/week7', headers={'Range': 'bytes=0-99', 'If-Range': '"stale"'})
+    assert resp.status_code == 200
+    assert resp.data == DATA
+
+def test_conditional_get(client):
+    etag = client.get('/download/week7').headers['ETag']
+    assert client.get('/download/week7', headers={'If-None-Match': etag}).status_code == 304
+
+def test_offload_headers(client, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'DOWNLOAD_OFFLOAD', 'x-accel')
+    resp = client.get('/download/week7')
+    assert resp.headers['X-Accel-Redirect'] == '/protected-static/czi_images/week7.czi'
+    assert resp.data == b''
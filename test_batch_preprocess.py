@@ -0,0 +1,49 @@
+# test_batch_preprocess.py
+
+import os
+import shutil
+
+import pytest
+
+import batch_preprocess
+import czi_utils
+from build_manifest import BuildManifest, processing_params
+
+@pytest.fixture
+def tree(czi_stack, tmp_path, monkeypatch):
+    (tmp_path / 'czi_images').mkdir()
+    kmc = tmp_path / 'czi_images_detailed' / 'week1' / 'kmc1'
+    kmc.mkdir(parents=True)
+    shutil.copy(czi_stack, kmc / 'week1_kmc1.czi')
+    monkeypatch.setattr(batch_preprocess, 'MAIN_IN', str(tmp_path / 'czi_images'))
+    monkeypatch.setattr(batch_preprocess, 'DET_IN', str(tmp_path / 'czi_images_detailed'))
+    monkeypatch.setattr(czi_utils, 'BUNDLE_SLICES', False)
+    return tmp_path
+
+def _run(tree, monkeypatch, name, batch):
+    out = tree / name
+    monkeypatch.setattr(batch_preprocess, 'MAIN_OUT', str(out / 'processed'))
+    monkeypatch.setattr(batch_preprocess, 'DET_OUT', str(out / 'processed_detailed'))
+    summary = {'ok': 0, 'skipped': 0, 'failed': [], 'planes': 0, 'pruned': 0}
+    batch({'manifest': BuildManifest(str(tree / f'{name}.json')), 'params': processing_params(),
+           'force': False, 'summary': summary})
+    files = {}
+    for root, _, names in os.walk(out):
+        for fn in names:
+            path = os.path.join(root, fn)
+            with open(path, 'rb') as fh:
+                files[os.path.relpath(path, out)] = fh.read()
+    return summary, files
+
+def test_plane_chunks_cover_the_stack_in_order(czi_stack):
+    chunks = batch_preprocess._plane_chunks(czi_stack, 1)
+    assert len(chunks) == 3   # 6 planes over CHUNKS_PER_JOB = 4
+    assert [plane for chunk in chunks for plane in chunk] == [(z, c) for z in range(3) for c in range(2)]
+
+@pytest.mark.parametrize('normalization', ['plane', 'stack'])
+def test_parallel_run_writes_the_serial_output(tree, monkeypatch, normalization):
+    monkeypatch.setattr(czi_utils, 'STACK_NORMALIZATION', normalization)
+    serial, expected = _run(tree, monkeypatch, 'serial', batch_preprocess.batch_detailed)
+    parallel, files = _run(tree, monkeypatch, 'parallel', lambda build: batch_preprocess.batch_parallel(build, 2))
+    assert serial == parallel and serial['ok'] == 1 and not serial['failed']
+    assert files == expected and files
@@ -0,0 +1,74 @@
+# test_build_manifest.py
+
+import os
+
+import pytest
+
+from build_manifest import BuildManifest
+
+@pytest.fixture
+def tree(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'czi_images').mkdir(parents=True)
+    (static / 'processed').mkdir()
+    src = static / 'czi_images' / 'week1.czi'
+    src.write_bytes(b'raw week 1')
+    return static, src
+
+def outputs(static, *names):
+    paths = [static / 'processed' / name for name in names]
+    for path in paths:
+        path.write_bytes(b'png')
+    return [str(path) for path in paths]
+
+def test_unchanged_source_is_fresh_after_reload(tree):
+    static, src = tree
+    manifest = BuildManifest(str(static / '.build_manifest.json'))
+    digest = manifest.digest(str(src))
+    manifest.record(str(src), 'flat', digest, {'a': 1}, outputs(static, 'week1_channel1.png'))
+    manifest.save()
+
+    reloaded = BuildManifest(str(static / '.build_manifest.json'))
+    assert reloaded.digest(str(src)) == digest
+    assert reloaded.is_fresh(str(src), 'flat', digest, {'a': 1})
+    assert not reloaded.is_fresh(str(src), 'flat', digest, {'a': 2})
+    assert not reloaded.is_fresh(str(src), 'detail', digest, {'a': 1})
+
+def test_changed_source_or_missing_output_is_stale(tree):
+    static, src = tree
+    manifest = BuildManifest(str(static / '.build_manifest.json'))
+    digest = manifest.digest(str(src))
+    [out] = outputs(static, 'week1_channel1.png')
+    manifest.record(str(src), 'flat', digest, {}, [out])
+
+    os.remove(out)
+    assert not manifest.is_fresh(str(src), 'flat', digest, {})
+
+    src.write_bytes(b'raw week 1, edited')
+    assert manifest.digest(str(src)) != digest
+
+def test_record_removes_outputs_no_longer_produced(tree):
+    static, src = tree
+    manifest = BuildManifest(str(static / '.build_manifest.json'))
+    digest = manifest.digest(str(src))
+    manifest.record(str(src), 'flat', digest, {}, outputs(static, 'week1_channel1.png', 'week1_channel2.png'))
+
+    removed = manifest.record(str(src), 'flat', digest, {}, outputs(static, 'week1_channel1.png'))
+    assert removed == ['static/processed/week1_channel2.png']
+    assert not (static / 'processed' / 'week1_channel2.png').exists()
+    assert (static / 'processed' / 'week1_channel1.png').exists()
+
+def test_prune_removes_outputs_of_deleted_sources_only(tree):
+    static, src = tree
+    other = static / 'czi_images' / 'week2.czi'
+    other.write_bytes(b'raw week 2')
+    manifest = BuildManifest(str(static / '.build_manifest.json'))
+    manifest.record(str(src), 'flat', manifest.digest(str(src)), {},
+                    outputs(static, 'week1_channel1.png', 'shared.png'))
+    manifest.record(str(other), 'flat', manifest.digest(str(other)), {},
+                    outputs(static, 'week2_channel1.png', 'shared.png'))
+
+    os.remove(src)
+    assert manifest.prune() == ['static/processed/week1_channel1.png']
+    assert list(manifest.entries) == ['static/czi_images/week2.czi']
+    assert (static / 'processed' / 'shared.png').exists()
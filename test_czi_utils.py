@@ -0,0 +1,131 @@
+# test_czi_utils.py
+
+import os
+
+import numpy as np
+import pytest
+from czifile import CziFile
+from PIL import Image
+
+import czi_utils
+from conftest import write_czi
+
+def test_plane_reader_matches_asarray(czi_stack):
+    with CziFile(czi_stack) as czi:
+        arr = np.squeeze(czi.asarray(max_workers=1))
+    with czi_utils.CziPlaneReader(czi_stack) as reader:
+        assert reader.shape == arr.shape[:-2]
+        assert reader.plane_shape == arr.shape[-2:]
+        assert reader.dtype == arr.dtype
+        for index in np.ndindex(*reader.shape):
+            np.testing.assert_array_equal(reader.read(*index), arr[index])
+        assert [index for index, _ in reader] == list(np.ndindex(*reader.shape))
+
+def test_detail_alpha_per_plane_matches_the_lut_scaling():
+    plane = np.array([[1000, 1500], [2000, 3000]], dtype=np.uint16)
+    alpha = czi_utils.detail_alpha(plane)
+    assert alpha.min() == 0 and alpha.max() == 255   # the plane's minimum is subtracted
+    lut = czi_utils.detail_luts({0: (1000, 3000)}, plane.dtype)[0]
+    np.testing.assert_array_equal(alpha, czi_utils.detail_alpha(plane, lut))
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.uint16])
+@pytest.mark.parametrize('ch_idx', sorted(czi_utils.CHANNEL_THRESHOLDS))
+def test_plane_alpha_lut_matches_the_float_kernel(dtype, ch_idx):
+    plane = np.random.default_rng(ch_idx).integers(3, np.iinfo(dtype).max // 2, (17, 23)).astype(dtype)
+    expected = czi_utils._normalized_alpha(plane.astype(np.float32), ch_idx)
+    np.testing.assert_array_equal(czi_utils._plane_alpha(plane, ch_idx), expected)
+
+    lo, hi = 10, int(plane.max()) + 5   # a stack-wide range wider than the plane
+    lut = czi_utils._alpha_lut(lo, hi, ch_idx, np.iinfo(dtype).max + 1)
+    expected = czi_utils._normalized_alpha(plane.astype(np.float32), ch_idx, lo, hi)
+    np.testing.assert_array_equal(czi_utils._plane_alpha(plane, ch_idx, lut), expected)
+
+def _pil_orientation(p8, orientation):
+    """The per-week scripts' steps: PIL rotate (expanding), then a mirror."""
+    img = Image.fromarray(p8).rotate(orientation.get('rotate', 0), expand=True)
+    if orientation.get('flip') == 'horizontal':
+        img = img.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+    elif orientation.get('flip') == 'vertical':
+        img = img.transpose(Image.Transpose.FLIP_TOP_BOTTOM)
+    return np.asarray(img)
+
+@pytest.mark.parametrize('week', sorted(czi_utils.WEEK_ORIENTATION))
+def test_orient_plane_matches_the_affine(week):
+    orientation = czi_utils.WEEK_ORIENTATION[week]
+    p8 = np.random.default_rng(1).integers(0, 256, (20, 32), dtype=np.uint8)
+    out = czi_utils.orient_plane(p8, orientation)
+    size, coeffs = czi_utils.orientation_affine(p8.shape[::-1], orientation.get('rotate', 0), orientation.get('flip'))
+    assert out.shape == size[::-1]
+    if orientation.get('rotate', 0) % 90 == 0:
+        # Exact: a pixel reorder, the same one the one-pass affine and the old scripts produce
+        np.testing.assert_array_equal(out, _pil_orientation(p8, orientation))
+        affine = Image.fromarray(p8).transform(size, Image.Transform.AFFINE, coeffs,
+                                               resample=Image.Resampling.NEAREST)
+        np.testing.assert_array_equal(out, np.asarray(affine))
+    else:
+        # One bilinear resample onto the rotated bounding box: the centre keeps its value
+        flat = czi_utils.orient_plane(np.full((21, 31), 200, np.uint8), orientation)
+        assert flat[flat.shape[0] // 2, flat.shape[1] // 2] == 200
+        assert flat[0, 0] == 0   # outside the rotated source
+
+def test_process_czi_orients_by_week(tmp_path, monkeypatch):
+    monkeypatch.setattr(czi_utils, 'SLICE_MODE', 'gray')
+    monkeypatch.setattr(czi_utils, 'TILE_SIZE', 0)
+    rng = np.random.default_rng(2)
+    planes = [rng.integers(0, 4000, (6, 9)).astype(np.uint16) for _ in range(2)]
+    path = tmp_path / 'week2.czi'
+    write_czi(path, [((0, c), (0, 0), plane) for c, plane in enumerate(planes)])
+    names = czi_utils.process_czi(str(path), str(tmp_path / 'out'))
+    assert names == ['week2_channel1.png', 'week2_channel2.png']
+    for name, plane in zip(names, planes):
+        with Image.open(tmp_path / 'out' / name) as img:
+            expected = czi_utils.orient_plane(czi_utils._plane_alpha(plane, None), czi_utils.WEEK_ORIENTATION['week2'])
+            np.testing.assert_array_equal(np.asarray(img), expected)
+            assert img.size == (6, 9)   # rotated a quarter turn
+
+def test_write_tile_pyramid_levels(tmp_path, monkeypatch):
+    monkeypatch.setattr(czi_utils, 'OUTPUT_FORMAT', 'png')
+    width, height, tile = 300, 130, 128
+    img = Image.fromarray(np.random.default_rng(3).integers(0, 256, (height, width), dtype=np.uint8))
+    written = czi_utils.write_tile_pyramid(img, str(tmp_path), 'week1_channel2', tile)
+
+    dzi = (tmp_path / 'week1_channel2.dzi').read_text()
+    assert 'TileSize="128"' in dzi and 'Overlap="0"' in dzi and 'Format="png"' in dzi
+    assert f'<Size Width="{width}" Height="{height}"/>' in dzi
+    max_level = 9   # ceil(log2(300))
+    assert sorted(os.listdir(tmp_path / 'week1_channel2_files'), key=int) == [str(l) for l in range(max_level + 1)]
+    for level in range(max_level + 1):
+        # Deep Zoom: each level halves the one above, rounding up, down to 1 x 1
+        scale = 2 ** (max_level - level)
+        w, h = -(-width // scale), -(-height // scale)
+        cols, rows = -(-w // tile), -(-h // tile)
+        level_dir = tmp_path / 'week1_channel2_files' / str(level)
+        assert len(os.listdir(level_dir)) == cols * rows
+        for col in range(cols):
+            for row in range(rows):
+                with Image.open(level_dir / f'{col}_{row}.png') as t:
+                    assert t.size == (min(tile, w - col * tile), min(tile, h - row * tile))
+    assert len(written) == sum(len(os.listdir(tmp_path / 'week1_channel2_files' / str(l)))
+                               for l in range(max_level + 1)) + 1
+    with Image.open(tmp_path / 'week1_channel2_files' / str(max_level) / '1_0.png') as t:
+        np.testing.assert_array_equal(np.asarray(t), np.asarray(img)[:tile, tile:2 * tile])
+
+@pytest.mark.parametrize('preset', ['default', 'fast', 'small'])
+@pytest.mark.parametrize('fmt', sorted(czi_utils.ENCODERS))
+def test_save_slice_encoders(tmp_path, fmt, preset):
+    if fmt != 'png' and not czi_utils.features.check(fmt):
+        pytest.skip(f"Pillow without {fmt}")
+    alpha = (np.arange(24 * 32, dtype=np.uint32).reshape(24, 32) * 7 % 256).astype(np.uint8)
+    img = czi_utils._tint_alpha(alpha, 1)
+    path = czi_utils.save_slice(img, str(tmp_path / 'slice'), fmt, preset)
+    assert path == str(tmp_path / 'slice') + czi_utils.slice_ext(fmt)
+    with Image.open(path) as out:
+        assert out.format == czi_utils.ENCODERS[fmt][1] and out.size == img.size
+        if fmt != 'avif':   # PNG and WebP are lossless
+            np.testing.assert_array_equal(np.asarray(out.convert('RGBA')), np.asarray(img))
+
+def test_missing_encoder_is_reported(monkeypatch):
+    monkeypatch.setattr(czi_utils.features, 'check', lambda feature: False)
+    with pytest.raises(ValueError, match='webp'):
+        czi_utils.encode_slice(Image.new('RGBA', (2, 2)), 'webp')
+    assert czi_utils.encode_slice(Image.new('RGBA', (2, 2)), 'png').startswith(b'\x89PNG')
@@ -0,0 +1,58 @@
+# test_png_optimize.py
+
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import czi_utils
+import png_optimize
+
+def _decode(data: bytes) -> Image.Image:
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        return img
+
+def test_tinted_slice_round_trips_as_palette():
+    alpha = np.arange(64, dtype=np.uint8).reshape(8, 8) * 4
+    img = czi_utils._tint_alpha(alpha, 2)
+    mode, _, palette = png_optimize.reduce_pixels(img)
+    assert mode == 'P' and len(palette) == 64
+    assert png_optimize.same_pixels(img, _decode(png_optimize.encode_png(img)))
+
+def test_wide_modes_are_rejected_and_left_alone(tmp_path):
+    img = Image.fromarray(np.array([[0, 1], [256, 65535]], dtype=np.uint16))
+    assert img.mode == 'I;16'
+    with pytest.raises(ValueError):
+        png_optimize.reduce_pixels(img)
+    # Pixels that only differ below the top 8 bits are not the same
+    assert not png_optimize.same_pixels(img, Image.fromarray(np.array([[0, 0], [256, 65535]], dtype=np.uint16)))
+
+    path = tmp_path / 'wide.png'
+    img.save(path)
+    before = path.read_bytes()
+    assert png_optimize.optimize_file(str(path)) == (len(before), len(before))
+    assert path.read_bytes() == before
+
+def test_encode_slice_keeps_the_smaller_png(monkeypatch):
+    monkeypatch.setattr(czi_utils, 'OPTIMIZE_PNG', True)
+    img = Image.new('RGBA', (1, 1), (10, 20, 30, 40))   # a palette + tRNS costs more than it saves
+    buf = io.BytesIO()
+    img.save(buf, 'PNG')
+    assert len(png_optimize.encode_png(img)) > buf.tell()
+    out = czi_utils.encode_slice(img, 'png', 'default')
+    assert len(out) == buf.tell()
+    assert png_optimize.same_pixels(img, _decode(out))
+
+def test_encode_slice_leaves_large_images_to_pillow(monkeypatch):
+    monkeypatch.setattr(czi_utils, 'OPTIMIZE_PNG', True)
+    monkeypatch.setattr(czi_utils, 'OPTIMIZE_PNG_MAX_PIXELS', 128 * 128 - 1)
+    rgba = np.zeros((128, 128, 4), np.uint8)
+    rgba[..., 1] = 255
+    rgba[..., 3] = (np.arange(128)[None, :] + np.arange(128)[:, None]) % 8 * 30
+    img = Image.fromarray(rgba, 'RGBA')   # one tint: encode_png would pick a smaller palette
+    buf = io.BytesIO()
+    img.save(buf, 'PNG')
+    assert len(png_optimize.encode_png(img)) < buf.tell()
+    assert czi_utils.encode_slice(img, 'png', 'default') == buf.getvalue()
@@ -0,0 +1,102 @@
+# test_slice_server.py
+
+import os
+import shutil
+
+import numpy as np
+from PIL import Image
+
+import batch_preprocess
+import czi_utils
+from slice_server import Compositor, SliceFiles, SliceServer
+
+def test_slice_files_rebuild_deduplicated_cropped_stack(czi_stack, tmp_path, monkeypatch):
+    monkeypatch.setattr(czi_utils, 'DEDUPE_SLICES', True)
+    monkeypatch.setattr(czi_utils, 'CROP_SLICES', True)
+    monkeypatch.setattr(czi_utils, 'BUNDLE_SLICES', False)
+    root = tmp_path / 'processed'
+    out_dir = str(root / 'week1' / 'kmc1')
+    slices = czi_utils.process_detailed_czi(czi_stack, out_dir)
+    batch_preprocess.pack_stack(out_dir, slices)
+
+    assert os.path.isfile(os.path.join(out_dir, 'week1_kmc1.crop.json'))
+    objects = os.listdir(os.path.join(out_dir, czi_utils.SLICE_OBJECTS))
+    files = SliceFiles(str(root), 1 << 20)
+    with czi_utils.CziPlaneReader(czi_stack) as reader:
+        assert len(objects) < np.prod(reader.shape)
+        luts = czi_utils.detail_luts(czi_utils.stack_value_ranges(reader, 1), reader.dtype)
+        for z, c in np.ndindex(*reader.shape):
+            expected = czi_utils.detail_alpha(reader.read(z, c), luts.get(c))
+            np.testing.assert_array_equal(files.alpha(1, 'kmc1', z + 1, c + 1), expected)
+    assert not files.alpha(1, 'kmc1', 2, 2).any()   # the blank plane
+
+def test_slice_server_loads_batch_value_ranges(czi_stack, tmp_path):
+    czi_root, processed = tmp_path / 'czi', tmp_path / 'processed'
+    os.makedirs(czi_root / 'week1' / 'kmc1')
+    shutil.copy(czi_stack, czi_root / 'week1' / 'kmc1' / 'week1_kmc1.czi')
+    out_dir = str(processed / 'week1' / 'kmc1')
+    os.makedirs(out_dir)
+    # Not the stack's real ranges, so slices only match if the sidecar was used
+    ranges = {0: (0, 100), 1: (50, 60000)}
+    names = batch_preprocess.pack_stack(out_dir, {}, czi_stack, ranges)
+    assert names == ['week1_kmc1.ranges.json']
+
+    server = SliceServer(str(czi_root), 1 << 20, ranges_root=str(processed))
+    with czi_utils.CziPlaneReader(czi_stack) as reader:
+        luts = czi_utils.detail_luts(ranges, reader.dtype)
+        np.testing.assert_array_equal(server.alpha(1, 'kmc1', 1, 2),
+                                      czi_utils.detail_alpha(reader.read(0, 1), luts[1]))
+
+class _CountingSource:
+    def __init__(self):
+        self.reads = 0
+
+    def alpha(self, week, section, z, chan):
+        self.reads += 1
+        return np.arange(256, dtype=np.uint8).reshape(16, 16)
+
+def test_compositor_caches_per_channel_set_and_thresholds():
+    source = _CountingSource()
+    compositor = Compositor(source, 1 << 20, 'png', 'fast')
+    default = compositor.render(1, 'kmc1', 3, [2, 1])
+    assert source.reads == 2
+    # Same channels in another order, and the defaults as the viewers send them (4 decimals)
+    sent = {1: round(czi_utils.CHANNEL_THRESHOLDS[1], 4), 2: round(czi_utils.CHANNEL_THRESHOLDS[2], 4)}
+    assert compositor.render(1, 'kmc1', 3, [1, 2], sent) is default
+    assert source.reads == 2
+
+    raised = compositor.render(1, 'kmc1', 3, [1, 2], {1: 0.5})
+    assert source.reads == 4 and raised != default
+    assert compositor.render(1, 'kmc1', 4, [1, 2], {1: 0.5}) is not raised
+    assert compositor.render(1, 'kmc1', 3, [1], {1: 0.5}) is not raised
+
+def test_slice_files_read_vessel_sections(tmp_path):
+    folder = tmp_path / 'vessel' / 'week2' / 'healthy_venule'
+    folder.mkdir(parents=True)
+    gray = np.arange(12, dtype=np.uint8).reshape(3, 4)
+    Image.fromarray(gray).save(folder / 'week2_healthy_venule_z5_ch3.png')
+    files = SliceFiles(str(tmp_path / 'processed'), 1 << 20, str(tmp_path / 'vessel'))
+    np.testing.assert_array_equal(files.alpha(2, 'healthy-venule', 5, 3), gray)
+    assert files.alpha(2, 'healthy-venule', 6, 3) is None
+    assert SliceFiles(str(tmp_path / 'processed')).alpha(2, 'healthy-venule', 5, 3) is None
+
+def test_slice_files_read_bundled_stack(czi_stack, tmp_path, monkeypatch):
+    monkeypatch.setattr(czi_utils, 'BUNDLE_SLICES', True)
+    monkeypatch.setattr(czi_utils, 'CROP_SLICES', True)
+    root = tmp_path / 'processed'
+    out_dir = str(root / 'week1' / 'kmc1')
+    names = batch_preprocess.pack_stack(out_dir, czi_utils.process_detailed_czi(czi_stack, out_dir))
+    assert 'week1_kmc1_ch2.bundle' in names and 'week1_kmc1_ch2.json' in names
+    assert not [name for name in os.listdir(out_dir) if '_z' in name]   # packed, not loose
+
+    files = SliceFiles(str(root), 1 << 20)
+    with czi_utils.CziPlaneReader(czi_stack) as reader:
+        luts = czi_utils.detail_luts(czi_utils.stack_value_ranges(reader, 1), reader.dtype)
+        for z, c in np.ndindex(*reader.shape):
+            expected = czi_utils.detail_alpha(reader.read(z, c), luts.get(c))
+            np.testing.assert_array_equal(files.alpha(1, 'kmc1', z + 1, c + 1), expected)
+    # The offset index is parsed once and kept until the file changes
+    index_path = os.path.join(out_dir, 'week1_kmc1_ch1.json')
+    assert index_path in files._manifests
+    assert not files.alpha(1, 'kmc1', 2, 2).any()   # the blank plane, not written to the bundle
+    assert files.alpha(1, 'kmc1', 4, 1) is None
@@ -0,0 +1,75 @@
+# test_transform_assets.py
+
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import transform_assets
+
+@pytest.fixture
+def static(tmp_path, monkeypatch):
+    monkeypatch.setattr(transform_assets, 'STATIC', str(tmp_path))
+    monkeypatch.setattr(transform_assets, 'ORIGINALS', str(tmp_path / '.originals'))
+    monkeypatch.setattr(transform_assets, 'STATE', str(tmp_path / '.originals' / 'state.json'))
+    monkeypatch.setattr(transform_assets, 'WEEK_TRANSFORMS', {
+        2: [(['thumbnails/week2.png'], [('flip', {}), ('scale_content', {'factor': 2})])],
+    })
+    (tmp_path / 'thumbnails').mkdir()
+    return tmp_path
+
+def _thumbnail(path, left):
+    arr = np.zeros((20, 30, 3), np.uint8)
+    arr[8:12, left:left + 4] = 200
+    Image.fromarray(arr).save(path)
+    return arr
+
+def _content_box(path):
+    with Image.open(path) as img:
+        return transform_assets._content_box(img, transform_assets.CONTENT_THRESHOLD)
+
+def test_rerun_starts_from_the_original(static):
+    asset = static / 'thumbnails' / 'week2.png'
+    _thumbnail(asset, 4)
+    assert transform_assets.main([]) == 0
+    # Mirrored to columns 22-25, then doubled about its center
+    assert _content_box(asset) == (19, 5, 27, 13)
+    assert (static / '.originals' / 'thumbnails' / 'week2.png').is_file()
+    done = asset.read_bytes()
+
+    assert transform_assets.main([]) == 0     # up to date
+    assert asset.read_bytes() == done
+    assert transform_assets.main(['--force']) == 0   # not flipped or scaled twice
+    assert asset.read_bytes() == done
+
+    _thumbnail(asset, 10)                     # regenerated: the new original
+    assert transform_assets.main([]) == 0
+    assert _content_box(asset) == (13, 5, 21, 13)
+
+def test_adopt_leaves_transformed_files_alone(static):
+    asset = static / 'thumbnails' / 'week2.png'
+    _thumbnail(asset, 4)
+    before = asset.read_bytes()
+    assert transform_assets.main(['--adopt']) == 0
+    assert transform_assets.main([]) == 0
+    assert asset.read_bytes() == before
+    assert not os.path.exists(static / '.originals' / 'thumbnails')
+
+def test_color_key_matches_a_per_pixel_reference():
+    rng = np.random.default_rng(1)
+    rgb = rng.integers(0, 256, (40, 50, 3)).astype(np.uint8)
+    rgb[::3, ::4] = (0, 0, 131)
+    rgb[1::5, ::2] = (2, 1, 129)
+    rgb[2::7] = (0, 0, 0)
+    colors = [(0, 0, 131), (0, 0, 0), (255, 255, 255)]
+    for tolerance in (0, 2, 40):
+        expected = np.zeros(rgb.shape[:2], bool)
+        for color in colors:
+            expected |= (np.abs(rgb.astype(int) - color) <= tolerance).all(axis=2)
+        np.testing.assert_array_equal(transform_assets.key_mask(rgb, colors, tolerance), expected)
+
+    keyed = np.asarray(transform_assets.color_key(Image.fromarray(rgb), colors[:1]))
+    hit = (rgb == (0, 0, 131)).all(axis=2)
+    assert hit.sum() > 0 and (keyed[hit] == 0).all()
+    np.testing.assert_array_equal(keyed[~hit], np.dstack([rgb, np.full(rgb.shape[:2], 255, np.uint8)])[~hit])
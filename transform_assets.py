@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Per-week transforms of the overview assets (thumbnails, heatmaps),
+replacing the process_week*_thumbnail / process_week*_heatmaps / flip_* /
+rotate_* scripts. The channel overviews are oriented by process_czi itself
+(czi_utils.WEEK_ORIENTATION).
+
+Every asset is decoded once, run through its chain of operations in memory
+and encoded once. The first time an asset is transformed its original is
+kept under static/.originals/, and every later run starts from that copy,
+so re-running never stacks a rotation or scale twice. An asset whose file
+was regenerated since (e.g. by batch_preprocess.py) becomes the new original.
+Assets the old scripts already transformed in place are registered once
+with --adopt so they are not transformed a second time.
+
+    python transform_assets.py                  # all weeks
+    python transform_assets.py --week 2 -j 4
+    python transform_assets.py --dry-run
+    python transform_assets.py --adopt          # once, on a tree the old scripts ran on
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from build_manifest import file_sha256
+
+STATIC    = 'static'
+ORIGINALS = os.path.join(STATIC, '.originals')
+STATE     = os.path.join(ORIGINALS, 'state.json')
+
+# Pixels with any RGB component above this count as content (not background)
+CONTENT_THRESHOLD = 30
+
+# Per-week transforms: (asset globs relative to static/, [(operation, options), ...]).
+# Operations run left to right; see OPERATIONS.
+WEEK_TRANSFORMS = {
+    1: [
+        (['thumbnails/week1.png'], [('scale_content', {'factor': 1.2})]),
+    ],
+    2: [
+        (['thumbnails/week2.png'], [('flip', {}), ('scale_content', {'factor': 0.8})]),
+        (['heatmaps/week2_*_heatmap.png'], [
+            ('flip', {}),
+            ('color_key', {'colors': [(0, 0, 0), (0, 0, 131)]}),
+            ('rotate', {'degrees': 10}),
+            ('fill_background', {'color': (0, 0, 131)}),
+        ]),
+    ],
+    6: [
+        (['thumbnails/week6.png'], [('scale_content', {'factor': 1.1})]),
+    ],
+}
+
+def _content_box(img: Image.Image, threshold: int):
+    """Bounding box (left, top, right, bottom) of the pixels brighter than ``threshold``, or None."""
+    arr = np.asarray(img.convert('RGB') if img.mode not in ('L', 'RGB') else img)
+    mask = arr > threshold
+    if mask.ndim == 3:
+        mask = mask.any(axis=2)
+    rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+    if not rows.size:
+        return None
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+def _background(mode: str, color):
+    """``color`` as a fill value for ``mode`` (opaque in RGBA)."""
+    color = tuple(color)
+    if mode == 'L':
+        return color[0]
+    if mode == 'RGBA':
+        return color[:3] + (255,)
+    return color[:3]
+
+def crop_to_content(img: Image.Image, threshold: int = CONTENT_THRESHOLD, pad: int = 0) -> Image.Image:
+    """Crop to the bounding box of the non-background pixels plus ``pad``."""
+    box = _content_box(img, threshold)
+    if box is None:
+        return img
+    left, top, right, bottom = box
+    return img.crop((max(0, left - pad), max(0, top - pad),
+                     min(img.width, right + pad), min(img.height, bottom + pad)))
+
+def scale_content(img: Image.Image, factor: float, threshold: int = CONTENT_THRESHOLD,
+                  background=(0, 0, 0)) -> Image.Image:
+    """Scale the non-background content by ``factor`` about its center, keeping the canvas size."""
+    box = _content_box(img, threshold)
+    if box is None:
+        raise ValueError("No content above the threshold")
+    left, top, right, bottom = box
+    w, h = right - left, bottom - top
+    nw, nh = int(w * factor), int(h * factor)
+    scaled = img.crop(box).resize((nw, nh), Image.Resampling.LANCZOS)
+
+    # Centered on the old content, shifted back inside the canvas where possible
+    x0 = max(0, min((left + right - 1) // 2 - nw // 2, img.width - nw))
+    y0 = max(0, min((top + bottom - 1) // 2 - nh // 2, img.height - nh))
+    out = Image.new(img.mode, img.size, _background(img.mode, background))
+    out.paste(scaled.crop((0, 0, min(nw, img.width - x0), min(nh, img.height - y0))), (x0, y0))
+    return out
+
+def rotate(img: Image.Image, degrees: float, canvas: str = 'fit', resample: str = 'nearest') -> Image.Image:
+    """Rotate counter-clockwise, filling uncovered pixels with transparency (or black).
+
+    ``canvas``: 'fit' grows the canvas to the rotated bounding box before
+    rotating (the heatmap/channel scripts), 'expand' is Pillow's expand=True,
+    'same' keeps the size and crops.
+    """
+    img = img.convert('RGBA') if img.mode in ('LA', 'P') else img
+    fill = (0, 0, 0, 0) if img.mode == 'RGBA' else _background(img.mode, (0, 0, 0))
+    method = getattr(Image.Resampling, resample.upper())
+    if canvas == 'fit':
+        rad = math.radians(degrees)
+        cos_a, sin_a = abs(math.cos(rad)), abs(math.sin(rad))
+        size = (int(img.width * cos_a + img.height * sin_a), int(img.width * sin_a + img.height * cos_a))
+        grown = Image.new(img.mode, size, fill)
+        grown.paste(img, ((size[0] - img.width) // 2, (size[1] - img.height) // 2))
+        img = grown
+    return img.rotate(degrees, resample=method, expand=(canvas == 'expand'), fillcolor=fill)
+
+def flip(img: Image.Image, axis: str = 'horizontal') -> Image.Image:
+    """Mirror left-right ('horizontal') or top-bottom ('vertical')."""
+    if axis not in ('horizontal', 'vertical'):
+        raise ValueError(f"Unknown flip axis {axis!r}")
+    return img.transpose(Image.Transpose.FLIP_LEFT_RIGHT if axis == 'horizontal'
+                         else Image.Transpose.FLIP_TOP_BOTTOM)
+
+def key_mask(rgb: np.ndarray, colors=((0, 0, 0),), tolerance: int = 0) -> np.ndarray:
+    """Boolean (Y, X) mask of the pixels within ``tolerance`` (per component) of any of ``colors``.
+
+    Exact keys compare the packed 24-bit RGB value once; with a tolerance each
+    key is a per-component uint8 range test, so nothing is widened past uint8.
+    """
+    if not tolerance:
+        packed = (rgb[..., 0].astype(np.uint32) << 16) | (rgb[..., 1].astype(np.uint32) << 8) | rgb[..., 2]
+        keys = [(r << 16) | (g << 8) | b for r, g, b in (tuple(int(v) for v in c[:3]) for c in colors)]
+        return packed == keys[0] if len(keys) == 1 else np.isin(packed, keys)
+    mask = np.zeros(rgb.shape[:2], dtype=bool)
+    for color in colors:
+        hit = None
+        for k, value in enumerate(color[:3]):
+            lo, hi = max(0, value - tolerance), min(255, value + tolerance)
+            comp = rgb[..., k]
+            inside = (comp >= lo) & (comp <= hi) if (lo, hi) != (0, 255) else None
+            if inside is not None:
+                hit = inside if hit is None else hit & inside
+        mask |= True if hit is None else hit
+    return mask
+
+def color_key(img: Image.Image, colors=((0, 0, 0),), tolerance: int = 0) -> Image.Image:
+    """Make every pixel whose RGB is within ``tolerance`` of one of ``colors`` fully transparent."""
+    arr = np.array(img.convert('RGBA'))
+    arr[key_mask(arr[..., :3], colors, tolerance)] = 0
+    return Image.fromarray(arr, 'RGBA')
+
+def fill_background(img: Image.Image, color=(0, 0, 0)) -> Image.Image:
+    """Composite onto an opaque ``color`` background and drop the alpha channel."""
+    img = img.convert('RGBA')
+    base = Image.new('RGBA', img.size, tuple(color[:3]) + (255,))
+    return Image.alpha_composite(base, img).convert('RGB')
+
+OPERATIONS = {
+    'crop_to_content': crop_to_content,
+    'scale_content': scale_content,
+    'rotate': rotate,
+    'flip': flip,
+    'color_key': color_key,
+    'fill_background': fill_background,
+}
+
+def apply_chain(img: Image.Image, ops) -> Image.Image:
+    for name, options in ops:
+        img = OPERATIONS[name](img, **options)
+    return img
+
+def transform_asset(src: str, dst: str, ops) -> str:
+    """Decode ``src`` once, apply ``ops``, encode once to ``dst``; returns the output's SHA-256."""
+    with Image.open(src) as img:
+        img.load()
+        out = apply_chain(img, ops)
+    fmt = Image.registered_extensions()[os.path.splitext(dst)[1].lower()]
+    tmp = dst + '.tmp'
+    out.save(tmp, fmt)
+    os.replace(tmp, dst)
+    return file_sha256(dst)
+
+def planned_assets(weeks=None):
+    """Yield (asset path relative to static/, ops) for the selected weeks."""
+    for week, jobs in sorted(WEEK_TRANSFORMS.items()):
+        if weeks and week not in weeks:
+            continue
+        for patterns, ops in jobs:
+            for pattern in patterns:
+                for path in sorted(glob.glob(os.path.join(STATIC, pattern))):
+                    yield os.path.relpath(path, STATIC).replace(os.sep, '/'), ops
+
+def run_transforms(todo, jobs):
+    """Yield (asset, spec, output SHA-256 or the exception) per planned transform."""
+    if jobs > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [(asset, spec, pool.submit(transform_asset, original, path, ops))
+                       for asset, original, path, ops, spec in todo]
+            for asset, spec, future in futures:
+                try:
+                    yield asset, spec, future.result()
+                except Exception as e:
+                    yield asset, spec, e
+        return
+    for asset, original, path, ops, spec in todo:
+        try:
+            yield asset, spec, transform_asset(original, path, ops)
+        except Exception as e:
+            yield asset, spec, e
+
+def load_state() -> dict:
+    if os.path.isfile(STATE):
+        with open(STATE, encoding='utf-8') as fh:
+            return json.load(fh)
+    return {}
+
+def save_state(state: dict):
+    os.makedirs(ORIGINALS, exist_ok=True)
+    tmp = STATE + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(state, fh, indent=1, sort_keys=True)
+    os.replace(tmp, STATE)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--week', type=int, action='append', help="only this week (repeatable)")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="worker processes (0 = all cores)")
+    parser.add_argument('--force', action='store_true', help="re-run assets that are already up to date")
+    parser.add_argument('--dry-run', action='store_true', help="list what would be transformed")
+    parser.add_argument('--adopt', action='store_true',
+                        help="record the current files as already transformed (assets the old "
+                             "per-week scripts processed in place) instead of transforming them")
+    args = parser.parse_args(argv)
+
+    state = load_state()
+    todo, failed = [], []
+    for asset, ops in planned_assets(args.week):
+        path = os.path.join(STATIC, asset)
+        original = os.path.join(ORIGINALS, asset)
+        spec = json.loads(json.dumps(ops))
+        entry = state.get(asset)
+        current = file_sha256(path)
+        ours = entry is not None and entry['output'] == current
+        if args.adopt:
+            if not ours:
+                print(f"[ADOPTED] {asset}")
+                state[asset] = {'output': current, 'ops': spec}
+            continue
+        if ours and entry['ops'] == spec and not args.force:
+            print(f"[UP TO DATE] {asset}")
+            continue
+        if ours and not os.path.isfile(original):
+            print(f"  [ERROR] {asset}: adopted without an original; put the untransformed file at {original}")
+            failed.append(asset)
+            continue
+        print(f"[TRANSFORM] {asset}: " + " → ".join(name for name, _ in ops))
+        if args.dry_run:
+            continue
+        if not ours:
+            # First run, or the file was regenerated since: it is the new original
+            os.makedirs(os.path.dirname(original), exist_ok=True)
+            shutil.copy2(path, original)
+        todo.append((asset, original, path, ops, spec))
+
+    for asset, spec, result in run_transforms(todo, args.jobs or os.cpu_count() or 1):
+        if isinstance(result, Exception):
+            print(f"  [ERROR] {asset}: {result}")
+            failed.append(asset)
+        else:
+            state[asset] = {'output': result, 'ops': spec}
+
+    if not args.dry_run:
+        save_state(state)
+    print(f"{len(todo) - len(failed)} transformed, {len(failed)} failed")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())